@@ -0,0 +1,489 @@
+"""
+Log de ações segmentado
+As ações são gravadas em arquivos NDJSON append-only que giram por tamanho ou
+por dia. Cada segmento guarda um índice esparso de timestamps (blocos de N
+entradas com o menor e o maior timestamp) e índices secundários por ação e por
+usuário, mantidos a cada gravação. Consultas por período e filtros abrem só os
+trechos necessários. A retenção é por idade e/ou tamanho total.
+"""
+
+import base64
+import heapq
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import json_codec
+from storage import atomic_write, read_json_view
+
+SEGMENT_RE = re.compile(r"^(\d{8})-(\d{6})\.ndjson$")
+
+# Ordem das consultas paginadas: (timestamp, id), da mais nova para a mais antiga
+SortKey = Tuple[str, str]
+
+
+def sort_key(entry: Dict) -> SortKey:
+    return entry.get("timestamp", "") or "", str(entry.get("id") or "")
+
+
+def parse_line(line: bytes) -> Optional[Dict]:
+    """Entrada de uma linha NDJSON; None se a linha está corrompida"""
+    try:
+        entry = json_codec.loads(line)
+    except json_codec.DecodeError:
+        return None
+    return entry if isinstance(entry, dict) else None
+
+
+def matches(entry: Dict, action: Optional[str] = None, user_id: Optional[str] = None,
+            since: Optional[str] = None, until: Optional[str] = None,
+            before: Optional[SortKey] = None) -> bool:
+    """Filtros de query aplicados a uma entrada (since inclusivo, until e before exclusivos)"""
+    timestamp = entry.get("timestamp", "")
+    if action is not None and entry.get("action") != action:
+        return False
+    if user_id is not None and str(entry.get("user_id")) != user_id:
+        return False
+    if since is not None and timestamp < since:
+        return False
+    if until is not None and timestamp >= until:
+        return False
+    return before is None or sort_key(entry) < before
+
+
+def encode_cursor(entry: Dict) -> str:
+    """Cursor opaco apontando para logo depois da entrada"""
+    timestamp, entry_id = sort_key(entry)
+    raw = json_codec.dumps([timestamp, entry_id])
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip("=")
+
+
+def decode_cursor(cursor: str) -> SortKey:
+    """
+    Raises:
+        ValueError: Cursor inválido
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, entry_id = json_codec.loads(raw)
+    except Exception:
+        raise ValueError("Cursor inválido")
+    if not isinstance(timestamp, str) or not isinstance(entry_id, str):
+        raise ValueError("Cursor inválido")
+    return timestamp, entry_id
+
+
+class Segment:
+    """
+    Metadados de um segmento
+
+    blocks: [offset, menor timestamp, maior timestamp] a cada index_every entradas
+    by_action / by_user: offsets das linhas de cada ação / usuário
+    """
+
+    __slots__ = ("path", "day", "number", "min_ts", "max_ts", "count", "size",
+                 "blocks", "block_offsets", "by_action", "by_user")
+
+    def __init__(self, path: str, day: str, number: int):
+        self.path = path
+        self.day = day
+        self.number = number
+        self.min_ts: Optional[str] = None
+        self.max_ts: Optional[str] = None
+        self.count = 0
+        self.size = 0
+        self.blocks: List[List] = []
+        self.block_offsets = array('Q')
+        self.by_action: Dict[str, array] = {}
+        self.by_user: Dict[str, array] = {}
+
+    @property
+    def index_path(self) -> str:
+        return self.path[:-len(".ndjson")] + ".idx"
+
+    def add(self, entry: Dict, offset: int, length: int, index_every: int) -> None:
+        timestamp = entry.get("timestamp", "") or ""
+        if self.count % index_every == 0:
+            self.blocks.append([offset, timestamp, timestamp])
+            self.block_offsets.append(offset)
+        else:
+            block = self.blocks[-1]
+            if timestamp < block[1]:
+                block[1] = timestamp
+            if timestamp > block[2]:
+                block[2] = timestamp
+        if self.min_ts is None or timestamp < self.min_ts:
+            self.min_ts = timestamp
+        if self.max_ts is None or timestamp > self.max_ts:
+            self.max_ts = timestamp
+
+        action = entry.get("action")
+        if action:
+            self.by_action.setdefault(str(action), array('Q')).append(offset)
+        user_id = entry.get("user_id")
+        if user_id is not None:
+            self.by_user.setdefault(str(user_id), array('Q')).append(offset)
+
+        self.count += 1
+        self.size = offset + length
+
+    def block_end(self, i: int, size: int) -> int:
+        return self.blocks[i + 1][0] if i + 1 < len(self.blocks) else size
+
+    def block_of(self, offset: int) -> List:
+        return self.blocks[bisect_right(self.block_offsets, offset) - 1]
+
+    def overlaps(self, since: Optional[str], until: Optional[str], inclusive: bool = False) -> bool:
+        if self.count == 0:
+            return False
+        return _overlaps(self.min_ts, self.max_ts, since, until, inclusive)
+
+    def to_index(self) -> Dict[str, Any]:
+        return {
+            "min_ts": self.min_ts,
+            "max_ts": self.max_ts,
+            "count": self.count,
+            "bytes": self.size,
+            "blocos": self.blocks,
+            "por_acao": {k: v.tolist() for k, v in self.by_action.items()},
+            "por_usuario": {k: v.tolist() for k, v in self.by_user.items()}
+        }
+
+
+def _overlaps(low: str, high: str, since: Optional[str], until: Optional[str], inclusive: bool) -> bool:
+    if since is not None and high < since:
+        return False
+    if until is not None and (low > until if inclusive else low >= until):
+        return False
+    return True
+
+
+class SegmentedActionLog:
+    """
+    Log de ações em segmentos NDJSON
+
+    Args:
+        directory: Pasta dos segmentos
+        segment_max_bytes: Gira o segmento ao passar desse tamanho
+        index_every: Um bloco no índice esparso a cada N entradas
+        retention_days: Remove segmentos mais antigos que isso (0 = sem limite)
+        retention_bytes: Remove os segmentos mais antigos acima desse total (0 = sem limite)
+        legacy_path: action_logs.json antigo, importado na primeira execução
+    """
+
+    def __init__(self, directory: str, segment_max_bytes: int = 8 * 1024 * 1024, index_every: int = 256,
+                 retention_days: int = 0, retention_bytes: int = 0, legacy_path: Optional[str] = None):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.index_every = max(index_every, 1)
+        self.retention_days = retention_days
+        self.retention_bytes = retention_bytes
+
+        self._lock = threading.RLock()
+        self._segments: List[Segment] = []
+        self._file = None
+        self.appended = 0
+        self.rotations = 0
+        self.removed = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+        if not self._segments and legacy_path:
+            self._import_legacy(legacy_path)
+        self._apply_retention()
+
+    # Carga
+    def _load(self) -> None:
+        names = sorted(name for name in os.listdir(self.directory) if SEGMENT_RE.match(name))
+        for i, name in enumerate(names):
+            day, number = SEGMENT_RE.match(name).groups()
+            segment = Segment(os.path.join(self.directory, name), day, int(number))
+            active = i == len(names) - 1
+            if active or not self._load_index(segment):
+                self._rebuild(segment, truncate=active)
+                if not active:
+                    self._write_index(segment)
+            self._segments.append(segment)
+
+        if self._segments:
+            self._file = open(self._segments[-1].path, 'ab')
+
+    def _load_index(self, segment: Segment) -> bool:
+        index = read_json_view(segment.index_path)
+        try:
+            if "blocos" not in index or index.get("bytes") != os.path.getsize(segment.path):
+                return False
+        except FileNotFoundError:
+            return False
+        segment.min_ts = index.get("min_ts")
+        segment.max_ts = index.get("max_ts")
+        segment.count = index.get("count", 0)
+        segment.size = index["bytes"]
+        segment.blocks = [list(block) for block in index["blocos"]]
+        segment.block_offsets = array('Q', (block[0] for block in segment.blocks))
+        segment.by_action = {k: array('Q', v) for k, v in index.get("por_acao", {}).items()}
+        segment.by_user = {k: array('Q', v) for k, v in index.get("por_usuario", {}).items()}
+        return True
+
+    def _rebuild(self, segment: Segment, truncate: bool) -> None:
+        """Reconstrói os índices lendo o segmento (e corta uma linha incompleta no fim)"""
+        offset = 0
+        with open(segment.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                entry = parse_line(line)
+                if entry is None:
+                    offset += len(line)
+                    continue
+                segment.add(entry, offset, len(line), self.index_every)
+                offset += len(line)
+        segment.size = offset
+        if truncate and os.path.getsize(segment.path) != offset:
+            with open(segment.path, 'r+b') as f:
+                f.truncate(offset)
+
+    def _write_index(self, segment: Segment) -> None:
+        try:
+            atomic_write(segment.index_path, json_codec.dumps(segment.to_index()))
+        except OSError as e:
+            print(f"[Logs] Erro ao gravar índice de {segment.path}: {e}")
+
+    def _import_legacy(self, legacy_path: str) -> None:
+        logs = read_json_view(legacy_path).get("logs", [])
+        if logs:
+            self.append(sorted(logs, key=lambda x: x.get("timestamp", "")))
+            print(f"[Logs] {len(logs)} ações importadas de {legacy_path}")
+
+    # Escrita
+    def _open_segment(self, day: str) -> Segment:
+        number = self._segments[-1].number + 1 if self._segments else 1
+        path = os.path.join(self.directory, f"{day}-{number:06d}.ndjson")
+        segment = Segment(path, day, number)
+        if self._file is not None:
+            self._file.close()
+            self._write_index(self._segments[-1])
+            self.rotations += 1
+        self._file = open(path, 'ab')
+        self._segments.append(segment)
+        return segment
+
+    def append(self, entries: Iterable[Dict]) -> None:
+        """Grava as entradas no segmento atual, girando por dia ou tamanho"""
+        rotated = False
+        with self._lock:
+            for entry in entries:
+                timestamp = entry.get("timestamp", "") or ""
+                day = timestamp[:10].replace("-", "") or datetime.now(timezone.utc).strftime("%Y%m%d")
+                segment = self._segments[-1] if self._segments else None
+                if segment is None or segment.size >= self.segment_max_bytes or day > segment.day:
+                    segment = self._open_segment(day)
+                    rotated = True
+                line = json_codec.dumps(entry) + b"\n"
+                self._file.write(line)
+                segment.add(entry, segment.size, len(line), self.index_every)
+                self.appended += 1
+            if self._file is not None:
+                self._file.flush()
+            if rotated:
+                self._apply_retention()
+
+    # Retenção
+    def _apply_retention(self) -> None:
+        with self._lock:
+            cutoff = None
+            if self.retention_days > 0:
+                cutoff = (datetime.now(timezone.utc) - timedelta(days=self.retention_days)).isoformat()
+            total = sum(s.size for s in self._segments)
+
+            # Nunca remove o segmento ativo
+            while len(self._segments) > 1:
+                oldest = self._segments[0]
+                expired = cutoff is not None and oldest.max_ts is not None and oldest.max_ts < cutoff
+                oversized = self.retention_bytes > 0 and total > self.retention_bytes
+                if not (expired or oversized):
+                    break
+                for path in (oldest.path, oldest.index_path):
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+                total -= oldest.size
+                self._segments.pop(0)
+                self.removed += 1
+
+    # Leitura
+    def _snapshot(self) -> List[Tuple[Segment, int, int, int]]:
+        """
+        Segmentos como estavam no momento da chamada: (segmento, tamanho,
+        blocos, entradas), para ler sem segurar o lock durante o I/O
+        """
+        with self._lock:
+            return [(s, s.size, len(s.blocks), s.count) for s in self._segments]
+
+    def _read_range(self, segment: Segment, start: int, end: int) -> List[bytes]:
+        try:
+            with open(segment.path, 'rb') as f:
+                f.seek(start)
+                data = f.read(end - start)
+        except FileNotFoundError:
+            # Removido pela retenção durante a leitura
+            return []
+        return data.splitlines()
+
+    def _ranges(self, segment: Segment, size: int, nblocks: int, since: Optional[str],
+                until: Optional[str]) -> List[Tuple[int, int]]:
+        """Trechos contíguos do segmento cujos blocos podem ter entradas no período"""
+        ranges: List[Tuple[int, int]] = []
+        for i in range(nblocks):
+            offset, low, high = segment.blocks[i]
+            if not _overlaps(low, high, since, until, False):
+                continue
+            end = segment.block_end(i, size) if i + 1 < nblocks else size
+            if ranges and ranges[-1][1] == offset:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((offset, end))
+        return ranges
+
+    def scan(self, since: Optional[str] = None, until: Optional[str] = None) -> Iterator[Dict]:
+        """Entradas com since <= timestamp < until, em ordem de gravação"""
+        for segment, size, nblocks, _ in self._snapshot():
+            if not segment.overlaps(since, until):
+                continue
+            for start, end in self._ranges(segment, size, nblocks, since, until):
+                for line in self._read_range(segment, start, end):
+                    # Linhas corrompidas ficam dentro dos blocos; _rebuild também as pula
+                    entry = parse_line(line)
+                    if entry is None:
+                        continue
+                    timestamp = entry.get("timestamp", "")
+                    if since is not None and timestamp < since:
+                        continue
+                    if until is not None and timestamp >= until:
+                        continue
+                    yield entry
+
+    def query(self, action: Optional[str] = None, user_id: Optional[str] = None,
+              since: Optional[str] = None, until: Optional[str] = None,
+              before: Optional[SortKey] = None, limit: int = 100) -> List[Dict]:
+        """
+        Página de entradas em ordem decrescente de (timestamp, id)
+
+        Args:
+            action: Filtra pela ação (índice secundário)
+            user_id: Filtra pelo usuário (índice secundário)
+            since: Timestamp mínimo (inclusivo)
+            until: Timestamp máximo (exclusivo)
+            before: Só entradas anteriores a essa chave (cursor da página anterior)
+            limit: Tamanho da página
+        """
+        if limit <= 0:
+            return []
+        # Limite superior de timestamp para poda de blocos/segmentos
+        upper, inclusive = until, False
+        if before is not None and (upper is None or before[0] < upper):
+            upper, inclusive = before[0], True
+
+        # min-heap com as `limit` maiores chaves vistas até agora
+        heap: List[Tuple[SortKey, int, Dict]] = []
+        counter = 0
+
+        def floor() -> Optional[str]:
+            return heap[0][0][0] if len(heap) >= limit else None
+
+        def consider(entry: Dict) -> None:
+            nonlocal counter
+            if not matches(entry, action, user_id, since, until, before):
+                return
+            key = sort_key(entry)
+            counter += 1
+            item = (key, counter, entry)
+            if len(heap) < limit:
+                heapq.heappush(heap, item)
+            elif key > heap[0][0]:
+                heapq.heapreplace(heap, item)
+
+        for segment, size, nblocks, count in reversed(self._snapshot()):
+            if not segment.overlaps(since, upper, inclusive):
+                continue
+            if floor() is not None and segment.max_ts < floor():
+                continue
+
+            if action is not None or user_id is not None:
+                offsets = self._postings(segment, action, user_id, count)
+                self._consider_offsets(segment, size, offsets, since, upper, inclusive, floor, consider)
+            else:
+                for i in range(nblocks - 1, -1, -1):
+                    offset, low, high = segment.blocks[i]
+                    if not _overlaps(low, high, since, upper, inclusive):
+                        continue
+                    if floor() is not None and high < floor():
+                        continue
+                    end = segment.block_end(i, size) if i + 1 < nblocks else size
+                    for line in self._read_range(segment, offset, end):
+                        entry = parse_line(line)
+                        if entry is not None:
+                            consider(entry)
+
+        return [entry for _, _, entry in sorted(heap, reverse=True)]
+
+    def _postings(self, segment: Segment, action: Optional[str], user_id: Optional[str], count: int) -> List[int]:
+        """Offsets das entradas que batem com os filtros (interseção dos índices)"""
+        with self._lock:
+            lists = []
+            if action is not None:
+                lists.append(segment.by_action.get(action, array('Q')).tolist())
+            if user_id is not None:
+                lists.append(segment.by_user.get(user_id, array('Q')).tolist())
+        if len(lists) == 1:
+            return lists[0]
+        smaller, larger = sorted(lists, key=len)
+        members = set(larger)
+        return [offset for offset in smaller if offset in members]
+
+    def _consider_offsets(self, segment: Segment, size: int, offsets: List[int], since: Optional[str],
+                          upper: Optional[str], inclusive: bool, floor, consider) -> None:
+        if not offsets:
+            return
+        try:
+            f = open(segment.path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            for offset in reversed(offsets):
+                if offset >= size:
+                    continue
+                _, low, high = segment.block_of(offset)
+                if not _overlaps(low, high, since, upper, inclusive):
+                    continue
+                if floor() is not None and high < floor():
+                    continue
+                f.seek(offset)
+                entry = parse_line(f.readline())
+                if entry is not None:
+                    consider(entry)
+
+    def recent(self, limit: int = 100) -> List[Dict]:
+        return self.query(limit=limit)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "segmentos": len(self._segments),
+                "bytes": sum(s.size for s in self._segments),
+                "entradas": sum(s.count for s in self._segments),
+                "gravadas": self.appended,
+                "rotacoes": self.rotations,
+                "removidos": self.removed
+            }
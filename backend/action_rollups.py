@@ -0,0 +1,253 @@
+"""
+Agregados incrementais dos logs de ações
+Contadores por hora (total, por ação, por usuário e valor de cupons usados)
+atualizados a cada lote gravado pelo pipeline de logs e persistidos junto do
+log. As análises somam buckets em vez de reler cada evento.
+"""
+
+import os
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from storage import read_json_view, storage_writer
+
+HOUR_FORMAT = "%Y-%m-%dT%H"
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+class ActionRollups:
+    """
+    Buckets horários dos logs de ações
+
+    Args:
+        path: Arquivo onde os buckets são persistidos
+        save_interval: Grava a cada X segundos se houver novidades
+        retention_days: Descarta buckets mais antigos que isso (0 = sem limite)
+    """
+
+    def __init__(self, path: str, save_interval: float = 30.0, retention_days: int = 0):
+        self.path = path
+        self.save_interval = save_interval
+        self.retention_days = retention_days
+
+        self._lock = threading.RLock()
+        self._cond = threading.Condition(self._lock)
+        self._hours: Dict[str, Dict[str, Any]] = {}
+        # Chave (timestamp, id) do último evento agregado, para retomar do log
+        self._watermark: Tuple[str, str] = ("", "")
+        self._dirty = False
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.events = 0
+        self.saves = 0
+
+        stored = read_json_view(path)
+        for hour, bucket in stored.get("horas", {}).items():
+            self._hours[hour] = {
+                "total": bucket.get("total", 0),
+                "acoes": Counter(bucket.get("acoes", {})),
+                "usuarios": Counter(bucket.get("usuarios", {})),
+                "cupons": bucket.get("cupons", 0.0)
+            }
+        watermark = stored.get("ultimo")
+        if watermark:
+            self._watermark = (watermark[0], watermark[1])
+
+    # Atualização
+    def add(self, entries: Iterable[Dict]) -> None:
+        """Agrega um lote de entradas recém gravadas no log"""
+        with self._lock:
+            for entry in entries:
+                timestamp = entry.get("timestamp", "") or ""
+                hour = timestamp[:13]
+                if len(hour) != 13:
+                    continue
+                bucket = self._hours.get(hour)
+                if bucket is None:
+                    bucket = self._hours[hour] = {"total": 0, "acoes": Counter(), "usuarios": Counter(), "cupons": 0.0}
+                bucket["total"] += 1
+                action = entry.get("action", "")
+                bucket["acoes"][action] += 1
+                if entry.get("user_id"):
+                    bucket["usuarios"][str(entry["user_id"])] += 1
+                if action == "coupon_used":
+                    bucket["cupons"] += _to_float((entry.get("details") or {}).get("valor"))
+
+                key = (timestamp, str(entry.get("id") or ""))
+                if key > self._watermark:
+                    self._watermark = key
+                self.events += 1
+            self._dirty = True
+            self._ensure_thread()
+
+    def catch_up(self, entries: Iterable[Dict]) -> int:
+        """
+        Agrega os eventos gravados depois do último salvamento (ex.: após uma
+        queda). Recebe o log a partir do timestamp do watermark.
+
+        Returns:
+            Número de eventos reaplicados
+        """
+        watermark = self._watermark
+        pending = [e for e in entries if (e.get("timestamp", "") or "", str(e.get("id") or "")) > watermark]
+        if pending:
+            self.add(pending)
+            print(f"[Analytics] {len(pending)} ações reagregadas a partir do log")
+        return len(pending)
+
+    @property
+    def watermark_timestamp(self) -> Optional[str]:
+        return self._watermark[0] or None
+
+    # Consulta
+    def window(self, start: datetime, end: datetime, top_users: int = 50) -> Dict[str, Any]:
+        """
+        Soma os buckets entre start e end (inclusive, granularidade de hora)
+        em tempo proporcional ao número de horas da janela
+        """
+        daily: Dict[str, int] = {}
+        coupons_daily: Dict[str, float] = {}
+        actions: Counter = Counter()
+        users: Counter = Counter()
+
+        hour = start.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        end = end.astimezone(timezone.utc)
+        with self._lock:
+            while hour <= end:
+                bucket = self._hours.get(hour.strftime(HOUR_FORMAT))
+                if bucket is not None:
+                    day = hour.strftime("%Y-%m-%d")
+                    daily[day] = daily.get(day, 0) + bucket["total"]
+                    if bucket["cupons"]:
+                        coupons_daily[day] = coupons_daily.get(day, 0.0) + bucket["cupons"]
+                    actions.update(bucket["acoes"])
+                    users.update(bucket["usuarios"])
+                hour += timedelta(hours=1)
+
+        return {
+            "atividade_diaria": daily,
+            "eventos_mais_comuns": dict(actions.most_common()),
+            "usuarios_mais_ativos": dict(users.most_common(top_users)),
+            "cupons_diarios": coupons_daily
+        }
+
+    # Persistência
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            if self.retention_days > 0:
+                cutoff = (datetime.now(timezone.utc) - timedelta(days=self.retention_days)).strftime(HOUR_FORMAT)
+                for hour in [h for h in self._hours if h < cutoff]:
+                    del self._hours[hour]
+            document = {
+                "ultimo": list(self._watermark),
+                "horas": {
+                    hour: {
+                        "total": bucket["total"],
+                        "acoes": dict(bucket["acoes"]),
+                        "usuarios": dict(bucket["usuarios"]),
+                        "cupons": round(bucket["cupons"], 2)
+                    }
+                    for hour, bucket in self._hours.items()
+                }
+            }
+            self._dirty = False
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if storage_writer.write_now(self.path, document, compact=True) is None:
+            with self._lock:
+                self._dirty = True
+        else:
+            self.saves += 1
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None and not self._closed:
+            self._thread = threading.Thread(target=self._run, name="action-rollups", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        with self._cond:
+            while not self._closed:
+                self._cond.wait(self.save_interval)
+                if self._closed:
+                    break
+                try:
+                    self.save()
+                except Exception as e:
+                    print(f"[Analytics] Erro ao salvar agregados: {e}")
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self.save()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "buckets": len(self._hours),
+            "eventos": self.events,
+            "salvamentos": self.saves,
+            "ultimo": self._watermark[0] or None
+        }
+
+
+class RevenueIndex:
+    """
+    Receita diária a partir do historico.json do bot
+
+    Recalculada só quando o arquivo muda (versão do storage_writer); registros
+    com status "Concluído" contam como depósito (tipo deposito) ou venda.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._version = None
+        self._daily: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+
+    def _rebuild(self) -> None:
+        daily: Dict[str, Dict[str, float]] = {}
+        for registros in read_json_view(self.path).values():
+            if not isinstance(registros, list):
+                continue
+            for registro in registros:
+                if not isinstance(registro, dict) or registro.get("status") != "Concluído":
+                    continue
+                day = self._day(registro.get("timestamp"))
+                if day is None:
+                    continue
+                kind = "depositos" if registro.get("tipo") == "deposito" else "vendas"
+                bucket = daily.setdefault(day, {"depositos": 0.0, "vendas": 0.0})
+                bucket[kind] += _to_float(registro.get("valor"))
+        self._daily = daily
+        self.rebuilds += 1
+
+    @staticmethod
+    def _day(timestamp: Any) -> Optional[str]:
+        # O bot grava Date.now() (ms); aceita também ISO 8601
+        try:
+            if isinstance(timestamp, (int, float)):
+                return datetime.fromtimestamp(timestamp / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+            if isinstance(timestamp, str):
+                return datetime.fromisoformat(timestamp).astimezone(timezone.utc).strftime("%Y-%m-%d")
+        except (ValueError, OverflowError, OSError):
+            pass
+        return None
+
+    def daily(self, days: List[str]) -> Dict[str, Dict[str, float]]:
+        """Receita dos dias pedidos (somente dias com movimento)"""
+        with self._lock:
+            version = storage_writer.version(self.path)
+            if version != self._version:
+                self._rebuild()
+                self._version = version
+            return {day: dict(self._daily[day]) for day in days if day in self._daily}
@@ -0,0 +1,214 @@
+"""
+Cache em disco de arquivos ZIP pré-montados
+A chave do artefato é um hash do (nome, caminho, tamanho, mtime) de cada
+arquivo de entrada e do conteúdo dos textos gerados: enquanto nada muda, cada
+download só envia o arquivo pronto. Uma tarefa em segundo plano confere as
+entradas periodicamente e remonta o ZIP quando alguma muda.
+O envio responde ETag/If-None-Match (304) e Range (206) de um único intervalo.
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+from async_io import run_blocking
+from single_flight import single_flight
+from zip_stream import write_zip
+
+Inputs = Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]
+
+# Artefatos mantidos além do atual (downloads em andamento do anterior continuam válidos)
+KEEP_PREVIOUS = 1
+RANGE_CHUNK = 64 * 1024
+
+
+class ArchiveCache:
+    """
+    Args:
+        directory: Diretório dos artefatos
+        name: Prefixo dos arquivos do artefato (um cache por nome)
+        inputs: Função síncrona que retorna (arquivos, textos) como em stream_zip
+        check_interval: Segundos entre conferências em segundo plano (0 desliga)
+        compresslevel: Nível do deflate (None = padrão do zlib)
+    """
+
+    def __init__(self, directory: str, name: str, inputs: Callable[[], Inputs], check_interval: float = 60.0,
+                 compresslevel: Optional[int] = None):
+        self.directory = directory
+        self.name = name
+        self.inputs = inputs
+        self.check_interval = check_interval
+        self.compresslevel = compresslevel
+        self._task: Optional[asyncio.Task] = None
+        self._current: Optional[Tuple[str, str]] = None
+        self.hits = 0
+        self.builds = 0
+        self.last_build_s: Optional[float] = None
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{self.name}-{key}.zip")
+
+    def _fingerprint(self) -> Tuple[str, Inputs]:
+        files, texts = self.inputs()
+        digest = hashlib.sha256()
+        for arcname, path in files:
+            try:
+                st = os.stat(path)
+                digest.update(f"{arcname}\0{path}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+            except FileNotFoundError:
+                digest.update(f"{arcname}\0{path}\0-\n".encode())
+        for arcname, content in texts:
+            data = content.encode() if isinstance(content, str) else content
+            digest.update(f"{arcname}\0{hashlib.sha256(data).hexdigest()}\n".encode())
+        return digest.hexdigest()[:32], (files, texts)
+
+    def _build(self, key: str, inputs: Inputs) -> str:
+        path = self._path(key)
+        if os.path.exists(path):
+            return path
+        started = time.monotonic()
+        write_zip(path, *inputs, compresslevel=self.compresslevel)
+        self.builds += 1
+        self.last_build_s = time.monotonic() - started
+        self._remove_old(path)
+        print(f"[Arquivo] {os.path.basename(path)} montado em {self.last_build_s:.2f}s")
+        return path
+
+    def _remove_old(self, keep: str) -> None:
+        artifacts = []
+        for entry in os.listdir(self.directory):
+            path = os.path.join(self.directory, entry)
+            if entry.startswith(f"{self.name}-") and entry.endswith(".zip") and path != keep:
+                artifacts.append((os.path.getmtime(path), path))
+        for _, path in sorted(artifacts, reverse=True)[KEEP_PREVIOUS:]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    async def get(self) -> Tuple[str, str]:
+        """
+        Caminho e ETag do artefato das entradas atuais
+
+        Monta o ZIP (uma vez, mesmo com chamadas simultâneas) se as entradas
+        mudaram desde a última montagem.
+        """
+        key, inputs = await run_blocking(self._fingerprint)
+        path = self._path(key)
+        if self._current is not None and self._current[0] == key and os.path.exists(path):
+            self.hits += 1
+        else:
+            await single_flight.do(("archive", self.name, key), self._build, key, inputs, ttl=0, thread=True)
+            self._current = (key, path)
+        return path, f'"{key}"'
+
+    # Tarefa em segundo plano
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.get()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Arquivo] Erro ao montar {self.name}: {e}")
+            await asyncio.sleep(self.check_interval)
+
+    def start(self) -> Optional[asyncio.Task]:
+        if self.check_interval <= 0:
+            return None
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self.run())
+        return self._task
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "atual": os.path.basename(self._current[1]) if self._current else None,
+            "acertos": self.hits,
+            "montagens": self.builds,
+            "ultima_montagem_s": round(self.last_build_s, 2) if self.last_build_s is not None else None
+        }
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Intervalo (início, fim inclusivo) de um cabeçalho Range de um só intervalo
+
+    Returns:
+        None se o cabeçalho deve ser ignorado (inválido ou vários intervalos)
+
+    Raises:
+        ValueError: Intervalo fora do arquivo (416)
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    start_text, sep, end_text = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        start = int(start_text) if start_text else None
+        end = int(end_text) if end_text else None
+    except ValueError:
+        return None
+    if start is None:
+        # bytes=-N: os últimos N bytes
+        if end is None:
+            return None
+        if end == 0 or size == 0:
+            raise ValueError("Intervalo vazio")
+        return max(size - end, 0), size - 1
+    if end is not None and start > end:
+        return None
+    if start >= size:
+        raise ValueError("Intervalo fora do arquivo")
+    return start, size - 1 if end is None else min(end, size - 1)
+
+
+def _read_range(path: str, start: int, length: int) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(RANGE_CHUNK, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def file_response(request: Request, path: str, etag: str, media_type: str,
+                  headers: Optional[Dict[str, str]] = None) -> Response:
+    """Resposta com o arquivo respeitando If-None-Match, Range e If-Range"""
+    base_headers = {**(headers or {}), "ETag": etag, "Accept-Ranges": "bytes"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    st = os.stat(path)
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range.strip() == etag):
+        try:
+            byte_range = _parse_range(range_header, st.st_size)
+        except ValueError:
+            return Response(status_code=416, headers={**base_headers, "Content-Range": f"bytes */{st.st_size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            length = end - start + 1
+            return StreamingResponse(
+                _read_range(path, start, length),
+                status_code=206,
+                media_type=media_type,
+                headers={**base_headers, "Content-Range": f"bytes {start}-{end}/{st.st_size}",
+                         "Content-Length": str(length)}
+            )
+    return FileResponse(path, media_type=media_type, headers=base_headers, stat_result=st)
@@ -0,0 +1,56 @@
+"""
+Camada de I/O assíncrono do servidor
+Nada que bloqueia roda direto no event loop:
+- requisições HTTP de saída usam um httpx.AsyncClient compartilhado
+- disco e APIs síncronas (ex.: GratianManager) rodam em um pool de threads limitado
+"""
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+
+BLOCKING_THREADS = int(os.getenv("BLOCKING_IO_THREADS", "8"))
+HTTP_TIMEOUT = float(os.getenv("OUTBOUND_HTTP_TIMEOUT_S", "10"))
+
+_blocking_pool = ThreadPoolExecutor(max_workers=max(BLOCKING_THREADS, 1), thread_name_prefix="blocking-io")
+_http_client: Optional[httpx.AsyncClient] = None
+_stats = {"bloqueantes": 0, "em_andamento": 0}
+
+
+async def run_blocking(fn: Callable, *args, **kwargs) -> Any:
+    """Executa uma chamada bloqueante (disco, API síncrona) no pool de threads"""
+    _stats["bloqueantes"] += 1
+    _stats["em_andamento"] += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_blocking_pool, functools.partial(fn, *args, **kwargs))
+    finally:
+        _stats["em_andamento"] -= 1
+
+
+def http_client() -> httpx.AsyncClient:
+    """Cliente HTTP de saída (webhooks, APIs externas) com keep-alive"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(timeout=HTTP_TIMEOUT, follow_redirects=True)
+    return _http_client
+
+
+async def aclose() -> None:
+    """Fecha o cliente HTTP (shutdown do servidor)"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "threads_bloqueantes": max(BLOCKING_THREADS, 1),
+        "tarefas_bloqueantes": _stats["bloqueantes"],
+        "em_andamento": _stats["em_andamento"]
+    }
@@ -0,0 +1,97 @@
+"""
+Agendamento de backups
+Uma tarefa em segundo plano segue o system_config (auto_backup e
+backup_intervalo_horas) e dispara o backup no pool de threads quando o
+intervalo desde o último backup vence. O último backup vem do índice do
+repositório, então o agendamento sobrevive a reinícios do painel.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+
+from async_io import run_blocking
+
+
+class BackupScheduler:
+    """
+    Args:
+        backup: Função síncrona que cria o backup (e aplica a retenção)
+        config_provider: Retorna o system_config atual
+        last_backup: Função síncrona com o timestamp do último backup (None se nenhum)
+        check_interval: Máximo de segundos entre conferências da configuração
+    """
+
+    def __init__(self, backup: Callable[[], Any], config_provider: Callable[[], Dict],
+                 last_backup: Callable[[], Optional[float]], check_interval: float = 60.0):
+        self.backup = backup
+        self.config_provider = config_provider
+        self.last_backup = last_backup
+        self.check_interval = max(check_interval, 1.0)
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.next_at: Optional[float] = None
+        self.runs = 0
+        self.failures = 0
+        self.last_duration: Optional[float] = None
+
+    async def _tick(self) -> float:
+        """Faz o backup se venceu; retorna quantos segundos dormir"""
+        config = await run_blocking(self.config_provider)
+        if not config.get("auto_backup", False):
+            self.next_at = None
+            return self.check_interval
+        interval = max(int(config.get("backup_intervalo_horas") or 24), 1) * 3600
+        last = await run_blocking(self.last_backup)
+        due = (last or 0) + interval
+        if time.time() >= due:
+            started = time.monotonic()
+            result = await run_blocking(self.backup)
+            self.last_duration = time.monotonic() - started
+            self.runs += 1
+            if not result:
+                self.failures += 1
+                # Falhou: tenta de novo na próxima conferência, não no próximo intervalo
+                self.next_at = time.time() + self.check_interval
+                return self.check_interval
+            due = time.time() + interval
+        self.next_at = due
+        return min(max(due - time.time(), 1.0), self.check_interval)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                delay = await self._tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Backup] Erro no agendamento: {e}")
+                delay = self.check_interval
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self.run())
+        return self._task
+
+    def reschedule(self) -> None:
+        """Reconfere agora (ex.: system_config alterado)"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def stats(self) -> Dict[str, Any]:
+        config = self.config_provider()
+        return {
+            "ativo": bool(config.get("auto_backup", False)),
+            "intervalo_horas": max(int(config.get("backup_intervalo_horas") or 24), 1),
+            "proximo_em": datetime.fromtimestamp(self.next_at, tz=timezone.utc).isoformat() if self.next_at else None,
+            "execucoes": self.runs,
+            "falhas": self.failures,
+            "ultima_duracao_s": round(self.last_duration, 2) if self.last_duration is not None else None
+        }
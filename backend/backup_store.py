@@ -0,0 +1,464 @@
+"""
+Backups incrementais com deduplicação por conteúdo
+Cada arquivo vira um blob comprimido nomeado pelo SHA-256 do seu conteúdo
+(blobs/ab/abcdef...); cada backup é só um manifesto pequeno que aponta para
+os blobs (snapshots/<nome>.json). Arquivos que não mudaram entre backups não
+ocupam espaço de novo, e qualquer backup pode ser reconstruído.
+
+Um índice (index.json) guarda o resumo de cada backup e o espaço ocupado, para
+a listagem não abrir manifestos nem varrer o diretório. A retenção apaga
+manifestos fora da política e a coleta de lixo remove blobs sem referência.
+
+Uso manual (com o painel parado):
+    python backup_store.py list
+    python backup_store.py restore <nome> <destino>
+    python backup_store.py gc
+"""
+
+import hashlib
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import json_codec
+from storage import atomic_write
+from zip_stream import compression_pool
+
+CHUNK_SIZE = 1024 * 1024
+# Arquivos alterados até este tempo antes do backup anterior não podem ser
+# julgados pelo mtime (resolução do sistema de arquivos): são relidos
+RACY_WINDOW_NS = 2_000_000_000
+SNAPSHOT_NAME = re.compile(r"^backup_[0-9A-Za-z_-]+$")
+# Temporários mais velhos que isso são sobras de um backup interrompido
+STALE_TMP_S = 3600
+
+
+def retained(summaries: Iterable[Dict[str, Any]], keep_last: int, keep_daily: int, keep_weekly: int) -> Set[str]:
+    """
+    Backups mantidos pela política de retenção
+
+    Mantém os keep_last mais recentes, o mais recente de cada um dos últimos
+    keep_daily dias e o mais recente de cada uma das últimas keep_weekly
+    semanas (com backup). O backup mais recente sempre é mantido.
+    """
+    ordered = sorted(summaries, key=lambda item: item["criado_em"], reverse=True)
+    keep = {item["nome"] for item in ordered[:max(keep_last, 1)]}
+    days: Set[Any] = set()
+    weeks: Set[Any] = set()
+    for item in ordered:
+        created = datetime.fromisoformat(item["criado_em"]).astimezone()
+        day = created.date()
+        week = day.isocalendar()[:2]
+        if day not in days and len(days) < keep_daily:
+            days.add(day)
+            keep.add(item["nome"])
+        if week not in weeks and len(weeks) < keep_weekly:
+            weeks.add(week)
+            keep.add(item["nome"])
+    return keep
+
+
+class BackupStore:
+    """
+    Args:
+        root: Diretório dos backups (blobs/ e snapshots/ ficam dentro dele)
+        source: Diretório copiado em cada backup
+        extensions: Extensões incluídas (busca recursiva)
+        compresslevel: Nível do zlib usado nos blobs
+    """
+
+    def __init__(self, root: str, source: str, extensions=(".json", ".ndjson"), compresslevel: int = 6):
+        self.root = root
+        self.source = source
+        self.extensions = tuple(extensions)
+        self.compresslevel = compresslevel
+        self.blob_dir = os.path.join(root, "blobs")
+        self.snapshot_dir = os.path.join(root, "snapshots")
+        self.index_path = os.path.join(root, "index.json")
+        self._lock = threading.RLock()
+        self._index: Optional[Dict[str, Any]] = None
+
+    # Blobs
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def _store_file(self, path: str) -> Dict[str, Any]:
+        """Lê o arquivo uma vez, calculando o hash e comprimindo para um temporário"""
+        os.makedirs(self.blob_dir, exist_ok=True)
+        hasher = hashlib.sha256()
+        compressor = zlib.compressobj(self.compresslevel)
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.blob_dir, prefix=".blob.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as out, open(path, 'rb') as f:
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    hasher.update(chunk)
+                    out.write(compressor.compress(chunk))
+                out.write(compressor.flush())
+                out.flush()
+                os.fsync(out.fileno())
+            digest = hasher.hexdigest()
+            blob_path = self._blob_path(digest)
+            if os.path.exists(blob_path):
+                os.unlink(tmp_path)
+                return {"sha256": digest, "tamanho": size, "novo": 0}
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            stored = os.path.getsize(tmp_path)
+            os.replace(tmp_path, blob_path)
+            return {"sha256": digest, "tamanho": size, "novo": stored}
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _store_if_exists(self, path: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self._store_file(path)
+        except FileNotFoundError:
+            return None
+
+    def _read_blob(self, digest: str, dest):
+        """Descomprime o blob em dest conferindo o hash"""
+        hasher = hashlib.sha256()
+        decompressor = zlib.decompressobj()
+        with open(self._blob_path(digest), 'rb') as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                data = decompressor.decompress(chunk)
+                hasher.update(data)
+                dest.write(data)
+        data = decompressor.flush()
+        hasher.update(data)
+        dest.write(data)
+        if hasher.hexdigest() != digest:
+            raise ValueError(f"Blob {digest} corrompido")
+
+    # Snapshots
+    def _snapshot_path(self, name: str) -> str:
+        if not SNAPSHOT_NAME.match(name):
+            raise ValueError(f"Nome de backup inválido: {name}")
+        return os.path.join(self.snapshot_dir, f"{name}.json")
+
+    def _source_files(self) -> List[str]:
+        files = []
+        for directory, dirnames, filenames in os.walk(self.source):
+            dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+            for filename in sorted(filenames):
+                if filename.endswith(self.extensions) and not filename.startswith("."):
+                    files.append(os.path.relpath(os.path.join(directory, filename), self.source))
+        return files
+
+    def _latest_manifest(self) -> Optional[Dict[str, Any]]:
+        names = self.snapshot_names()
+        return self.manifest(names[-1]) if names else None
+
+    def snapshot_names(self) -> List[str]:
+        """Nomes dos backups incrementais, do mais antigo para o mais recente"""
+        try:
+            entries = os.listdir(self.snapshot_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(entry[:-5] for entry in entries if entry.endswith(".json") and SNAPSHOT_NAME.match(entry[:-5]))
+
+    def manifest(self, name: str) -> Dict[str, Any]:
+        with open(self._snapshot_path(name), 'rb') as f:
+            return json_codec.loads(f.read())
+
+    # Índice
+    def _index_snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            if self._index is not None:
+                return self._index
+            try:
+                with open(self.index_path, 'rb') as f:
+                    index = json_codec.loads(f.read())
+                # Manifestos criados ou apagados por fora invalidam o índice
+                if set(index.get("snapshots", {})) == set(self.snapshot_names()):
+                    self._index = index
+                    return index
+            except (OSError, ValueError):
+                pass
+            self._index = self._build_index()
+            self._save_index()
+            return self._index
+
+    def _build_index(self) -> Dict[str, Any]:
+        snapshots = {}
+        manifest_bytes = 0
+        for name in self.snapshot_names():
+            try:
+                size = os.path.getsize(self._snapshot_path(name))
+                snapshots[name] = self.summary(self.manifest(name), size)
+                manifest_bytes += size
+            except (OSError, ValueError) as e:
+                print(f"[Backup] Manifesto {name} ilegível: {e}")
+        legacy = {}
+        try:
+            entries = os.listdir(self.root)
+        except FileNotFoundError:
+            entries = []
+        for entry in entries:
+            if entry.endswith(".zip"):
+                st = os.stat(os.path.join(self.root, entry))
+                legacy[entry] = {
+                    "nome": entry,
+                    "tipo": "zip",
+                    "criado_em": datetime.fromtimestamp(st.st_ctime, tz=timezone.utc).isoformat(),
+                    "tamanho": st.st_size,
+                    "tamanho_logico": st.st_size,
+                    "tamanho_fisico": st.st_size
+                }
+        blobs, blob_bytes = self._scan_blobs()
+        print(f"[Backup] Índice reconstruído: {len(snapshots)} backup(s), {blobs} blob(s)")
+        return {"snapshots": snapshots, "legados": legacy, "blobs": blobs, "bytes_blobs": blob_bytes,
+                "bytes_manifestos": manifest_bytes}
+
+    def _scan_blobs(self):
+        blobs = blob_bytes = 0
+        for directory, _, filenames in os.walk(self.blob_dir):
+            for filename in filenames:
+                if not filename.startswith("."):
+                    blobs += 1
+                    blob_bytes += os.path.getsize(os.path.join(directory, filename))
+        return blobs, blob_bytes
+
+    def _save_index(self) -> None:
+        try:
+            atomic_write(self.index_path, json_codec.dumps(self._index))
+        except OSError as e:
+            # O índice é só cache: na próxima carga ele é reconstruído
+            print(f"[Backup] Erro ao gravar índice: {e}")
+
+    def create(self) -> Dict[str, Any]:
+        """
+        Cria um backup com o estado atual de source
+
+        Arquivos com tamanho e mtime iguais aos do backup anterior reaproveitam
+        o hash sem serem relidos; os demais são lidos uma vez (em paralelo, no
+        pool de compressão) e só viram blob novo se o conteúdo ainda não existe
+        no repositório.
+
+        Returns:
+            Manifesto do backup criado
+        """
+        with self._lock:
+            index = self._index_snapshot()
+            started_ns = time.time_ns()
+            previous = self._latest_manifest()
+            previous_files = previous.get("arquivos", {}) if previous else {}
+            trusted_before = previous.get("iniciado_em_ns", 0) - RACY_WINDOW_NS if previous else 0
+
+            files: Dict[str, Dict[str, Any]] = {}
+            to_store = []
+            new_blobs = new_bytes = reused = 0
+            for relpath in self._source_files():
+                path = os.path.join(self.source, relpath)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                key = relpath.replace(os.sep, "/")
+                old = previous_files.get(key)
+                if (old is not None and old["tamanho"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns
+                        and st.st_mtime_ns < trusted_before and os.path.exists(self._blob_path(old["sha256"]))):
+                    files[key] = old
+                    reused += 1
+                    continue
+                to_store.append((key, path, st.st_mtime_ns))
+
+            results = compression_pool().map(self._store_if_exists, [path for _, path, _ in to_store])
+            counted: Set[str] = set()
+            for (key, _, mtime_ns), stored in zip(to_store, results):
+                if stored is None:
+                    continue
+                # Conteúdos iguais gravados ao mesmo tempo viram um único blob
+                if stored["novo"] and stored["sha256"] not in counted:
+                    counted.add(stored["sha256"])
+                    new_blobs += 1
+                    new_bytes += stored["novo"]
+                files[key] = {"sha256": stored["sha256"], "tamanho": stored["tamanho"], "mtime_ns": mtime_ns}
+            files = dict(sorted(files.items()))
+
+            base = name = datetime.now().strftime("backup_%Y%m%d_%H%M%S")
+            suffix = 1
+            while os.path.exists(self._snapshot_path(name)):
+                name = f"{base}-{suffix}"
+                suffix += 1
+            manifest = {
+                "nome": name,
+                "criado_em": datetime.now(timezone.utc).isoformat(),
+                "iniciado_em_ns": started_ns,
+                "arquivos": files,
+                "tamanho_logico": sum(f["tamanho"] for f in files.values()),
+                "novos_blobs": new_blobs,
+                "novos_bytes": new_bytes,
+                "reaproveitados": reused
+            }
+            payload = json_codec.dumps(manifest)
+            atomic_write(self._snapshot_path(name), payload)
+            index["snapshots"][name] = self.summary(manifest, len(payload))
+            index["blobs"] += new_blobs
+            index["bytes_blobs"] += new_bytes
+            index["bytes_manifestos"] += len(payload)
+            self._save_index()
+            return manifest
+
+    # Retenção e coleta de lixo
+    def prune(self, keep_last: int, keep_daily: int = 0, keep_weekly: int = 0) -> Dict[str, Any]:
+        """
+        Apaga os backups fora da política de retenção e os blobs que só eles usavam
+
+        Com keep_last, keep_daily e keep_weekly <= 0 nada é apagado.
+        Backups ZIP do formato antigo não entram na retenção.
+        """
+        if keep_last <= 0 and keep_daily <= 0 and keep_weekly <= 0:
+            return {"removidos": [], "blobs_removidos": 0, "bytes_liberados": 0}
+        with self._lock:
+            index = self._index_snapshot()
+            keep = retained(index["snapshots"].values(), keep_last, keep_daily, keep_weekly)
+            removed = []
+            for name in sorted(set(index["snapshots"]) - keep):
+                path = self._snapshot_path(name)
+                try:
+                    size = os.path.getsize(path)
+                    os.unlink(path)
+                except FileNotFoundError:
+                    size = 0
+                del index["snapshots"][name]
+                index["bytes_manifestos"] = max(index["bytes_manifestos"] - size, 0)
+                removed.append(name)
+            self._save_index()
+            result = self.collect_garbage() if removed else {"blobs_removidos": 0, "bytes_liberados": 0}
+            if removed:
+                print(f"[Backup] Retenção: {len(removed)} backup(s) apagado(s), "
+                      f"{result['blobs_removidos']} blob(s) e {result['bytes_liberados']} bytes liberados")
+            return {"removidos": removed, **result}
+
+    def collect_garbage(self) -> Dict[str, int]:
+        """Remove blobs que nenhum manifesto referencia e temporários abandonados"""
+        with self._lock:
+            index = self._index_snapshot()
+            referenced: Set[str] = set()
+            for name in self.snapshot_names():
+                try:
+                    manifest = self.manifest(name)
+                except (OSError, ValueError) as e:
+                    # Sem saber o que o manifesto referencia, nada pode ser apagado
+                    print(f"[Backup] Coleta de lixo cancelada, manifesto {name} ilegível: {e}")
+                    return {"blobs_removidos": 0, "bytes_liberados": 0}
+                referenced.update(entry["sha256"] for entry in manifest.get("arquivos", {}).values())
+
+            removed = freed = 0
+            now = time.time()
+            for directory, _, filenames in os.walk(self.blob_dir):
+                for filename in filenames:
+                    path = os.path.join(directory, filename)
+                    if filename.startswith("."):
+                        stale = filename.endswith(".tmp") and now - os.path.getmtime(path) > STALE_TMP_S
+                    else:
+                        stale = filename not in referenced
+                    if stale:
+                        freed += os.path.getsize(path)
+                        os.unlink(path)
+                        removed += 1
+            index["blobs"], index["bytes_blobs"] = self._scan_blobs()
+            self._save_index()
+            return {"blobs_removidos": removed, "bytes_liberados": freed}
+
+    def restore(self, name: str, dest: str) -> Dict[str, Any]:
+        """
+        Reconstrói o backup em dest, conferindo o hash de cada arquivo
+
+        Returns:
+            Arquivos e bytes restaurados
+        """
+        manifest = self.manifest(name)
+        root = os.path.abspath(dest)
+        restored = 0
+        for relpath, entry in manifest.get("arquivos", {}).items():
+            path = os.path.abspath(os.path.join(root, relpath))
+            if not path.startswith(root + os.sep):
+                raise ValueError(f"Caminho inválido no manifesto: {relpath}")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".restore.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'wb') as out:
+                    self._read_blob(entry["sha256"], out)
+                os.replace(tmp_path, path)
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
+            restored += entry["tamanho"]
+        return {"nome": name, "destino": root, "arquivos": len(manifest.get("arquivos", {})), "bytes": restored}
+
+    # Consulta
+    def summary(self, manifest: Dict[str, Any], manifest_size: int) -> Dict[str, Any]:
+        """Resumo do backup para a listagem (tamanho = espaço que ele acrescentou)"""
+        physical = manifest.get("novos_bytes", 0) + manifest_size
+        return {
+            "nome": manifest["nome"],
+            "tipo": "incremental",
+            "criado_em": manifest["criado_em"],
+            "arquivos": len(manifest.get("arquivos", {})),
+            "tamanho": physical,
+            "tamanho_logico": manifest.get("tamanho_logico", 0),
+            "tamanho_fisico": physical
+        }
+
+    def list_snapshots(self) -> List[Dict[str, Any]]:
+        """Backups (incrementais e ZIP antigos), do mais recente para o mais antigo"""
+        with self._lock:
+            index = self._index_snapshot()
+            items = [*index["snapshots"].values(), *index["legados"].values()]
+        return sorted(items, key=lambda item: item["criado_em"], reverse=True)
+
+    def has_snapshot(self, name: str) -> bool:
+        with self._lock:
+            return name in self._index_snapshot()["snapshots"]
+
+    def latest_created_at(self) -> Optional[float]:
+        """Timestamp do backup incremental mais recente (None se não há)"""
+        with self._lock:
+            snapshots = self._index_snapshot()["snapshots"]
+            if not snapshots:
+                return None
+            return max(datetime.fromisoformat(item["criado_em"]).timestamp() for item in snapshots.values())
+
+    def usage(self) -> Dict[str, Any]:
+        """Espaço ocupado pelo repositório de blobs e manifestos"""
+        with self._lock:
+            index = self._index_snapshot()
+            return {"blobs": index["blobs"], "bytes_blobs": index["bytes_blobs"],
+                    "bytes_manifestos": index["bytes_manifestos"]}
+
+
+if __name__ == "__main__":
+    store = BackupStore(os.getenv("BACKUP_DIR", "./backups"), os.getenv("BACKUP_SOURCE", "./DataBaseJson"))
+    if len(sys.argv) >= 2 and sys.argv[1] == "list":
+        for item in store.list_snapshots():
+            print(f"{item['nome']}  {item['arquivos']} arquivos  lógico {item['tamanho_logico']} B  "
+                  f"físico {item['tamanho_fisico']} B")
+    elif len(sys.argv) == 4 and sys.argv[1] == "restore":
+        print(store.restore(sys.argv[2], sys.argv[3]))
+    elif len(sys.argv) == 2 and sys.argv[1] == "gc":
+        print(store.collect_garbage())
+    else:
+        print("Uso: python backup_store.py list | restore <nome> <destino> | gc")
+        sys.exit(1)
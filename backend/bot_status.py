@@ -0,0 +1,126 @@
+"""
+Status do bot Discord em segundo plano
+Uma tarefa verifica o bot a cada intervalo e guarda o resultado em memória;
+o dashboard lê o último snapshot na hora em vez de consultar o Discord a cada
+visualização.
+"""
+
+import asyncio
+import hashlib
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from async_io import run_blocking
+from single_flight import single_flight
+
+StatusCheck = Callable[[str], Awaitable[Dict]]
+TokenProvider = Callable[[], str]
+
+
+def _fingerprint(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()[:16]
+
+
+class BotStatusMonitor:
+    """
+    Args:
+        check: Corrotina que verifica o bot com o token (check_discord_bot_status)
+        token_provider: Retorna o token atual do bot ("" se não configurado)
+        interval: Segundos entre verificações automáticas
+    """
+
+    def __init__(self, check: StatusCheck, token_provider: TokenProvider, interval: float = 60.0):
+        self.check = check
+        self.token_provider = token_provider
+        self.interval = max(interval, 1.0)
+        self._status: Optional[Dict] = None
+        self._checked_at = 0.0
+        self._token: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        self.checks = 0
+        self.manual_refreshes = 0
+        self.errors = 0
+
+    # Verificação
+    async def _check(self, token: str) -> Dict:
+        self.checks += 1
+        try:
+            status = await self.check(token)
+        except Exception as e:
+            self.errors += 1
+            status = {
+                'status': 'error',
+                'message': f'Erro de conexão: {str(e)}',
+                'guilds': 0,
+                'total_members': 0,
+                'lastSeen': None
+            }
+        self._status = status
+        self._token = _fingerprint(token)
+        self._checked_at = time.time()
+        return status
+
+    async def refresh(self) -> Optional[Dict]:
+        """Verifica agora (reaproveita uma verificação já em andamento)"""
+        token = await run_blocking(self.token_provider)
+        if not token:
+            self._status = None
+            self._token = None
+            return None
+        # Sem cache: cada refresh verifica de novo, mas só uma vez por vez
+        return await single_flight.do(("bot_status", _fingerprint(token)), self._check, token, ttl=0)
+
+    async def refresh_now(self) -> Optional[Dict[str, Any]]:
+        """Verificação manual: consulta o Discord e retorna o novo snapshot"""
+        self.manual_refreshes += 1
+        await self.refresh()
+        return await self.snapshot()
+
+    async def snapshot(self) -> Optional[Dict[str, Any]]:
+        """
+        Último status conhecido com verificado_em e idade_s
+
+        Só espera o Discord se ainda não houver snapshot para o token atual
+        (primeira chamada ou token trocado). None se não há token.
+        """
+        token = await run_blocking(self.token_provider)
+        if not token:
+            return None
+        if self._status is None or self._token != _fingerprint(token):
+            await self.refresh()
+        if self._status is None:
+            return None
+        return {
+            **self._status,
+            "verificado_em": datetime.fromtimestamp(self._checked_at, tz=timezone.utc).isoformat(),
+            "idade_s": round(time.time() - self._checked_at, 1)
+        }
+
+    # Tarefa em segundo plano
+    async def run(self) -> None:
+        while True:
+            try:
+                # Uma verificação manual recente adia a automática
+                if time.time() - self._checked_at >= self.interval - 0.5 or self._status is None:
+                    await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Bot] Erro ao verificar status: {e}")
+            await asyncio.sleep(max(self.interval - (time.time() - self._checked_at), 1.0))
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self.run())
+        return self._task
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "intervalo_s": self.interval,
+            "verificacoes": self.checks,
+            "atualizacoes_manuais": self.manual_refreshes,
+            "erros": self.errors,
+            "status": self._status.get("status") if self._status else None,
+            "idade_s": round(time.time() - self._checked_at, 1) if self._checked_at else None
+        }
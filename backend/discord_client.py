@@ -0,0 +1,305 @@
+"""
+Cliente HTTP assíncrono da API do Discord
+Um único httpx.AsyncClient com keep-alive compartilhado pelo painel, com
+limite de requisições simultâneas e respeito aos rate limits do Discord:
+buckets por rota (cabeçalhos X-RateLimit-*), limite global e retry_after
+nas respostas 429.
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+
+DISCORD_API = "https://discord.com/api/v10"
+
+# Parâmetros "maiores": o Discord separa os buckets por esses IDs
+MAJOR_PARAMETERS = ("channels", "guilds", "webhooks")
+
+
+def route_key(method: str, path: str) -> str:
+    """
+    Rota para bucket de rate limit: IDs viram :id, exceto os parâmetros
+    maiores (GET /users/123 e GET /users/456 dividem o mesmo bucket)
+    """
+    parts = path.split("?", 1)[0].strip("/").split("/")
+    route = []
+    for i, part in enumerate(parts):
+        if part.isdigit() and not (i > 0 and parts[i - 1] in MAJOR_PARAMETERS):
+            route.append(":id")
+        else:
+            route.append(part)
+    return f"{method.upper()} /" + "/".join(route)
+
+
+def major_parameter(route: str) -> str:
+    """ID do primeiro parâmetro maior da rota ("" se não houver)"""
+    parts = route.split(" ", 1)[1].strip("/").split("/")
+    for i, part in enumerate(parts[:-1]):
+        if part in MAJOR_PARAMETERS:
+            return parts[i + 1]
+    return ""
+
+
+class RateLimitBucket:
+    """Estado de um bucket: requisições restantes até reset_at (monotonic)"""
+
+    __slots__ = ("limit", "remaining", "reset_at", "pending", "known", "lock")
+
+    def __init__(self):
+        # Desconhecido até a primeira resposta com cabeçalhos
+        self.limit: Optional[int] = None
+        self.remaining: float = float("inf")
+        self.reset_at = 0.0
+        # Janela aberta localmente; reset_at é provisório até a próxima resposta
+        self.pending = False
+        # Já houve uma resposta desta rota (com ou sem cabeçalhos)
+        self.known = False
+        self.lock = asyncio.Lock()
+
+
+class DiscordClient:
+    """
+    Args:
+        base_url: URL base da API REST
+        max_concurrency: Máximo de requisições em andamento ao mesmo tempo
+        timeout: Timeout de cada requisição (segundos)
+        max_retries: Novas tentativas após um 429
+        max_retry_wait: retry_after acima disso (segundos) devolve o 429 sem esperar
+        transport: Transporte do httpx (None = rede; ex.: httpx.MockTransport nos testes)
+    """
+
+    def __init__(self, base_url: str = DISCORD_API, max_concurrency: int = 10, timeout: float = 10.0,
+                 max_retries: int = 3, max_retry_wait: float = 30.0,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max(max_concurrency, 1)
+        self.timeout = timeout
+        self.max_retries = max(max_retries, 0)
+        self.max_retry_wait = max_retry_wait
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # rota -> chave do bucket informada pelo Discord (X-RateLimit-Bucket)
+        self._routes: Dict[str, str] = {}
+        self._buckets: Dict[str, RateLimitBucket] = {}
+        self._global_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.global_limited = 0
+        self.retries = 0
+        self.waits = 0
+        self.wait_time = 0.0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Criado sob demanda, dentro do event loop que vai usá-lo
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                ),
+                transport=self.transport
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            # Os locks dos buckets pertencem ao loop anterior
+            self._buckets = {}
+        return self._client
+
+    # Rate limits
+    def _bucket_for(self, route: str) -> RateLimitBucket:
+        key = self._routes.get(route, route)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = RateLimitBucket()
+        return bucket
+
+    async def _sleep(self, delay: float) -> None:
+        self.wait_time += delay
+        await asyncio.sleep(delay)
+
+    async def _acquire(self, route: str) -> Tuple[RateLimitBucket, bool]:
+        """
+        Espera o limite global e o bucket da rota liberarem uma requisição
+
+        Returns:
+            (bucket, descobrindo): enquanto os limites da rota são desconhecidos
+            uma requisição por vez segue com o lock do bucket, liberado depois
+            que a resposta informar os cabeçalhos
+        """
+        while True:
+            delay = self._global_until - time.monotonic()
+            if delay > 0:
+                self.waits += 1
+                await self._sleep(delay)
+            bucket = self._bucket_for(route)
+            await bucket.lock.acquire()
+            if self._bucket_for(route) is not bucket:
+                # A rota foi associada a um bucket do Discord enquanto esperava
+                bucket.lock.release()
+                continue
+            try:
+                if bucket.remaining <= 0 and bucket.reset_at > time.monotonic():
+                    self.waits += 1
+                    # reset_at pode ser corrigido por uma resposta durante a espera
+                    while bucket.remaining <= 0:
+                        delay = bucket.reset_at - time.monotonic()
+                        if delay <= 0:
+                            break
+                        await self._sleep(min(delay, 0.25))
+                if time.monotonic() >= bucket.reset_at and bucket.limit is not None:
+                    bucket.remaining = bucket.limit
+                    bucket.reset_at = time.monotonic() + self.timeout
+                    bucket.pending = True
+                # Um 429 global durante a espera: aguarda de novo
+                if self._global_until > time.monotonic():
+                    bucket.lock.release()
+                    continue
+                bucket.remaining -= 1
+            except BaseException:
+                bucket.lock.release()
+                raise
+            if bucket.known:
+                bucket.lock.release()
+                return bucket, False
+            return bucket, True
+
+    def _update_bucket(self, route: str, response: httpx.Response) -> RateLimitBucket:
+        headers = response.headers
+        bucket_hash = headers.get("X-RateLimit-Bucket")
+        if bucket_hash:
+            # O mesmo hash com parâmetros maiores diferentes são buckets diferentes
+            key = f"{bucket_hash}:{major_parameter(route)}"
+            if self._routes.get(route) != key:
+                self._routes[route] = key
+                previous = self._buckets.pop(route, None)
+                if key not in self._buckets:
+                    self._buckets[key] = previous or RateLimitBucket()
+        bucket = self._bucket_for(route)
+        bucket.known = True
+        try:
+            if "X-RateLimit-Limit" in headers:
+                bucket.limit = int(headers["X-RateLimit-Limit"])
+            if "X-RateLimit-Remaining" in headers:
+                remaining = int(headers["X-RateLimit-Remaining"])
+                reset_at = time.monotonic() + float(headers.get("X-RateLimit-Reset-After", 0))
+                if bucket.pending or reset_at <= bucket.reset_at + 0.05:
+                    # Mesma janela: respostas fora de ordem não devolvem vagas já usadas
+                    bucket.remaining = min(bucket.remaining, remaining)
+                else:
+                    # Nova janela do lado do Discord
+                    bucket.remaining = remaining
+                bucket.reset_at = reset_at
+                bucket.pending = False
+        except ValueError:
+            pass
+        return bucket
+
+    @staticmethod
+    def _rate_limit_info(response: httpx.Response) -> Tuple[float, bool]:
+        """(retry_after em segundos, limite global) de uma resposta 429"""
+        retry_after = 1.0
+        is_global = response.headers.get("X-RateLimit-Global", "").lower() == "true" \
+            or response.headers.get("X-RateLimit-Scope") == "global"
+        try:
+            body = response.json()
+            retry_after = float(body.get("retry_after", retry_after))
+            is_global = is_global or bool(body.get("global"))
+        except (ValueError, AttributeError):
+            try:
+                retry_after = float(response.headers.get("Retry-After", retry_after))
+            except ValueError:
+                pass
+        return max(retry_after, 0.0), is_global
+
+    # Requisições
+    async def request(self, method: str, path: str, token: str, **kwargs) -> httpx.Response:
+        """
+        Faz uma requisição autenticada como bot, esperando os rate limits
+
+        Após um 429 espera retry_after e tenta de novo (até max_retries); se
+        a espera passar de max_retry_wait a resposta 429 é devolvida.
+
+        Raises:
+            httpx.HTTPError: Falha de rede ou timeout
+        """
+        client = self._get_client()
+        headers = {
+            'Authorization': f'Bot {token}',
+            'Content-Type': 'application/json'
+        }
+        headers.update(kwargs.pop("headers", {}))
+        route = route_key(method, path)
+
+        attempt = 0
+        while True:
+            bucket, discovering = await self._acquire(route)
+            try:
+                async with self._semaphore:
+                    self.requests += 1
+                    try:
+                        response = await client.request(method, path, headers=headers, **kwargs)
+                    except httpx.HTTPError:
+                        self.errors += 1
+                        raise
+                self._update_bucket(route, response)
+            finally:
+                if discovering:
+                    bucket.lock.release()
+            if response.status_code != 429:
+                return response
+
+            self.rate_limited += 1
+            retry_after, is_global = self._rate_limit_info(response)
+            if is_global:
+                self.global_limited += 1
+                self._global_until = max(self._global_until, time.monotonic() + retry_after)
+            else:
+                bucket = self._bucket_for(route)
+                bucket.remaining = 0
+                bucket.reset_at = time.monotonic() + retry_after
+                bucket.pending = False
+            print(f"[Discord] Rate limit em {route} ({'global' if is_global else 'rota'}), retry_after={retry_after:.2f}s")
+            if attempt >= self.max_retries or retry_after > self.max_retry_wait:
+                return response
+            attempt += 1
+            self.retries += 1
+
+    async def get_user(self, user_id: str, token: str) -> Optional[Dict[str, Any]]:
+        """Dados públicos de um usuário ou None se a API não retornou 200"""
+        response = await self.request("GET", f"/users/{user_id}", token)
+        if response.status_code == 200:
+            return response.json()
+        return None
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "concorrencia_maxima": self.max_concurrency,
+            "requisicoes": self.requests,
+            "erros": self.errors,
+            "rate_limited": self.rate_limited,
+            "rate_limited_global": self.global_limited,
+            "novas_tentativas": self.retries,
+            "esperas": self.waits,
+            "tempo_esperando_s": round(self.wait_time, 3),
+            "buckets": len(self._buckets)
+        }
+
+
+discord_client = DiscordClient(
+    base_url=os.getenv("DISCORD_API_URL", DISCORD_API),
+    max_concurrency=int(os.getenv("DISCORD_HTTP_CONCURRENCY", "10")),
+    timeout=float(os.getenv("DISCORD_HTTP_TIMEOUT_S", "10")),
+    max_retries=int(os.getenv("DISCORD_HTTP_MAX_RETRIES", "3")),
+    max_retry_wait=float(os.getenv("DISCORD_HTTP_MAX_RETRY_WAIT_S", "30"))
+)
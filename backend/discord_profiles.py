@@ -0,0 +1,333 @@
+"""
+Cache de perfis de usuários do Discord
+Perfis (username, avatar) ficam em um LRU em memória limitado por quantidade
+e em um SQLite em disco que sobrevive a reinícios. Perfis vencidos (TTL) são
+servidos na hora e atualizados em segundo plano (stale-while-revalidate).
+Usuários que a API não retornou (404, contas apagadas) ficam marcados por
+miss_ttl para não voltarem à API a cada ranking. O SQLite só é consultado
+no pool de threads.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import json_codec
+from async_io import run_blocking
+from discord_client import DiscordClient
+
+
+def build_user_profile(user_id: str, user_data: Dict) -> Dict:
+    """Perfil usado pelo painel a partir do objeto de usuário do Discord"""
+    avatar_hash = user_data.get('avatar')
+
+    # Construir URL do avatar
+    if avatar_hash:
+        avatar_url = f"https://cdn.discordapp.com/avatars/{user_id}/{avatar_hash}.png?size=128"
+    else:
+        # Avatar padrão
+        discriminator = user_data.get('discriminator', '0000')
+        try:
+            default_avatar_id = int(discriminator) % 5
+        except (ValueError, TypeError):
+            default_avatar_id = 0
+        avatar_url = f"https://cdn.discordapp.com/embed/avatars/{default_avatar_id}.png"
+
+    return {
+        'id': user_data.get('id'),
+        'username': user_data.get('username', 'Unknown'),
+        'discriminator': user_data.get('discriminator', '0000'),
+        'global_name': user_data.get('global_name'),
+        'avatar_url': avatar_url
+    }
+
+
+def placeholder_user_profile(user_id: str) -> Dict:
+    return {
+        'id': user_id,
+        'username': 'Usuário Desconhecido',
+        'discriminator': '0000',
+        'global_name': None,
+        'avatar_url': 'https://cdn.discordapp.com/embed/avatars/0.png'
+    }
+
+
+class ProfileCache:
+    """
+    LRU em memória + SQLite em disco
+
+    Args:
+        path: Arquivo SQLite dos perfis
+        ttl: Segundos até um perfil ser considerado vencido
+        max_entries: Perfis mantidos em memória
+        miss_ttl: Segundos que um usuário não encontrado fica sem nova busca
+    """
+
+    def __init__(self, path: str, ttl: float = 6 * 3600, max_entries: int = 5000, miss_ttl: float = 300):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max(max_entries, 1)
+        self.miss_ttl = miss_ttl
+        self._memory: "OrderedDict[str, Tuple[Dict, float]]" = OrderedDict()
+        # user_id -> até quando não buscar de novo (só em memória)
+        self._not_found: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+        self._closed = False
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS perfis (user_id TEXT PRIMARY KEY, dados TEXT NOT NULL, buscado_em REAL NOT NULL)"
+        )
+
+    def _remember(self, user_id: str, profile: Dict, fetched_at: float) -> None:
+        self._memory[user_id] = (profile, fetched_at)
+        self._memory.move_to_end(user_id)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def get_cached(self, user_id: str) -> Optional[Tuple[Dict, bool]]:
+        """Como get, mas só na memória (não bloqueia; None se não está nela)"""
+        with self._lock:
+            cached = self._memory.get(user_id)
+            if cached is None:
+                return None
+            self._memory.move_to_end(user_id)
+            self.hits += 1
+        profile, fetched_at = cached
+        return profile, time.time() - fetched_at < self.ttl
+
+    def get_many(self, user_ids: Iterable[str]) -> Dict[str, Optional[Tuple[Dict, bool]]]:
+        """get de vários usuários (bloqueante: consulta o SQLite)"""
+        return {user_id: self.get(user_id) for user_id in user_ids}
+
+    def is_not_found(self, user_id: str) -> bool:
+        """O usuário não foi encontrado na API há menos de miss_ttl"""
+        with self._lock:
+            until = self._not_found.get(user_id)
+            if until is None:
+                return False
+            if until <= time.monotonic():
+                del self._not_found[user_id]
+                return False
+            self.negative_hits += 1
+            return True
+
+    def put_not_found(self, user_id: str) -> None:
+        if self.miss_ttl <= 0:
+            return
+        with self._lock:
+            self._not_found[user_id] = time.monotonic() + self.miss_ttl
+            self._not_found.move_to_end(user_id)
+            while len(self._not_found) > self.max_entries:
+                self._not_found.popitem(last=False)
+
+    def get(self, user_id: str) -> Optional[Tuple[Dict, bool]]:
+        """Retorna (perfil, ainda válido) ou None se nunca foi buscado (bloqueante)"""
+        with self._lock:
+            cached = self._memory.get(user_id)
+            if cached is not None:
+                self._memory.move_to_end(user_id)
+                self.hits += 1
+            elif self._closed:
+                return None
+            else:
+                row = self._conn.execute(
+                    "SELECT dados, buscado_em FROM perfis WHERE user_id = ?", (user_id,)
+                ).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                cached = (json_codec.loads(row[0]), row[1])
+                self._remember(user_id, *cached)
+                self.disk_hits += 1
+        profile, fetched_at = cached
+        return profile, time.time() - fetched_at < self.ttl
+
+    def put(self, user_id: str, profile: Dict) -> None:
+        """Guarda o perfil (bloqueante: grava no SQLite)"""
+        now = time.time()
+        with self._lock:
+            self._not_found.pop(user_id, None)
+            self._remember(user_id, profile, now)
+            if self._closed:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO perfis (user_id, dados, buscado_em) VALUES (?, ?, ?)",
+                (user_id, json_codec.dumps_str(profile), now)
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            on_disk = None if self._closed else self._conn.execute("SELECT COUNT(*) FROM perfis").fetchone()[0]
+        total = self.hits + self.disk_hits + self.misses
+        return {
+            "em_memoria": len(self._memory),
+            "em_disco": on_disk,
+            "hits": self.hits,
+            "hits_disco": self.disk_hits,
+            "misses": self.misses,
+            "nao_encontrados": len(self._not_found),
+            "hits_nao_encontrados": self.negative_hits,
+            "despejos": self.evictions,
+            "hit_ratio": round((self.hits + self.disk_hits) / total, 4) if total else 0.0
+        }
+
+
+# Marca de usuário não encontrado em ProfileService._lookup
+_NOT_FOUND = object()
+
+
+class ProfileService:
+    """
+    Busca perfis pelo cache, com uma única busca em andamento por usuário
+
+    Args:
+        cache: ProfileCache
+        client: Cliente HTTP da API do Discord
+    """
+
+    def __init__(self, cache: ProfileCache, client: DiscordClient):
+        self.cache = cache
+        self.client = client
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.fetches = 0
+        self.refreshes = 0
+        self.errors = 0
+
+    async def _fetch(self, user_id: str, token: str) -> Optional[Dict]:
+        self.fetches += 1
+        try:
+            user_data = await self.client.get_user(user_id, token)
+        except Exception as e:
+            self.errors += 1
+            print(f"Erro ao buscar usuário {user_id}: {e}")
+            return None
+        if user_data is None:
+            # 404, conta apagada: o placeholder vale por miss_ttl
+            self.errors += 1
+            self.cache.put_not_found(user_id)
+            return None
+        profile = build_user_profile(user_id, user_data)
+        await run_blocking(self.cache.put, user_id, profile)
+        return profile
+
+    def _schedule(self, user_id: str, token: str) -> asyncio.Task:
+        task = self._inflight.get(user_id)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(user_id, token))
+            self._inflight[user_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        return task
+
+    async def _lookup(self, user_ids: Iterable[str]) -> Dict[str, Any]:
+        """
+        {user_id: (perfil, válido) | None | _NOT_FOUND} na ordem pedida
+
+        A memória é lida no event loop; só os ausentes dela vão ao SQLite,
+        de uma vez, no pool de threads.
+        """
+        found: Dict[str, Any] = {}
+        on_disk: List[str] = []
+        for user_id in dict.fromkeys(user_ids):
+            if self.cache.is_not_found(user_id):
+                found[user_id] = _NOT_FOUND
+                continue
+            found[user_id] = self.cache.get_cached(user_id)
+            if found[user_id] is None:
+                on_disk.append(user_id)
+        if on_disk:
+            found.update(await run_blocking(self.cache.get_many, on_disk))
+        return found
+
+    async def get_profile(self, user_id: str, token: str) -> Dict:
+        """Perfil do cache (atualizando em segundo plano se vencido) ou da API"""
+        profiles = await self.get_profiles([user_id], token, budget=None)
+        return profiles[user_id][0]
+
+    async def get_profiles(self, user_ids: Iterable[str], token: str,
+                           budget: Optional[float]) -> Dict[str, Tuple[Dict, bool]]:
+        """
+        Perfis de vários usuários: {user_id: (perfil, provisório)}
+
+        Perfis ausentes do cache são buscados em paralelo; os que não chegarem
+        em `budget` segundos voltam provisórios e continuam sendo buscados em
+        segundo plano para a próxima requisição.
+        """
+        result: Dict[str, Tuple[Dict, bool]] = {}
+        waiting: Dict[asyncio.Task, str] = {}
+        for user_id, cached in (await self._lookup(user_ids)).items():
+            if cached is _NOT_FOUND:
+                result[user_id] = (placeholder_user_profile(user_id), False)
+            elif cached is not None:
+                profile, fresh = cached
+                result[user_id] = (profile, False)
+                if not fresh:
+                    self.refreshes += 1
+                    self._schedule(user_id, token)
+            else:
+                waiting[self._schedule(user_id, token)] = user_id
+
+        if waiting:
+            # shield: o timeout não cancela a busca, ela termina e vai para o cache
+            done, _ = await asyncio.wait([asyncio.shield(t) for t in waiting], timeout=budget)
+            for task, user_id in waiting.items():
+                profile = task.result() if task.done() and not task.cancelled() else None
+                if profile is not None:
+                    result[user_id] = (profile, False)
+                else:
+                    result[user_id] = (placeholder_user_profile(user_id), not task.done())
+        return result
+
+    async def enrich(self, users: List[Dict], token: str, budget: Optional[float]) -> None:
+        """Preenche username/avatar_url de uma lista de usuários (com user_id)"""
+        profiles = await self.get_profiles([user["user_id"] for user in users], token, budget)
+        for user in users:
+            profile, pending = profiles[user["user_id"]]
+            user["username"] = profile["username"]
+            user["avatar_url"] = profile["avatar_url"]
+            if pending:
+                user["perfil_pendente"] = True
+
+    async def warm(self, user_ids: Iterable[str], token: str) -> int:
+        """Busca os perfis ausentes ou vencidos e espera terminarem"""
+        tasks = []
+        for user_id, cached in (await self._lookup(user_ids)).items():
+            if cached is _NOT_FOUND:
+                continue
+            if cached is None or not cached[1]:
+                tasks.append(self._schedule(user_id, token))
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return len(tasks)
+
+    def cancel_pending(self) -> None:
+        """Cancela as buscas em andamento (encerramento do servidor)"""
+        for task in list(self._inflight.values()):
+            task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.cache.stats(),
+            "buscas": self.fetches,
+            "revalidacoes": self.refreshes,
+            "em_andamento": len(self._inflight),
+            "erros": self.errors
+        }
@@ -5,11 +5,12 @@ Gerenciador para controlar aplicações no Gratian.pro via API
 
 import requests
 import os
-import zipfile
 from pathlib import Path
 from typing import Optional, Dict, Any
 import json
 
+from zip_stream import write_zip
+
 class GratianManager:
     """Gerenciador da API do Gratian.pro"""
     
@@ -201,41 +202,44 @@ class GratianManager:
         """
         return self._make_request('DELETE', f'/apps/{app_id}')
     
-    def create_bot_zip(self, source_dir: str, output_path: str) -> str:
+    def create_bot_zip(self, source_dir: str, output_path: str, compresslevel: Optional[int] = None) -> str:
         """
         Cria arquivo ZIP do bot Discord
         
         Args:
             source_dir: Diretório com código do bot
             output_path: Caminho para salvar ZIP
+            compresslevel: Nível do deflate (None = padrão do zlib, 0 = sem compressão)
             
         Returns:
             Caminho do arquivo ZIP criado
         """
-        with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            source_path = Path(source_dir)
-            
-            # Arquivos essenciais do bot
-            essential_files = [
-                'index.js',
-                'package.json',
-                'config.json',
-                'Handler',
-                'Eventos',
-                'ComandosSlash',
-                'DataBaseJson'
-            ]
-            
-            for item in essential_files:
-                item_path = source_path / item
-                if item_path.exists():
-                    if item_path.is_file():
-                        zipf.write(item_path, item_path.name)
-                    elif item_path.is_dir():
-                        for file in item_path.rglob('*'):
-                            if file.is_file():
-                                arcname = file.relative_to(source_path)
-                                zipf.write(file, arcname)
+        source_path = Path(source_dir)
+        files = []
+        
+        # Arquivos essenciais do bot
+        essential_files = [
+            'index.js',
+            'package.json',
+            'config.json',
+            'Handler',
+            'Eventos',
+            'ComandosSlash',
+            'DataBaseJson'
+        ]
+        
+        for item in essential_files:
+            item_path = source_path / item
+            if item_path.exists():
+                if item_path.is_file():
+                    files.append((item_path.name, str(item_path)))
+                elif item_path.is_dir():
+                    for file in sorted(item_path.rglob('*')):
+                        if file.is_file():
+                            files.append((file.relative_to(source_path).as_posix(), str(file)))
+        
+        # Membros comprimidos em paralelo no pool compartilhado
+        write_zip(output_path, files, compresslevel=compresslevel)
         
         return output_path
 
@@ -249,9 +253,9 @@ def get_gratian_manager() -> Optional[GratianManager]:
     Returns:
         GratianManager ou None se API key não configurada
     """
-    from server import read_json_file
+    from storage import read_json_view
     
-    config = read_json_file("./DataBaseJson/config.json")
+    config = read_json_view("./DataBaseJson/config.json")
     api_key = config.get("gratian_api_key")
     
     if not api_key:
@@ -267,9 +271,9 @@ def get_bot_app_id() -> Optional[str]:
     Returns:
         App ID ou None se não configurado
     """
-    from server import read_json_file
+    from storage import read_json_view
     
-    config = read_json_file("./DataBaseJson/config.json")
+    config = read_json_view("./DataBaseJson/config.json")
     return config.get("gratian_bot_app_id")
 
 if __name__ == "__main__":
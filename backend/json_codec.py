@@ -0,0 +1,117 @@
+"""
+Codec JSON do backend
+Usa orjson quando instalado e cai para o json da stdlib caso contrário. Toda a
+persistência (DataBaseJson, journal, SQLite) e as respostas da API passam por
+aqui, então os dois caminhos produzem o mesmo formato em disco.
+
+Benchmark: python json_codec.py [--entries 100000]
+"""
+
+import json
+import os
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # dependência opcional
+    orjson = None
+
+# auto (orjson se disponível), orjson ou json
+_requested = os.getenv("JSON_CODEC", "auto").lower()
+if _requested == "orjson" and orjson is None:
+    print("[JSON] JSON_CODEC=orjson mas o pacote não está instalado, usando json da stdlib")
+BACKEND = "orjson" if orjson is not None and _requested != "json" else "json"
+
+# orjson.JSONDecodeError herda de json.JSONDecodeError
+DecodeError = json.JSONDecodeError
+
+
+def _stdlib_dumps(obj: Any, indent: bool = False) -> bytes:
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _stdlib_loads(data: Any) -> Any:
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytes(data).decode('utf-8')
+    return json.loads(data)
+
+
+if BACKEND == "orjson":
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj: Any, indent: bool = False) -> bytes:
+        """Serializa para bytes UTF-8 (compacto ou com indentação de 2 espaços)"""
+        option = _OPTIONS | orjson.OPT_INDENT_2 if indent else _OPTIONS
+        try:
+            return orjson.dumps(obj, option=option)
+        except TypeError:
+            # Tipos que o orjson não conhece (ex.: inteiros acima de 64 bits)
+            return _stdlib_dumps(obj, indent)
+
+    def loads(data: Any) -> Any:
+        """Desserializa bytes ou str"""
+        return orjson.loads(data)
+else:
+    dumps = _stdlib_dumps
+    loads = _stdlib_loads
+
+
+def dumps_str(obj: Any) -> str:
+    """Serialização compacta como str (colunas SQLite, linhas NDJSON)"""
+    return dumps(obj).decode('utf-8')
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse que serializa pelo codec ativo (padrão da aplicação)"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import time
+
+    parser = argparse.ArgumentParser(description="Compara o codec ativo com o json da stdlib")
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    documents = {
+        "saldo.json": {str(10**17 + i): round(rng.uniform(0, 500), 2) for i in range(args.entries)},
+        "action_logs.json": {"logs": [{
+            "timestamp": f"2026-01-01T00:00:{i % 60:02d}.000000+00:00",
+            "action": rng.choice(["coupon_used", "saldo_added", "user_login"]),
+            "user_id": str(10**17 + i),
+            "details": {"valor": i % 100, "descricao": "Ação de teste ção"},
+            "id": f"{i:032x}"
+        } for i in range(args.entries)]},
+    }
+
+    def best(fn) -> float:
+        timings = []
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    print(f"Codec ativo: {BACKEND} ({args.entries} entradas por documento)")
+    print(f"{'documento':<18} {'operação':<14} {'stdlib':>9} {BACKEND:>9} {'ganho':>7}")
+    for name, document in documents.items():
+        payload = _stdlib_dumps(document, indent=True)
+        cases = [
+            ("dumps indent", lambda: _stdlib_dumps(document, True), lambda: dumps(document, True)),
+            ("dumps compact", lambda: _stdlib_dumps(document), lambda: dumps(document)),
+            ("loads", lambda: _stdlib_loads(payload), lambda: loads(payload)),
+            ("response", lambda: JSONResponse(document), lambda: FastJSONResponse(document)),
+        ]
+        for label, baseline, candidate in cases:
+            slow, fast = best(baseline), best(candidate)
+            print(f"{name:<18} {label:<14} {slow * 1000:>7.1f}ms {fast * 1000:>7.1f}ms {slow / fast:>6.1f}x")
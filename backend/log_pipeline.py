@@ -0,0 +1,274 @@
+"""
+Pipeline assíncrono dos logs de ações
+log_action só enfileira a entrada em memória; uma thread em segundo plano grava
+em lotes (por quantidade ou por tempo) no motor de armazenamento. A latência
+das rotas deixa de depender do tamanho do log. Um lote que falha volta para a
+frente da fila e é regravado com backoff; com a fila cheia quem registra espera
+vaga por até max_wait_ms (as rotas com await, sem ocupar thread) e depois grava
+a entrada direto.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from async_io import run_blocking
+
+# Espera entre novas tentativas de um lote que falhou (dobra a cada falha seguida)
+RETRY_BASE_S = 0.5
+RETRY_MAX_S = 30.0
+
+
+class ActionLogPipeline:
+    """
+    Fila em memória drenada em lotes por uma thread
+
+    Args:
+        sink: Função que grava um lote de entradas (ex.: engine.append_actions)
+        batch_size: Grava assim que a fila atingir esse número de entradas
+        flush_interval_ms: Tempo máximo que uma entrada espera na fila
+        max_queue: Limite da fila. Quando cheia, quem registra a ação espera a
+            thread liberar espaço (backpressure sem perder entradas)
+        max_wait_ms: Espera máxima por vaga; depois a entrada é gravada direto
+            (se a gravação falhar ela entra na fila mesmo acima do limite)
+    """
+
+    def __init__(self, sink: Callable[[List[Dict]], Any], batch_size: int = 200,
+                 flush_interval_ms: int = 200, max_queue: int = 10000, max_wait_ms: int = 2000):
+        self.sink = sink
+        self.batch_size = max(batch_size, 1)
+        self.flush_interval = max(flush_interval_ms, 0) / 1000
+        self.max_queue = max(max_queue, self.batch_size)
+        self.max_wait = max(max_wait_ms, 0) / 1000
+
+        self._queue: Deque[Dict] = deque()
+        mutex = threading.Lock()
+        # _cond acorda a thread de gravação; _space, quem espera vaga na fila
+        self._cond = threading.Condition(mutex)
+        self._space = threading.Condition(mutex)
+        # Corrotinas esperando vaga (acordadas pela thread via call_soon_threadsafe)
+        self._async_waiters: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+        # Lotes retirados da fila e ainda sendo gravados
+        self._writing: List[List[Dict]] = []
+        # Serializa as gravações para os lotes chegarem ao disco em ordem
+        self._io_lock = threading.Lock()
+        self._oldest: Optional[float] = None
+        self._retry_at = 0.0
+        self._failures = 0
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+        self.submitted = 0
+        self.written = 0
+        self.batches = 0
+        self.backpressure = 0
+        self.direct_writes = 0
+        self.errors = 0
+        self.retried = 0
+
+    def _enqueue(self, entry: Dict) -> None:
+        # Chamado com o lock
+        self._queue.append(entry)
+        self.submitted += 1
+        if self._oldest is None:
+            self._oldest = time.monotonic()
+        if len(self._queue) >= self.batch_size:
+            self._cond.notify()
+        self._ensure_thread()
+
+    def _offer(self, entry: Dict) -> bool:
+        """Enfileira se couber sem esperar nem gravar; False caso contrário"""
+        with self._cond:
+            if self._closed or self.flush_interval == 0 or len(self._queue) >= self.max_queue:
+                return False
+            self._enqueue(entry)
+            return True
+
+    def _queueing(self) -> bool:
+        return not self._closed and self.flush_interval > 0
+
+    def submit(self, entry: Dict) -> None:
+        """
+        Enfileira uma entrada sem tocar no disco
+
+        Com a fila cheia bloqueia quem chamou por até max_wait_ms e então grava
+        direto; no event loop use asubmit.
+        """
+        with self._cond:
+            if self._queueing() and len(self._queue) >= self.max_queue:
+                self.backpressure += 1
+                deadline = time.monotonic() + self.max_wait
+                while self._queueing() and len(self._queue) >= self.max_queue:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._space.wait(remaining)
+            if self._queueing() and len(self._queue) < self.max_queue:
+                self._enqueue(entry)
+                return
+            self.submitted += 1
+        self._write_direct(entry)
+
+    async def asubmit(self, entry: Dict) -> None:
+        """
+        Como submit, mas a espera por vaga acontece no event loop (sem ocupar
+        uma thread do pool) e a gravação direta roda no pool de threads
+        """
+        if self._offer(entry):
+            return
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        waited = False
+        while True:
+            with self._cond:
+                if not self._queueing():
+                    break
+                if len(self._queue) < self.max_queue:
+                    self._enqueue(entry)
+                    return
+                if not waited:
+                    self.backpressure += 1
+                    waited = True
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                # Registrado com o lock: a thread não libera vaga sem ver o waiter
+                waiter = (loop, asyncio.Event())
+                self._async_waiters.add(waiter)
+            try:
+                await asyncio.wait_for(waiter[1].wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._cond:
+                    self._async_waiters.discard(waiter)
+        with self._cond:
+            self.submitted += 1
+        await run_blocking(self._write_direct, entry)
+
+    def _write_direct(self, entry: Dict) -> None:
+        """Grava uma entrada fora da fila (encerrado, sem janela ou fila cheia)"""
+        self.direct_writes += 1
+        if not self._write([entry]):
+            with self._cond:
+                if not self._closed:
+                    # A thread regrava com backoff
+                    self._queue.append(entry)
+                    if self._oldest is None:
+                        self._oldest = time.monotonic()
+                    self._ensure_thread()
+                    self._cond.notify()
+
+    def _space_freed(self) -> None:
+        # Chamado com o lock
+        self._space.notify_all()
+        for loop, event in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # Loop já encerrado; o waiter sai pelo timeout ou nunca mais roda
+                pass
+
+    def pending(self) -> List[Dict]:
+        """Entradas ainda não gravadas (inclusive as em gravação), da mais antiga para a mais nova"""
+        with self._cond:
+            return [entry for batch in self._writing for entry in batch] + list(self._queue)
+
+    def flush(self) -> None:
+        """Grava imediatamente tudo que está na fila (em caso de erro, as entradas continuam nela)"""
+        with self._io_lock:
+            with self._cond:
+                batch = list(self._queue)
+                self._queue.clear()
+                self._oldest = None
+                self._space_freed()
+            if batch and not self._write_locked(batch):
+                self._requeue(batch)
+
+    def _requeue(self, batch: List[Dict]) -> None:
+        """Devolve um lote que falhou para a frente da fila"""
+        with self._cond:
+            self._queue.extendleft(reversed(batch))
+            self._oldest = time.monotonic()
+            self._failures += 1
+            self._retry_at = time.monotonic() + min(RETRY_BASE_S * 2 ** (self._failures - 1), RETRY_MAX_S)
+            self.retried += len(batch)
+
+    def _write(self, batch: List[Dict]) -> bool:
+        with self._io_lock:
+            return self._write_locked(batch)
+
+    def _write_locked(self, batch: List[Dict]) -> bool:
+        with self._cond:
+            self._writing.append(batch)
+        try:
+            self.sink(batch)
+        except Exception as e:
+            self.errors += 1
+            print(f"[Logs] Erro ao gravar {len(batch)} ações (serão regravadas): {e}")
+            return False
+        finally:
+            with self._cond:
+                self._writing.remove(batch)
+        self.written += len(batch)
+        self.batches += 1
+        self._failures = 0
+        return True
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="action-log-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                # Backoff depois de uma falha do sink
+                wait = self._retry_at - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                if len(self._queue) < self.batch_size:
+                    wait = self._oldest + self.flush_interval - time.monotonic()
+                    if wait > 0:
+                        self._cond.wait(wait)
+                        continue
+
+            with self._io_lock:
+                with self._cond:
+                    count = min(len(self._queue), self.batch_size)
+                    batch = [self._queue.popleft() for _ in range(count)]
+                    self._oldest = time.monotonic() if self._queue else None
+                    self._space_freed()
+                if batch and not self._write_locked(batch):
+                    self._requeue(batch)
+
+    def close(self) -> None:
+        """Para a thread e grava o que restou na fila"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            self._space_freed()
+        self.flush()
+        if self._queue:
+            print(f"[Logs] {len(self._queue)} ações não puderam ser gravadas no encerramento")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "fila": len(self._queue),
+            "lote_maximo": self.batch_size,
+            "janela_ms": int(self.flush_interval * 1000),
+            "enfileiradas": self.submitted,
+            "gravadas": self.written,
+            "lotes": self.batches,
+            "backpressure": self.backpressure,
+            "gravacoes_diretas": self.direct_writes,
+            "erros": self.errors,
+            "regravadas": self.retried
+        }
@@ -0,0 +1,195 @@
+"""
+Monitor do event loop
+Mede continuamente o atraso (lag) do event loop e, quando ele passa do limite,
+registra quem o bloqueou: uma thread vigia captura a pilha da thread do loop
+durante o bloqueio e a rota (ou tarefa em segundo plano) em execução.
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+import weakref
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+
+class LoopMonitor:
+    """
+    Args:
+        interval: Período (segundos) da medição de lag
+        threshold: Bloqueios acima disso (segundos) são registrados com pilha
+        max_events: Bloqueios recentes mantidos em memória
+        max_frames: Quadros da pilha guardados por bloqueio
+        max_origins: Origens distintas no tempo por rota; as excedentes somam em "outras"
+    """
+
+    def __init__(self, interval: float = 0.05, threshold: float = 0.1,
+                 max_events: int = 50, max_frames: int = 15, max_origins: int = 200):
+        self.interval = interval
+        self.threshold = threshold
+        self.max_frames = max_frames
+        self.max_origins = max(max_origins, 1)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._heartbeat = 0.0
+        # Captura feita pela thread vigia durante o bloqueio em andamento
+        self._capture: Optional[Dict[str, Any]] = None
+        # Tarefa de cada requisição HTTP em andamento -> scope ASGI (a rota casada
+        # só aparece nele depois do roteamento)
+        self.routes: "weakref.WeakKeyDictionary[asyncio.Task, Dict]" = weakref.WeakKeyDictionary()
+
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=max_events)
+        self._samples: Deque[float] = deque(maxlen=max(int(60 / interval), 1))
+        self.current_lag = 0.0
+        self.max_lag = 0.0
+        self.blocks = 0
+        self.blocked_time = 0.0
+        self.by_route: Dict[str, Dict[str, float]] = {}
+
+    # Ciclo de vida
+    def start(self) -> asyncio.Task:
+        """Inicia a medição no event loop atual e a thread vigia"""
+        if self._task is not None and not self._task.done():
+            return self._task
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.ensure_future(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._watchdog.start()
+        return self._task
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    # Medição
+    def _describe(self, task: Optional[asyncio.Task]) -> str:
+        if task is None:
+            return "callback"
+        scope = self.routes.get(task)
+        if scope is not None:
+            return route_label(scope)
+        coro = task.get_coro()
+        return f"tarefa {getattr(coro, '__qualname__', task.get_name())}"
+
+    async def _tick(self) -> None:
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(now - started - self.interval, 0.0)
+            self.current_lag = lag
+            self._samples.append(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+            if lag >= self.threshold:
+                self._record(lag)
+            self._capture = None
+
+    def _watch(self) -> None:
+        poll = max(min(self.threshold / 4, self.interval), 0.005)
+        captured_for = None
+        while not self._stop.wait(poll):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            if stalled < self.threshold or captured_for == heartbeat:
+                continue
+            captured_for = heartbeat
+            frame = sys._current_frames().get(self._loop_thread)
+            try:
+                task = asyncio.current_task(self._loop)
+            except RuntimeError:
+                task = None
+            self._capture = {
+                "origem": self._describe(task),
+                "pilha": traceback.format_stack(frame)[-self.max_frames:] if frame is not None else []
+            }
+            del frame
+
+    def _record(self, lag: float) -> None:
+        capture = self._capture or {"origem": "desconhecida", "pilha": []}
+        origin = capture["origem"]
+        self.blocks += 1
+        self.blocked_time += lag
+        key = origin if origin in self.by_route or len(self.by_route) < self.max_origins else "outras"
+        totals = self.by_route.get(key)
+        if totals is None:
+            totals = self.by_route[key] = {"bloqueios": 0, "total_ms": 0.0, "max_ms": 0.0}
+        totals["bloqueios"] += 1
+        totals["total_ms"] += lag * 1000
+        totals["max_ms"] = max(totals["max_ms"], lag * 1000)
+        self.events.append({
+            "em": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "duracao_ms": round(lag * 1000, 1),
+            "origem": origin,
+            "pilha": [line.rstrip() for line in capture["pilha"]]
+        })
+        where = capture["pilha"][-1].strip().splitlines()[0] if capture["pilha"] else "pilha não capturada"
+        print(f"[Loop] Event loop bloqueado por {lag * 1000:.0f} ms em {origin} ({where})")
+
+    # Consulta
+    def stats(self) -> Dict[str, Any]:
+        samples = sorted(self._samples)
+        p99 = samples[min(int(len(samples) * 0.99), len(samples) - 1)] if samples else 0.0
+        return {
+            "lag_atual_ms": round(self.current_lag * 1000, 1),
+            "lag_max_ms": round(self.max_lag * 1000, 1),
+            "lag_medio_ms": round(sum(samples) / len(samples) * 1000, 2) if samples else 0.0,
+            "lag_p99_ms": round(p99 * 1000, 1),
+            "limite_ms": round(self.threshold * 1000),
+            "bloqueios": self.blocks,
+            "tempo_bloqueado_ms": round(self.blocked_time * 1000, 1)
+        }
+
+    def report(self, top: int = 20) -> Dict[str, Any]:
+        """Estatísticas, tempo bloqueado por rota e bloqueios recentes com pilha"""
+        routes: List[Dict[str, Any]] = sorted(
+            ({"origem": origin, "bloqueios": int(t["bloqueios"]), "total_ms": round(t["total_ms"], 1),
+              "max_ms": round(t["max_ms"], 1)} for origin, t in self.by_route.items()),
+            key=lambda item: item["total_ms"], reverse=True
+        )
+        return {
+            **self.stats(),
+            "por_origem": routes[:top],
+            "recentes": list(reversed(self.events))
+        }
+
+
+def route_label(scope: Dict) -> str:
+    """
+    "MÉTODO /modelo/{param}" da rota casada, para /api/ranking/123 e
+    /api/ranking/456 somarem na mesma origem
+    """
+    path = getattr(scope.get("route"), "path", None)
+    if path is None:
+        # Antes do roteamento, arquivos estáticos ou 404
+        return f"{scope['method']} (fora das rotas)"
+    return f"{scope['method']} {path}"
+
+
+class LoopMonitorMiddleware:
+    """Middleware ASGI que associa a tarefa de cada requisição à sua rota"""
+
+    def __init__(self, app, monitor: LoopMonitor):
+        self.app = app
+        self.monitor = monitor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        task = asyncio.current_task()
+        self.monitor.routes[task] = scope
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.monitor.routes.pop(task, None)
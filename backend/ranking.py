@@ -0,0 +1,126 @@
+"""
+Índice do ranking de saldo
+Lista ordenada (saldo desc, user_id) dos usuários com saldo positivo, mantida
+a cada movimentação de saldo. Páginas do leaderboard saem em O(K) e a posição
+de um usuário em O(log n), sem converter e ordenar saldo.json a cada request.
+A conferência de saldo.json (disco e, às vezes, compactação do journal) roda
+no pool de threads; só a consulta em memória roda no event loop.
+"""
+
+import threading
+from bisect import bisect_left, insort
+from typing import Any, Dict, List, Optional, Tuple
+
+from async_io import run_blocking
+from storage_engine import StorageEngine
+
+RankKey = Tuple[float, str]
+
+
+class RankingIndex:
+    """
+    Ranking incremental alimentado pelos listeners de saldo do motor
+
+    Quando o motor avisa que todos os saldos foram recarregados (ex.: o bot
+    reescreveu saldo.json) o índice é reconstruído na próxima leitura.
+    """
+
+    def __init__(self, engine: StorageEngine):
+        self.engine = engine
+        self._lock = threading.Lock()
+        self._keys: List[RankKey] = []
+        self._scores: Dict[str, float] = {}
+        self._stale = True
+        self._rebuilding = False
+        self._replay: Dict[str, float] = {}
+        self.updates = 0
+        self.rebuilds = 0
+        engine.subscribe_saldo(self._on_change)
+
+    # Manutenção
+    def _on_change(self, changes: Optional[Dict[str, float]]) -> None:
+        with self._lock:
+            if changes is None:
+                self._stale = True
+                return
+            for user_id, balance in changes.items():
+                self._set(str(user_id), balance)
+                if self._rebuilding:
+                    self._replay[str(user_id)] = balance
+            self.updates += len(changes)
+
+    def _set(self, user_id: str, balance: float) -> None:
+        old = self._scores.pop(user_id, None)
+        if old is not None:
+            i = bisect_left(self._keys, (-old, user_id))
+            if i < len(self._keys) and self._keys[i] == (-old, user_id):
+                del self._keys[i]
+        if balance > 0:
+            self._scores[user_id] = balance
+            insort(self._keys, (-balance, user_id))
+
+    def _ensure_fresh(self) -> None:
+        """Bloqueante: use refresh() no event loop"""
+        # Dispara a detecção de alterações externas (pode chamar _on_change(None))
+        self.engine.sync_saldo()
+        with self._lock:
+            if not self._stale:
+                return
+            self._stale = False
+            self._rebuilding = True
+            self._replay = {}
+
+        # Lê os saldos fora do lock: o motor chama _on_change com o próprio lock
+        try:
+            snapshot = self.engine.saldo_snapshot()
+        except Exception:
+            with self._lock:
+                self._stale = True
+                self._rebuilding = False
+            raise
+
+        scores = {user_id: balance for user_id, balance in snapshot.items() if balance > 0}
+        keys = sorted((-balance, user_id) for user_id, balance in scores.items())
+        with self._lock:
+            self._scores = scores
+            self._keys = keys
+            # Movimentações que chegaram durante a leitura
+            for user_id, balance in self._replay.items():
+                self._set(user_id, balance)
+            self._replay = {}
+            self._rebuilding = False
+            self.rebuilds += 1
+
+    async def refresh(self) -> None:
+        """Confere saldo.json e reconstrói o índice se preciso, fora do event loop"""
+        await run_blocking(self._ensure_fresh)
+
+    # Consulta
+    async def page(self, limit: int = 50, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """Retorna (entradas da página, total de usuários no ranking)"""
+        await self.refresh()
+        with self._lock:
+            keys = self._keys[offset:offset + limit]
+            total = len(self._keys)
+        return [
+            {"user_id": user_id, "saldo": -negative, "posicao": offset + i + 1}
+            for i, (negative, user_id) in enumerate(keys)
+        ], total
+
+    async def rank_of(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Posição de um usuário ou None se ele não está no ranking (saldo <= 0)"""
+        await self.refresh()
+        with self._lock:
+            balance = self._scores.get(user_id)
+            if balance is None:
+                return None
+            position = bisect_left(self._keys, (-balance, user_id)) + 1
+            total = len(self._keys)
+        return {"user_id": user_id, "saldo": balance, "posicao": position, "total": total}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "usuarios": len(self._keys),
+            "atualizacoes": self.updates,
+            "reconstrucoes": self.rebuilds
+        }
@@ -0,0 +1,344 @@
+"""
+Journal de saldo
+Cada crédito/débito vira uma linha NDJSON (user_id, delta, motivo, timestamp)
+e os saldos atuais ficam em memória, reconstruídos a partir do último snapshot
+mais o final do journal. A compactação em segundo plano grava um novo snapshot,
+exporta saldo.json para o bot Node e trunca o journal; ela roda no máximo
+compact_interval segundos depois da primeira movimentação pendente, que é o
+atraso máximo com que o bot vê um saldo alterado pelo painel.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import json_codec
+from storage import VersionConflict, atomic_write, read_json_view, stat_signature, storage_writer
+
+# Tentativas de exportar saldo.json quando o bot o reescreve durante a compactação
+COMPACT_RETRIES = 5
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+class SaldoJournal:
+    """
+    Saldos em memória com journal append-only
+
+    Args:
+        saldo_path: saldo.json exportado para o bot
+        journal_path: Arquivo NDJSON com as movimentações
+        snapshot_path: Último snapshot compactado
+        compact_entries: Compacta quando o journal passa desse número de linhas
+        compact_interval: Compacta (e exporta saldo.json) no máximo esse tempo
+            (segundos) depois da primeira movimentação ainda não exportada
+        fsync: Faz fsync a cada movimentação (mais seguro, mais lento)
+        on_change: Chamado com {user_id: novo saldo} a cada movimentação, ou
+            None quando os saldos foram recarregados de saldo.json
+    """
+
+    def __init__(self, saldo_path: str, journal_path: str, snapshot_path: str,
+                 compact_entries: int = 1000, compact_interval: float = 1.0, fsync: bool = False,
+                 on_change: Optional[Callable[[Optional[Dict[str, float]]], None]] = None):
+        self.saldo_path = saldo_path
+        self.journal_path = journal_path
+        self.snapshot_path = snapshot_path
+        self.compact_entries = compact_entries
+        self.compact_interval = compact_interval
+        self.fsync = fsync
+        self.on_change = on_change
+
+        self._lock = threading.RLock()
+        self._cond = threading.Condition(self._lock)
+        self._balances: Dict[str, float] = {}
+        self._tail: List[Dict] = []
+        # Quando a movimentação mais antiga ainda não exportada chegou (monotonic)
+        self._pending_since: Optional[float] = None
+        self._seq = 0
+        self._snapshot_seq = 0
+        self._file_signature = None
+        self._positive = 0
+        self._total = 0.0
+        self._journal = None
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.appends = 0
+        self.compactions = 0
+        self.rebases = 0
+
+        self._load()
+
+    # Carga
+    def _read_journal(self, after_seq: int) -> List[Dict]:
+        entries = []
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json_codec.loads(line)
+                    except json_codec.DecodeError:
+                        # Última linha cortada por uma queda no meio da escrita
+                        continue
+                    if entry.get("seq", 0) > after_seq:
+                        entries.append(entry)
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def _load(self) -> None:
+        snapshot = read_json_view(self.snapshot_path)
+        file_doc = read_json_view(self.saldo_path)
+        try:
+            file_signature = stat_signature(os.stat(self.saldo_path))
+        except FileNotFoundError:
+            file_signature = None
+
+        if snapshot:
+            self._snapshot_seq = snapshot.get("seq", 0)
+            base = {str(k): _to_float(v) for k, v in snapshot.get("saldos", {}).items()}
+        else:
+            base = {str(k): _to_float(v) for k, v in file_doc.items()}
+
+        tail = self._read_journal(self._snapshot_seq)
+        replayed = dict(base)
+        for entry in tail:
+            replayed[entry["user_id"]] = replayed.get(entry["user_id"], 0.0) + entry["delta"]
+
+        file_balances = {str(k): _to_float(v) for k, v in file_doc.items()}
+        external = (
+            snapshot
+            and file_signature is not None
+            and tuple(snapshot.get("arquivo") or ()) != file_signature
+            and file_balances != replayed
+            and file_balances != base
+        )
+        if external:
+            # O bot alterou saldo.json enquanto o painel estava parado: o arquivo
+            # vira a base e as movimentações ainda não exportadas são reaplicadas
+            print("[Saldo] saldo.json alterado externamente, reaplicando o journal sobre ele")
+            replayed = dict(file_balances)
+            for entry in tail:
+                replayed[entry["user_id"]] = replayed.get(entry["user_id"], 0.0) + entry["delta"]
+            self.rebases += 1
+
+        self._balances = replayed
+        self._tail = tail
+        self._seq = max([self._snapshot_seq] + [e.get("seq", 0) for e in tail])
+        self._file_signature = file_signature
+        self._recount()
+        self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+        if external or not snapshot:
+            self.compact()
+        elif tail:
+            # Movimentações de antes do reinício ainda não exportadas
+            self._pending_since = time.monotonic()
+            self._ensure_thread()
+
+    def _recount(self) -> None:
+        self._positive = sum(1 for v in self._balances.values() if v > 0)
+        self._total = sum(self._balances.values())
+
+    def _check_external(self) -> None:
+        """Reaplica as movimentações pendentes se o bot reescreveu saldo.json"""
+        try:
+            signature = stat_signature(os.stat(self.saldo_path))
+        except FileNotFoundError:
+            return
+        if signature == self._file_signature:
+            return
+
+        with self._lock:
+            if signature == self._file_signature:
+                return
+            self._rebase(signature)
+            if self._tail:
+                self.compact()
+
+    def _rebase(self, signature) -> None:
+        """saldo.json vira a base e as movimentações ainda não exportadas são reaplicadas"""
+        file_doc = read_json_view(self.saldo_path)
+        balances = {str(k): _to_float(v) for k, v in file_doc.items()}
+        for entry in self._tail:
+            balances[entry["user_id"]] = balances.get(entry["user_id"], 0.0) + entry["delta"]
+        self._balances = balances
+        self._file_signature = signature
+        self._recount()
+        self.rebases += 1
+        if self.on_change is not None:
+            self.on_change(None)
+
+    def refresh(self) -> None:
+        """Recarrega saldo.json se o bot o alterou desde a última leitura"""
+        self._check_external()
+
+    # Leitura
+    def balances(self) -> Dict[str, float]:
+        """Cópia consistente dos saldos atuais (pode ser percorrida em outra thread)"""
+        return self.snapshot()
+
+    def snapshot(self) -> Dict[str, float]:
+        """Cópia consistente dos saldos atuais"""
+        self._check_external()
+        with self._lock:
+            return dict(self._balances)
+
+    def get(self, user_id: str) -> Optional[float]:
+        self._check_external()
+        return self._balances.get(user_id)
+
+    def summary(self) -> Tuple[int, int, float]:
+        """Retorna (usuários, usuários com saldo > 0, saldo total) em O(1)"""
+        self._check_external()
+        return len(self._balances), self._positive, self._total
+
+    # Escrita
+    def apply(self, user_id: str, delta: float, reason: Optional[str] = None) -> float:
+        """
+        Registra uma movimentação e retorna o novo saldo
+
+        Args:
+            user_id: ID do usuário
+            delta: Valor a somar (negativo para débito)
+            reason: Motivo livre gravado no journal
+        """
+        self._check_external()
+        with self._lock:
+            self._seq += 1
+            entry = {
+                "seq": self._seq,
+                "user_id": user_id,
+                "delta": delta,
+                "reason": reason,
+                "timestamp": datetime.now(timezone.utc).isoformat()
+            }
+            self._journal.write(json_codec.dumps_str(entry) + "\n")
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+
+            old = self._balances.get(user_id, 0.0)
+            new = old + delta
+            self._balances[user_id] = new
+            self._positive += (new > 0) - (old > 0)
+            self._total += delta
+            self._tail.append(entry)
+            self.appends += 1
+            if self.on_change is not None:
+                self.on_change({user_id: new})
+
+            if self._pending_since is None:
+                # A thread passa a contar o prazo de exportação a partir daqui
+                self._pending_since = time.monotonic()
+                self._cond.notify()
+            elif len(self._tail) >= self.compact_entries:
+                self._cond.notify()
+            self._ensure_thread()
+            return new
+
+    # Compactação
+    def compact(self) -> None:
+        """
+        Exporta saldo.json, grava o snapshot e trunca o journal
+
+        Se o bot reescreveu saldo.json desde a última leitura, o arquivo vira a
+        base antes da exportação; a gravação é um compare-and-swap, então uma
+        reescrita durante a compactação também é reaplicada em vez de perdida.
+        """
+        with self._lock:
+            # 1) saldo.json para o bot, 2) snapshot apontando para esse arquivo,
+            # 3) journal truncado. Uma queda entre os passos é detectada no _load
+            for _ in range(COMPACT_RETRIES):
+                version = storage_writer.version(self.saldo_path)
+                if version[1] is not None and version[1] != self._file_signature:
+                    self._rebase(version[1])
+                balances = dict(self._balances)
+                seq = self._seq
+                try:
+                    st = storage_writer.write_now(self.saldo_path, balances, expected_version=version)
+                    break
+                except VersionConflict:
+                    continue
+            else:
+                print("[Saldo] saldo.json mudou durante a compactação, tentando de novo na próxima")
+                return
+            if st is None:
+                return
+            self._file_signature = stat_signature(st)
+
+            snapshot = {
+                "seq": seq,
+                "saldos": balances,
+                "arquivo": list(self._file_signature),
+                "criado_em": datetime.now(timezone.utc).isoformat()
+            }
+            atomic_write(self.snapshot_path, json_codec.dumps(snapshot))
+            self._snapshot_seq = seq
+
+            if self._journal is not None:
+                self._journal.close()
+            self._journal = open(self.journal_path, 'w', encoding='utf-8')
+            self._tail = []
+            self._pending_since = None
+            # Corrige a deriva de ponto flutuante da soma incremental
+            self._recount()
+            self.compactions += 1
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None and not self._closed:
+            self._thread = threading.Thread(target=self._run, name="saldo-compactor", daemon=True)
+            self._thread.start()
+
+    def _due_in(self) -> Optional[float]:
+        """Segundos até a próxima compactação (None: nada pendente)"""
+        if not self._tail:
+            return None
+        if len(self._tail) >= self.compact_entries or self._pending_since is None:
+            return 0.0
+        return self._pending_since + self.compact_interval - time.monotonic()
+
+    def _run(self) -> None:
+        with self._cond:
+            while not self._closed:
+                due = self._due_in()
+                if due is None or due > 0:
+                    self._cond.wait(due)
+                    continue
+                try:
+                    self.compact()
+                except Exception as e:
+                    print(f"[Saldo] Erro na compactação: {e}")
+                if self._tail:
+                    # Não exportou (erro ou conflito): tenta de novo depois de outro intervalo
+                    self._pending_since = time.monotonic()
+
+    def close(self) -> None:
+        with self._cond:
+            if self._tail:
+                self.compact()
+            self._closed = True
+            self._cond.notify()
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "usuarios": len(self._balances),
+            "seq": self._seq,
+            "snapshot_seq": self._snapshot_seq,
+            "pendentes_compactacao": len(self._tail),
+            "movimentacoes": self.appends,
+            "compactacoes": self.compactions,
+            "rebases": self.rebases
+        }
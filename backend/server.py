@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
@@ -8,20 +8,72 @@ import os
 import hashlib
 import jwt
 from datetime import datetime, timedelta, timezone
-import subprocess
 import uuid
-import requests
+import httpx
 import asyncio
-import zipfile
-import io
 from fastapi.responses import StreamingResponse, FileResponse, HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 import secrets
 import string
 import shutil
+from storage import document_cache, storage_writer, resource_locks, read_json_view, update_json_file, write_json_file
+from storage_engine import create_engine
+from json_codec import FastJSONResponse
+from log_pipeline import ActionLogPipeline
+from action_log import decode_cursor, encode_cursor, matches, sort_key
+from action_rollups import ActionRollups, RevenueIndex
+from ranking import RankingIndex
+from discord_client import discord_client
+from discord_profiles import ProfileCache, ProfileService
+from bot_status import BotStatusMonitor
+from single_flight import single_flight
+from async_io import run_blocking, http_client
+from archive_cache import ArchiveCache, file_response
+import async_io
+from loop_monitor import LoopMonitor, LoopMonitorMiddleware
+from webhook_dispatcher import WebhookDispatcher, WebhookRouter
+from backup_store import BackupStore
+from backup_scheduler import BackupScheduler
+from contextlib import asynccontextmanager
+
+background_tasks: List[asyncio.Task] = []
+
+async def start_background_tasks():
+    background_tasks.append(asyncio.ensure_future(warm_profile_cache()))
+    background_tasks.append(bot_status_monitor.start())
+    background_tasks.append(loop_monitor.start())
+    background_tasks.append(webhook_dispatcher.start())
+    background_tasks.append(backup_scheduler.start())
+    archive_task = project_archive.start()
+    if archive_task is not None:
+        background_tasks.append(archive_task)
+
+async def flush_storage():
+    """Grava as escritas pendentes antes de encerrar"""
+    for task in background_tasks:
+        task.cancel()
+    loop_monitor.stop()
+    action_log_pipeline.close()
+    action_rollups.close()
+    engine.close()
+    profile_service.cancel_pending()
+    await webhook_dispatcher.aclose()
+    await discord_client.aclose()
+    await async_io.aclose()
+    profile_cache.close()
+    storage_writer.flush()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Tarefas em segundo plano durante a vida do servidor (os serviços são criados mais abaixo)"""
+    await start_background_tasks()
+    try:
+        yield
+    finally:
+        await flush_storage()
 
-app = FastAPI(title="Discord Bot Admin Panel")
+app = FastAPI(title="Discord Bot Admin Panel", default_response_class=FastJSONResponse, lifespan=lifespan)
 
 security = HTTPBearer()
 
@@ -34,6 +86,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Monitor do event loop: lag contínuo e bloqueios acima de LOOP_SLOW_MS com pilha e rota
+loop_monitor = LoopMonitor(
+    interval=int(os.getenv("LOOP_MONITOR_INTERVAL_MS", "50")) / 1000,
+    threshold=int(os.getenv("LOOP_SLOW_MS", "100")) / 1000
+)
+app.add_middleware(LoopMonitorMiddleware, monitor=loop_monitor)
+
 # Static files configuration (Frontend React)
 BASE_DIR = Path(__file__).resolve().parent.parent
 FRONTEND_BUILD_DIR = BASE_DIR / "frontend" / "build"
@@ -47,6 +106,70 @@ JWT_SECRET = "2210DORRY90_SECRET_KEY_VOVO"
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
+# Storage engine (STORAGE_ENGINE=json|sqlite)
+engine = create_engine()
+
+# Ranking de saldo mantido a cada movimentação
+ranking_index = RankingIndex(engine)
+# Tempo máximo esperando perfis do Discord antes de responder com provisórios
+RANKING_PROFILE_BUDGET = int(os.getenv("RANKING_PROFILE_BUDGET_MS", "800")) / 1000
+
+# Cache de perfis do Discord (memória LRU + SQLite) e aquecimento do topo do ranking
+profile_cache = ProfileCache(
+    "./DataBaseJson/discord_profiles.db",
+    ttl=int(os.getenv("PROFILE_CACHE_TTL_S", "21600")),
+    max_entries=int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "5000")),
+    miss_ttl=int(os.getenv("PROFILE_CACHE_MISS_TTL_S", "300"))
+)
+profile_service = ProfileService(profile_cache, discord_client)
+PROFILE_WARM_TOP = int(os.getenv("PROFILE_WARM_TOP", "100"))
+PROFILE_WARM_BATCH = max(int(os.getenv("PROFILE_WARM_BATCH", "25")), 1)
+PROFILE_WARM_INTERVAL = int(os.getenv("PROFILE_WARM_INTERVAL_S", "600"))
+
+# Entrega de webhooks: caixa de saída persistente, novas tentativas e fila de mortos
+webhook_dispatcher = WebhookDispatcher(
+    "./DataBaseJson/webhook_outbox.db",
+    http_client,
+    max_concurrency=int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "20")),
+    endpoint_concurrency=int(os.getenv("WEBHOOK_ENDPOINT_CONCURRENCY", "2")),
+    max_attempts=int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8")),
+    backoff_base=float(os.getenv("WEBHOOK_BACKOFF_BASE_S", "2")),
+    backoff_max=float(os.getenv("WEBHOOK_BACKOFF_MAX_S", "600")),
+    timeout=float(os.getenv("WEBHOOK_TIMEOUT_S", "10")),
+    batch_window=int(os.getenv("WEBHOOK_BATCH_WINDOW_MS", "0")) / 1000,
+    batch_max=int(os.getenv("WEBHOOK_BATCH_MAX", "100"))
+)
+webhook_router = WebhookRouter(engine.list_webhooks, engine.webhooks_version)
+
+# Backups incrementais: blobs por conteúdo + um manifesto por backup
+backup_store = BackupStore("./backups", "./DataBaseJson")
+# Retenção: últimos N + o mais recente de cada dia/semana (0 desliga cada regra)
+BACKUP_KEEP_LAST = int(os.getenv("BACKUP_KEEP_LAST", "10"))
+BACKUP_KEEP_DAILY = int(os.getenv("BACKUP_KEEP_DAILY", "7"))
+BACKUP_KEEP_WEEKLY = int(os.getenv("BACKUP_KEEP_WEEKLY", "4"))
+
+# Agregados horários dos logs (analytics) e receita do histórico
+action_rollups = ActionRollups(
+    "./DataBaseJson/action_logs/rollups.json",
+    retention_days=int(os.getenv("ACTION_ROLLUP_RETENTION_DAYS", "400"))
+)
+action_rollups.catch_up(engine.list_actions(since=action_rollups.watermark_timestamp))
+revenue_index = RevenueIndex("./DataBaseJson/historico.json")
+
+def record_actions(batch: List[Dict]):
+    """Grava um lote de logs e atualiza os agregados"""
+    engine.append_actions(batch)
+    action_rollups.add(batch)
+
+# Logs de ações gravados em lote por uma thread em segundo plano
+action_log_pipeline = ActionLogPipeline(
+    record_actions,
+    batch_size=int(os.getenv("ACTION_LOG_BATCH_SIZE", "200")),
+    flush_interval_ms=int(os.getenv("ACTION_LOG_FLUSH_MS", "200")),
+    max_queue=int(os.getenv("ACTION_LOG_MAX_QUEUE", "10000")),
+    max_wait_ms=int(os.getenv("ACTION_LOG_MAX_WAIT_MS", "2000"))
+)
+
 # Models
 class LoginRequest(BaseModel):
     username: str
@@ -142,147 +265,115 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security))
         raise HTTPException(status_code=401, detail="Erro de autenticação")
 
 # Database helpers
-def read_json_file(filepath: str) -> Dict:
+def parse_log_timestamp(value: str) -> str:
+    """Normaliza um timestamp ISO (sem fuso = UTC) para o formato gravado nos logs"""
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}
-
-def write_json_file(filepath: str, data: Dict) -> None:
-    os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-
-def log_action(action: str, user_id: str = None, details: Dict = None):
-    """Registra ações do sistema"""
-    logs = read_json_file("./DataBaseJson/action_logs.json")
-    if "logs" not in logs:
-        logs["logs"] = []
-    
-    log_entry = {
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Data inválida: {value}")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).isoformat()
+
+def action_entry(action: str, user_id: str = None, details: Dict = None) -> Dict:
+    return {
         "timestamp": datetime.now(timezone.utc).isoformat(),
         "action": action,
         "user_id": user_id,
         "details": details or {},
         "id": str(uuid.uuid4())
     }
-    
-    logs["logs"].append(log_entry)
-    
-    # Manter apenas últimos 1000 logs
-    if len(logs["logs"]) > 1000:
-        logs["logs"] = logs["logs"][-1000:]
-    
-    write_json_file("./DataBaseJson/action_logs.json", logs)
+
+async def log_action(action: str, user_id: str = None, details: Dict = None):
+    """Registra ações do sistema (com a fila cheia espera vaga sem travar o event loop)"""
+    await action_log_pipeline.asubmit(action_entry(action, user_id, details))
+
+def log_action_sync(action: str, user_id: str = None, details: Dict = None):
+    """log_action para código síncrono em threads (ex.: backups); bloqueia com a fila cheia"""
+    action_log_pipeline.submit(action_entry(action, user_id, details))
 
 async def send_webhook(event: str, data: Dict):
-    """Envia notificação via webhook"""
+    """Enfileira a notificação para os webhooks do evento (entrega em segundo plano)"""
     try:
-        webhooks = read_json_file("./DataBaseJson/webhooks.json")
-        active_webhooks = webhooks.get("webhooks", [])
-        
-        for webhook in active_webhooks:
-            if webhook.get("ativo", False) and event in webhook.get("eventos", []):
-                payload = {
-                    "event": event,
-                    "timestamp": datetime.now(timezone.utc).isoformat(),
-                    "data": data
-                }
-                
-                requests.post(webhook["url"], json=payload, timeout=10)
+        targets = await run_blocking(webhook_router.targets, event)
+        if targets:
+            payload = {
+                "event": event,
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "data": data
+            }
+            await webhook_dispatcher.aenqueue(targets, payload)
     except Exception as e:
         print(f"Erro ao enviar webhook: {e}")
 
 def auto_backup():
-    """Cria backup automático dos dados"""
+    """Cria backup incremental dos dados (só conteúdo novo ocupa espaço)"""
     try:
-        backup_dir = "./backups"
-        os.makedirs(backup_dir, exist_ok=True)
-        
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_path = f"{backup_dir}/backup_{timestamp}.zip"
-        
-        with zipfile.ZipFile(backup_path, 'w') as zipf:
-            for file in os.listdir("./DataBaseJson"):
-                if file.endswith('.json'):
-                    zipf.write(f"./DataBaseJson/{file}", file)
-        
-        log_action("auto_backup", details={"backup_file": backup_path})
-        return backup_path
+        # Grava antes o que ainda está pendente no escritor em segundo plano
+        storage_writer.flush()
+        manifest = backup_store.create()
+        log_action_sync("auto_backup", details={
+            "backup": manifest["nome"],
+            "arquivos": len(manifest["arquivos"]),
+            "novos_bytes": manifest["novos_bytes"]
+        })
     except Exception as e:
         print(f"Erro no backup: {e}")
         return None
-
-async def get_discord_user_info(user_id: str, bot_token: str) -> Dict:
-    """Busca informações do usuário no Discord incluindo avatar"""
     try:
-        headers = {
-            'Authorization': f'Bot {bot_token}',
-            'Content-Type': 'application/json'
-        }
-        
-        response = requests.get(
-            f'https://discord.com/api/v10/users/{user_id}',
-            headers=headers,
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            user_data = response.json()
-            avatar_hash = user_data.get('avatar')
-            
-            # Construir URL do avatar
-            if avatar_hash:
-                avatar_url = f"https://cdn.discordapp.com/avatars/{user_id}/{avatar_hash}.png?size=128"
-            else:
-                # Avatar padrão
-                discriminator = user_data.get('discriminator', '0000')
-                default_avatar_id = int(discriminator) % 5
-                avatar_url = f"https://cdn.discordapp.com/embed/avatars/{default_avatar_id}.png"
-            
-            return {
-                'id': user_data.get('id'),
-                'username': user_data.get('username', 'Unknown'),
-                'discriminator': user_data.get('discriminator', '0000'),
-                'global_name': user_data.get('global_name'),
-                'avatar_url': avatar_url
-            }
+        pruned = backup_store.prune(BACKUP_KEEP_LAST, BACKUP_KEEP_DAILY, BACKUP_KEEP_WEEKLY)
+        if pruned["removidos"]:
+            log_action_sync("backup_retention", details=pruned)
     except Exception as e:
-        print(f"Erro ao buscar usuário {user_id}: {e}")
-    
-    return {
-        'id': user_id,
-        'username': 'Usuário Desconhecido',
-        'discriminator': '0000',
-        'global_name': None,
-        'avatar_url': 'https://cdn.discordapp.com/embed/avatars/0.png'
-    }
+        print(f"Erro na retenção de backups: {e}")
+    return manifest
+
+backup_scheduler = BackupScheduler(
+    auto_backup,
+    lambda: read_json_view("./DataBaseJson/system_config.json"),
+    backup_store.latest_created_at,
+    check_interval=float(os.getenv("BACKUP_CHECK_INTERVAL_S", "60"))
+)
+
+async def get_discord_user_info(user_id: str, bot_token: str) -> Dict:
+    """Busca informações do usuário no Discord incluindo avatar (via cache de perfis)"""
+    return await profile_service.get_profile(user_id, bot_token)
+
+async def enrich_with_profiles(users: List[Dict], bot_token: str, budget: float) -> None:
+    """
+    Preenche username/avatar_url dos usuários a partir do cache de perfis
+
+    Perfis fora do cache que não chegarem dentro do orçamento de latência
+    (segundos) ficam com dados provisórios e perfil_pendente = True; a busca
+    continua em segundo plano e a próxima requisição já sai do cache.
+    """
+    await profile_service.enrich(users, bot_token, budget)
+
+async def warm_profile_cache():
+    """Mantém no cache os perfis do topo do ranking, em lotes"""
+    while True:
+        try:
+            bot_token = await run_blocking(get_bot_token)
+            if bot_token and PROFILE_WARM_TOP > 0:
+                top, _ = await ranking_index.page(PROFILE_WARM_TOP, 0)
+                user_ids = [entry["user_id"] for entry in top]
+                fetched = 0
+                for i in range(0, len(user_ids), PROFILE_WARM_BATCH):
+                    fetched += await profile_service.warm(user_ids[i:i + PROFILE_WARM_BATCH], bot_token)
+                if fetched:
+                    print(f"[Perfis] {fetched} perfis do topo do ranking atualizados")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[Perfis] Erro ao aquecer cache: {e}")
+        await asyncio.sleep(PROFILE_WARM_INTERVAL)
 
 def get_bot_stats() -> Dict:
-    config = read_json_file("./DataBaseJson/config.json")
-    saldo_data = read_json_file("./DataBaseJson/saldo.json")
-    historico = read_json_file("./DataBaseJson/historico.json")
-    blacklist = read_json_file("./DataBaseJson/blacklist.json")
-    coupons = read_json_file("./DataBaseJson/coupons.json")
-    
+    config = read_json_view("./DataBaseJson/config.json")
     stats = config.get("estatisticas", {})
     
     # Contar usuários com saldo > 0 e calcular total
-    users_with_balance = 0
-    total_balance = 0.0
-    total_users = len(saldo_data)
-    
-    for user, balance in saldo_data.items():
-        try:
-            balance = float(balance)
-        except (ValueError, TypeError):
-            balance = 0.0
-            
-        if balance > 0:
-            users_with_balance += 1
-            
-        total_balance += balance
+    total_users, users_with_balance, total_balance = engine.saldo_summary()
     
     return {
         "vendas_totais": stats.get("vendas_totais", 0),
@@ -292,34 +383,23 @@ def get_bot_stats() -> Dict:
         "usuarios_com_saldo": users_with_balance,
         "saldo_total_sistema": total_balance,
         "sms_saldo": config.get("sms24h", {}).get("saldo", 0),
-        "usuarios_blacklist": len(blacklist.get("users", [])),
-        "cupons_ativos": len([c for c in coupons.get("coupons", []) if c.get("ativo", True)]),
+        "usuarios_blacklist": engine.count_blacklist(),
+        "cupons_ativos": engine.count_active_coupons(),
         "status": "online"
     }
 
 async def check_discord_bot_status(token: str) -> Dict:
     """Verifica se o bot Discord está realmente online"""
     try:
-        headers = {
-            'Authorization': f'Bot {token}',
-            'Content-Type': 'application/json'
-        }
-        
         # Fazer uma requisição para a API do Discord para verificar o bot
-        response = requests.get(
-            'https://discord.com/api/v10/users/@me',
-            headers=headers,
-            timeout=10
-        )
+        response = await discord_client.request("GET", "/users/@me", token)
         
         if response.status_code == 200:
             bot_data = response.json()
             
-            # Verificar se o bot está em servidores
-            guilds_response = requests.get(
-                'https://discord.com/api/v10/users/@me/guilds',
-                headers=headers,
-                timeout=10
+            # Verificar se o bot está em servidores (with_counts traz approximate_member_count)
+            guilds_response = await discord_client.request(
+                "GET", "/users/@me/guilds", token, params={"with_counts": "true"}
             )
             
             guild_count = 0
@@ -348,6 +428,14 @@ async def check_discord_bot_status(token: str) -> Dict:
                 'total_members': 0,
                 'lastSeen': None
             }
+        elif response.status_code == 429:
+            return {
+                'status': 'error',
+                'message': 'Limite de requisições do Discord atingido',
+                'guilds': 0,
+                'total_members': 0,
+                'lastSeen': None
+            }
         else:
             return {
                 'status': 'error',
@@ -357,7 +445,7 @@ async def check_discord_bot_status(token: str) -> Dict:
                 'lastSeen': None
             }
             
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         return {
             'status': 'error',
             'message': 'Timeout ao conectar com Discord',
@@ -374,22 +462,36 @@ async def check_discord_bot_status(token: str) -> Dict:
             'lastSeen': None
         }
 
-def restart_discord_bot() -> bool:
+def get_bot_token() -> str:
+    return read_json_view("./config.json").get("token", "")
+
+# Status do bot verificado em segundo plano; o dashboard lê o último snapshot
+bot_status_monitor = BotStatusMonitor(
+    check_discord_bot_status,
+    get_bot_token,
+    interval=int(os.getenv("BOT_STATUS_INTERVAL_S", "60"))
+)
+
+async def restart_discord_bot() -> bool:
     """Reinicia o processo do bot Discord"""
     try:
         # Primeiro, tentar parar o processo atual do bot (se estiver rodando)
-        result = subprocess.run(['pkill', '-f', 'node.*index.js'], capture_output=True)
+        stop = await asyncio.create_subprocess_exec(
+            'pkill', '-f', 'node.*index.js',
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        await stop.wait()
         
         # Aguardar um pouco
-        import time
-        time.sleep(2)
+        await asyncio.sleep(2)
         
-        # Iniciar o bot novamente em background
-        subprocess.Popen(
-            ['node', 'index.js'],
+        # Iniciar o bot novamente em background (sem PIPE: ninguém lê a saída)
+        await asyncio.create_subprocess_exec(
+            'node', 'index.js',
             cwd='/app',
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL
         )
         
         return True
@@ -436,7 +538,7 @@ async def login(request: LoginRequest):
     if not verify_credentials(request.username, request.password):
         raise HTTPException(status_code=401, detail="Credenciais inválidas")
     
-    log_action("user_login", details={"username": request.username})
+    await log_action("user_login", details={"username": request.username})
     access_token = create_access_token(data={"sub": request.username})
     return {
         "access_token": access_token,
@@ -448,40 +550,48 @@ async def login(request: LoginRequest):
 async def verify_auth(current_user: str = Depends(verify_token)):
     return {"valid": True, "user": current_user}
 
-@app.get("/api/dashboard/stats")
-async def get_dashboard_stats(current_user: str = Depends(verify_token)):
-    stats = get_bot_stats()
+async def build_dashboard_stats() -> Dict:
+    stats = await asyncio.to_thread(get_bot_stats)
     
-    # Verificar status real do bot
-    config = read_json_file("./config.json")
-    token = config.get("token", "")
-    
-    if token:
-        bot_status = await check_discord_bot_status(token)
+    # Status do bot: último snapshot da verificação em segundo plano
+    bot_status = await bot_status_monitor.snapshot()
+    if bot_status:
         stats["bot_status"] = bot_status["status"]
         stats["bot_guilds"] = bot_status.get("guilds", 0)
         stats["total_members"] = bot_status.get("total_members", 0)
+        stats["bot_status_verificado_em"] = bot_status["verificado_em"]
+        stats["bot_status_idade_s"] = bot_status["idade_s"]
     else:
         stats["bot_status"] = "error"
         stats["bot_guilds"] = 0
         stats["total_members"] = 0
+        stats["bot_status_verificado_em"] = None
+        stats["bot_status_idade_s"] = None
     
     return stats
 
+@app.get("/api/dashboard/stats")
+async def get_dashboard_stats(current_user: str = Depends(verify_token)):
+    # Vários painéis abertos ao mesmo tempo compartilham o mesmo cálculo
+    return await single_flight.do(("dashboard",), build_dashboard_stats)
+
+@app.post("/api/dashboard/bot-status/refresh")
+async def refresh_dashboard_bot_status(current_user: str = Depends(verify_token)):
+    """Verifica o bot no Discord agora, sem esperar o próximo intervalo"""
+    bot_status = await bot_status_monitor.refresh_now()
+    if bot_status is None:
+        raise HTTPException(status_code=400, detail="Token do bot não configurado")
+    return bot_status
+
 # NOVAS FUNCIONALIDADES
 
 # 1. Sistema de Blacklist
 @app.get("/api/blacklist")
 async def get_blacklist(current_user: str = Depends(verify_token)):
-    blacklist = read_json_file("./DataBaseJson/blacklist.json")
-    return {"users": blacklist.get("users", [])}
+    return {"users": await run_blocking(engine.list_blacklist)}
 
 @app.post("/api/blacklist")
 async def add_to_blacklist(request: BlacklistUser, current_user: str = Depends(verify_token)):
-    blacklist = read_json_file("./DataBaseJson/blacklist.json")
-    if "users" not in blacklist:
-        blacklist["users"] = []
-    
     expira_em = None
     if request.duracao_horas:
         expira_em = (datetime.now(timezone.utc) + timedelta(hours=request.duracao_horas)).isoformat()
@@ -494,42 +604,29 @@ async def add_to_blacklist(request: BlacklistUser, current_user: str = Depends(v
         "id": str(uuid.uuid4())
     }
     
-    blacklist["users"].append(blacklist_entry)
-    write_json_file("./DataBaseJson/blacklist.json", blacklist)
+    async with resource_locks.acquire(("blacklist", request.user_id)):
+        await run_blocking(engine.add_blacklist, blacklist_entry)
     
-    log_action("user_blacklisted", request.user_id, {"motivo": request.motivo})
+    await log_action("user_blacklisted", request.user_id, {"motivo": request.motivo})
     await send_webhook("user_blacklisted", blacklist_entry)
     
     return {"message": "Usuário adicionado à blacklist"}
 
 @app.delete("/api/blacklist/{user_id}")
 async def remove_from_blacklist(user_id: str, current_user: str = Depends(verify_token)):
-    blacklist = read_json_file("./DataBaseJson/blacklist.json")
-    if "users" not in blacklist:
-        blacklist["users"] = []
+    async with resource_locks.acquire(("blacklist", user_id)):
+        await run_blocking(engine.remove_blacklist, user_id)
     
-    blacklist["users"] = [u for u in blacklist["users"] if u["user_id"] != user_id]
-    write_json_file("./DataBaseJson/blacklist.json", blacklist)
-    
-    log_action("user_unblacklisted", user_id)
+    await log_action("user_unblacklisted", user_id)
     return {"message": "Usuário removido da blacklist"}
 
 # 2. Sistema de Cupons
 @app.get("/api/coupons")
 async def get_coupons(current_user: str = Depends(verify_token)):
-    coupons = read_json_file("./DataBaseJson/coupons.json")
-    return {"coupons": coupons.get("coupons", [])}
+    return {"coupons": await run_blocking(engine.list_coupons)}
 
 @app.post("/api/coupons")
 async def create_coupon(request: CouponCreate, current_user: str = Depends(verify_token)):
-    coupons = read_json_file("./DataBaseJson/coupons.json")
-    if "coupons" not in coupons:
-        coupons["coupons"] = []
-    
-    # Verificar se código já existe
-    if any(c["codigo"] == request.codigo for c in coupons["coupons"]):
-        raise HTTPException(status_code=400, detail="Código já existe")
-    
     coupon = {
         "codigo": request.codigo,
         "valor": request.valor,
@@ -541,107 +638,95 @@ async def create_coupon(request: CouponCreate, current_user: str = Depends(verif
         "id": str(uuid.uuid4())
     }
     
-    coupons["coupons"].append(coupon)
-    write_json_file("./DataBaseJson/coupons.json", coupons)
+    # Verificar se código já existe
+    async with resource_locks.acquire(("coupon", request.codigo)):
+        if not await run_blocking(engine.create_coupon, coupon):
+            raise HTTPException(status_code=400, detail="Código já existe")
     
-    log_action("coupon_created", details={"codigo": request.codigo, "valor": request.valor})
+    await log_action("coupon_created", details={"codigo": request.codigo, "valor": request.valor})
     return {"message": "Cupom criado com sucesso", "coupon": coupon}
 
 @app.post("/api/coupons/use/{codigo}")
 async def use_coupon(codigo: str, user_id: str, current_user: str = Depends(verify_token)):
-    coupons = read_json_file("./DataBaseJson/coupons.json")
-    
-    # Encontrar cupom
-    coupon = None
-    for c in coupons.get("coupons", []):
-        if c["codigo"] == codigo:
-            coupon = c
-            break
-    
-    if not coupon:
-        raise HTTPException(status_code=404, detail="Cupom não encontrado")
-    
-    if not coupon.get("ativo", False):
-        raise HTTPException(status_code=400, detail="Cupom inativo")
-    
-    if coupon["usos_atual"] >= coupon["usos_maximos"]:
-        raise HTTPException(status_code=400, detail="Cupom esgotado")
-    
-    # Verificar expiração
-    if coupon.get("expira_em"):
-        expira = datetime.fromisoformat(coupon["expira_em"])
-        if datetime.now(timezone.utc) > expira:
-            raise HTTPException(status_code=400, detail="Cupom expirado")
-    
-    # Usar cupom - adicionar saldo
-    saldo_data = read_json_file("./DataBaseJson/saldo.json")
-    if user_id not in saldo_data:
-        saldo_data[user_id] = 0.0
-    
-    saldo_data[user_id] += coupon["valor"]
-    write_json_file("./DataBaseJson/saldo.json", saldo_data)
+    def redeem(coupon: Dict) -> None:
+        # Validação e incremento sobre a versão mais recente do cupom, de forma
+        # atômica: duas requisições não passam juntas pela checagem de usos
+        if not coupon.get("ativo", False):
+            raise HTTPException(status_code=400, detail="Cupom inativo")
+        
+        if coupon["usos_atual"] >= coupon["usos_maximos"]:
+            raise HTTPException(status_code=400, detail="Cupom esgotado")
+        
+        # Verificar expiração
+        if coupon.get("expira_em"):
+            expira = datetime.fromisoformat(coupon["expira_em"])
+            if datetime.now(timezone.utc) > expira:
+                raise HTTPException(status_code=400, detail="Cupom expirado")
+        
+        coupon["usos_atual"] += 1
     
-    # Atualizar cupom
-    coupon["usos_atual"] += 1
-    write_json_file("./DataBaseJson/coupons.json", coupons)
+    async with resource_locks.acquire(("coupon", codigo), ("saldo", user_id)):
+        # Atualizar cupom
+        coupon = await run_blocking(engine.modify_coupon, codigo, redeem)
+        if not coupon:
+            raise HTTPException(status_code=404, detail="Cupom não encontrado")
+        
+        # Usar cupom - adicionar saldo
+        novo_saldo = await run_blocking(engine.adjust_saldo, user_id, coupon["valor"], reason=f"cupom:{codigo}")
     
-    log_action("coupon_used", user_id, {"codigo": codigo, "valor": coupon["valor"]})
+    await log_action("coupon_used", user_id, {"codigo": codigo, "valor": coupon["valor"]})
     await send_webhook("coupon_used", {"codigo": codigo, "user_id": user_id, "valor": coupon["valor"]})
     
     return {
         "message": "Cupom utilizado com sucesso",
         "valor_adicionado": coupon["valor"],
-        "novo_saldo": saldo_data[user_id]
+        "novo_saldo": novo_saldo
     }
 
 # 3. Sistema de Ranking
-@app.get("/api/ranking")
-async def get_ranking(current_user: str = Depends(verify_token)):
-    saldo_data = read_json_file("./DataBaseJson/saldo.json")
-    config = read_json_file("./config.json")
-    bot_token = config.get("token", "")
+async def build_ranking_page(limit: int, offset: int) -> Dict:
+    ranking, total = await ranking_index.page(limit, offset)
     
-    ranking = []
-    for user_id, balance in saldo_data.items():
-        try:
-            balance = float(balance)
-        except:
-            balance = 0.0
-        
-        if balance > 0:
-            ranking.append({
-                "user_id": user_id,
-                "saldo": balance,
-                "posicao": 0
-            })
-    
-    # Ordenar por saldo
-    ranking.sort(key=lambda x: x["saldo"], reverse=True)
-    
-    # Adicionar posições
-    for i, user in enumerate(ranking):
-        user["posicao"] = i + 1
-        
-        # Buscar info do Discord se possível
-        if bot_token:
-            user_info = await get_discord_user_info(user["user_id"], bot_token)
-            user["username"] = user_info["username"]
-            user["avatar_url"] = user_info["avatar_url"]
+    bot_token = await run_blocking(get_bot_token)
+    
+    # Buscar info do Discord só para a página retornada, em paralelo
+    if bot_token:
+        await enrich_with_profiles(ranking, bot_token, RANKING_PROFILE_BUDGET)
     
-    return {"ranking": ranking[:50]}  # Top 50
+    return {"ranking": ranking, "total": total}
+
+@app.get("/api/ranking")
+async def get_ranking(limit: int = 50, offset: int = 0, current_user: str = Depends(verify_token)):
+    """Leaderboard de saldo (padrão: top 50), paginado por limit/offset"""
+    limit = max(1, min(limit, 500))
+    offset = max(offset, 0)
+    page = await single_flight.do(("ranking", limit, offset), build_ranking_page, limit, offset)
+    
+    # Resposta já serializável: pula o jsonable_encoder
+    return FastJSONResponse(page)
+
+@app.get("/api/ranking/{user_id}")
+async def get_user_rank(user_id: str, current_user: str = Depends(verify_token)):
+    """Posição de um usuário no ranking"""
+    rank = await ranking_index.rank_of(user_id)
+    if rank is None:
+        raise HTTPException(status_code=404, detail="Usuário fora do ranking")
+    return rank
 
 # 4. Sistema de Webhooks
 @app.get("/api/webhooks")
 async def get_webhooks(current_user: str = Depends(verify_token)):
-    webhooks = read_json_file("./DataBaseJson/webhooks.json")
-    return {"webhooks": webhooks.get("webhooks", [])}
+    return {"webhooks": await run_blocking(engine.list_webhooks)}
 
 @app.post("/api/webhooks")
 async def create_webhook(request: WebhookConfig, current_user: str = Depends(verify_token)):
-    webhooks = read_json_file("./DataBaseJson/webhooks.json")
-    if "webhooks" not in webhooks:
-        webhooks["webhooks"] = []
-    
+    try:
+        url = httpx.URL(request.url)
+    except httpx.InvalidURL:
+        raise HTTPException(status_code=400, detail="URL do webhook inválida")
+    if url.scheme not in ("http", "https") or not url.host:
+        raise HTTPException(status_code=400, detail="URL do webhook deve ser http(s) com host")
+
     webhook = {
         "url": request.url,
         "eventos": request.eventos,
@@ -650,54 +735,127 @@ async def create_webhook(request: WebhookConfig, current_user: str = Depends(ver
         "id": str(uuid.uuid4())
     }
     
-    webhooks["webhooks"].append(webhook)
-    write_json_file("./DataBaseJson/webhooks.json", webhooks)
+    await run_blocking(engine.add_webhook, webhook)
     
-    log_action("webhook_created", details={"url": request.url})
+    await log_action("webhook_created", details={"url": request.url})
     return {"message": "Webhook criado com sucesso"}
 
+@app.get("/api/webhooks/stats")
+async def get_webhook_stats(current_user: str = Depends(verify_token)):
+    """Entregas por webhook (entregues, falhas, mortas, pendentes, latência)"""
+    return {
+        "resumo": await run_blocking(webhook_dispatcher.stats),
+        "webhooks": await run_blocking(webhook_dispatcher.webhook_stats)
+    }
+
+@app.get("/api/webhooks/dead-letter")
+async def get_webhook_dead_letters(limit: int = 100, current_user: str = Depends(verify_token)):
+    """Entregas que esgotaram as tentativas"""
+    return {"entregas": await run_blocking(webhook_dispatcher.dead_letters, max(1, min(limit, 500)))}
+
+@app.post("/api/webhooks/dead-letter/{dead_id}/retry")
+async def retry_webhook_dead_letter(dead_id: int, current_user: str = Depends(verify_token)):
+    """Devolve uma entrega morta para a fila"""
+    if not await run_blocking(webhook_dispatcher.retry_dead, dead_id):
+        raise HTTPException(status_code=404, detail="Entrega não encontrada")
+    await log_action("webhook_retry", details={"entrega": dead_id})
+    return {"message": "Entrega reenfileirada"}
+
 # 5. Sistema de Backup
 @app.post("/api/backup/create")
 async def create_backup(current_user: str = Depends(verify_token)):
-    backup_path = auto_backup()
-    if backup_path:
-        return {"message": "Backup criado com sucesso", "path": backup_path}
+    manifest = await run_blocking(auto_backup)
+    if manifest:
+        return {
+            "message": "Backup criado com sucesso",
+            "path": manifest["nome"],
+            "tamanho_logico": manifest["tamanho_logico"],
+            "novos_bytes": manifest["novos_bytes"],
+            "reaproveitados": manifest["reaproveitados"]
+        }
     else:
         raise HTTPException(status_code=500, detail="Erro ao criar backup")
 
+def scan_backups() -> Dict[str, Any]:
+    backups = backup_store.list_snapshots()
+    usage = backup_store.usage()
+    legacy = sum(b["tamanho_fisico"] for b in backups if b["tipo"] == "zip")
+    return {
+        "backups": backups,
+        "totais": {
+            "tamanho_logico": sum(b["tamanho_logico"] for b in backups),
+            "tamanho_fisico": usage["bytes_blobs"] + usage["bytes_manifestos"] + legacy,
+            "blobs": usage["blobs"]
+        }
+    }
+
 @app.get("/api/backup/list")
 async def list_backups(current_user: str = Depends(verify_token)):
-    backup_dir = "./backups"
-    if not os.path.exists(backup_dir):
-        return {"backups": []}
-    
-    backups = []
-    for file in os.listdir(backup_dir):
-        if file.endswith('.zip'):
-            file_path = os.path.join(backup_dir, file)
-            stat = os.stat(file_path)
-            backups.append({
-                "nome": file,
-                "tamanho": stat.st_size,
-                "criado_em": datetime.fromtimestamp(stat.st_ctime, tz=timezone.utc).isoformat()
-            })
-    
-    backups.sort(key=lambda x: x["criado_em"], reverse=True)
-    return {"backups": backups}
+    return {**await run_blocking(scan_backups), "agendamento": await run_blocking(backup_scheduler.stats)}
+
+@app.post("/api/backup/restore/{nome}")
+async def restore_backup(nome: str, current_user: str = Depends(verify_token)):
+    """Reconstrói o backup em ./backups/restaurados/<nome> (os dados em uso não são tocados)"""
+    if not await run_blocking(backup_store.has_snapshot, nome):
+        raise HTTPException(status_code=404, detail="Backup não encontrado")
+    result = await run_blocking(backup_store.restore, nome, os.path.join("./backups/restaurados", nome))
+    await log_action("backup_restored", details={"backup": nome, "destino": result["destino"]})
+    return {"message": "Backup restaurado", **result}
 
 # 6. Logs de Ações
+def query_action_logs(action: Optional[str], user_id: Optional[str], since: Optional[str],
+                      until: Optional[str], before, limit: int) -> List[Dict]:
+    """
+    Página de logs somando as entradas ainda na fila do pipeline: o admin vê
+    as ações que acabou de fazer sem forçar a gravação do lote
+    """
+    # Fila lida antes do motor: uma entrada gravada no meio aparece nos dois (dedup por id)
+    pending = [e for e in action_log_pipeline.pending() if matches(e, action, user_id, since, until, before)]
+    logs = engine.query_actions(action=action, user_id=user_id, since=since, until=until,
+                                before=before, limit=limit)
+    if not pending:
+        return logs
+    seen = {entry.get("id") for entry in logs}
+    merged = logs + [entry for entry in pending if entry.get("id") not in seen]
+    merged.sort(key=sort_key, reverse=True)
+    return merged[:limit]
+
 @app.get("/api/logs/actions")
-async def get_action_logs(current_user: str = Depends(verify_token)):
-    logs = read_json_file("./DataBaseJson/action_logs.json")
-    return {
-        "logs": sorted(logs.get("logs", []), key=lambda x: x.get("timestamp", ""), reverse=True)[:100]
-    }
+async def get_action_logs(
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    action: Optional[str] = None,
+    user_id: Optional[str] = None,
+    inicio: Optional[str] = None,
+    fim: Optional[str] = None,
+    current_user: str = Depends(verify_token)
+):
+    """
+    Logs do mais novo para o mais antigo, paginados por cursor
+
+    Filtros opcionais por ação, usuário e período (inicio inclusivo, fim
+    exclusivo, ISO 8601). Passe proximo_cursor da resposta para a próxima página.
+    """
+    limit = max(1, min(limit, 500))
+    try:
+        before = decode_cursor(cursor) if cursor else None
+        since = parse_log_timestamp(inicio) if inicio else None
+        until = parse_log_timestamp(fim) if fim else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Uma entrada a mais indica se existe próxima página
+    logs = await run_blocking(query_action_logs, action, user_id, since, until, before, limit + 1)
+    next_cursor = encode_cursor(logs[limit - 1]) if len(logs) > limit else None
+    return FastJSONResponse({
+        "logs": logs[:limit],
+        "proximo_cursor": next_cursor
+    })
 
 # 7. Configurações do Sistema
 @app.get("/api/system/config")
 async def get_system_config(current_user: str = Depends(verify_token)):
-    config = read_json_file("./DataBaseJson/system_config.json")
-    return config
+    return await run_blocking(read_json_view, "./DataBaseJson/system_config.json")
 
 @app.post("/api/system/config")
 async def update_system_config(request: SystemConfig, current_user: str = Depends(verify_token)):
@@ -709,16 +867,45 @@ async def update_system_config(request: SystemConfig, current_user: str = Depend
         "atualizado_em": datetime.now(timezone.utc).isoformat()
     }
     
-    write_json_file("./DataBaseJson/system_config.json", config)
-    log_action("system_config_updated", details=config)
+    async with resource_locks.acquire(("file", "system_config.json")):
+        await run_blocking(write_json_file, "./DataBaseJson/system_config.json", config)
+    await log_action("system_config_updated", details=config)
+    backup_scheduler.reschedule()
     
     return {"message": "Configuração do sistema atualizada"}
 
+@app.get("/api/system/loop")
+async def get_event_loop_report(current_user: str = Depends(verify_token)):
+    """Lag do event loop, tempo bloqueado por rota e bloqueios recentes com pilha"""
+    return loop_monitor.report()
+
+@app.get("/api/system/metrics")
+async def get_system_metrics(current_user: str = Depends(verify_token)):
+    """Métricas internas do backend"""
+    return {
+        "storage_engine": await run_blocking(engine.stats),
+        "action_log": action_log_pipeline.stats(),
+        "action_rollups": action_rollups.stats(),
+        "ranking": ranking_index.stats(),
+        "discord_client": discord_client.stats(),
+        "discord_profiles": profile_service.stats(),
+        "bot_status": bot_status_monitor.stats(),
+        "single_flight": single_flight.stats(),
+        "async_io": async_io.stats(),
+        "webhooks": {**await run_blocking(webhook_dispatcher.stats), "roteamento": webhook_router.stats()},
+        "event_loop": loop_monitor.stats(),
+        "backups": await run_blocking(backup_scheduler.stats),
+        "project_archive": project_archive.stats(),
+        "document_cache": document_cache.stats(),
+        "storage_writer": storage_writer.stats(),
+        "resource_locks": resource_locks.stats()
+    }
+
 # 7.5. Configuração do Bot Discord
 @app.get("/api/config/bot")
 async def get_bot_config(current_user: str = Depends(verify_token)):
     """Obtém a configuração do bot Discord"""
-    config = read_json_file("./DataBaseJson/config.json")
+    config = await run_blocking(read_json_view, "./DataBaseJson/config.json")
     return {
         "token": config.get("token", ""),
         "status": "unknown"  # Status real viria do bot se estivesse rodando
@@ -727,12 +914,14 @@ async def get_bot_config(current_user: str = Depends(verify_token)):
 @app.post("/api/config/bot")
 async def update_bot_config(bot_config: BotTokenConfig, current_user: str = Depends(verify_token)):
     """Atualiza o token do bot Discord"""
-    config = read_json_file("./DataBaseJson/config.json")
-    config["token"] = bot_config.token
-    config["atualizado_em"] = datetime.now(timezone.utc).isoformat()
+    def apply(config: Dict) -> str:
+        config["token"] = bot_config.token
+        config["atualizado_em"] = datetime.now(timezone.utc).isoformat()
+        return config["atualizado_em"]
     
-    write_json_file("./DataBaseJson/config.json", config)
-    log_action("bot_token_updated", details={"updated_at": config["atualizado_em"]})
+    async with resource_locks.acquire(("file", "config.json")):
+        atualizado_em = await run_blocking(update_json_file, "./DataBaseJson/config.json", apply)
+    await log_action("bot_token_updated", details={"updated_at": atualizado_em})
     
     return {
         "message": "Token do bot atualizado com sucesso",
@@ -743,7 +932,7 @@ async def update_bot_config(bot_config: BotTokenConfig, current_user: str = Depe
 async def get_bot_status(current_user: str = Depends(verify_token)):
     """Obtém o status do bot Discord"""
     # Como o bot não está rodando no backend Python, retornamos status genérico
-    config = read_json_file("./DataBaseJson/config.json")
+    config = await run_blocking(read_json_view, "./DataBaseJson/config.json")
     has_token = bool(config.get("token", ""))
     
     return {
@@ -755,7 +944,7 @@ async def get_bot_status(current_user: str = Depends(verify_token)):
 @app.post("/api/bot/restart")
 async def restart_bot(current_user: str = Depends(verify_token)):
     """Reinicia o bot Discord (placeholder - bot não roda no backend Python)"""
-    config = read_json_file("./DataBaseJson/config.json")
+    config = await run_blocking(read_json_view, "./DataBaseJson/config.json")
     has_token = bool(config.get("token", ""))
     
     if not has_token:
@@ -764,7 +953,7 @@ async def restart_bot(current_user: str = Depends(verify_token)):
             "message": "Configure o token do bot antes de reiniciar"
         }
     
-    log_action("bot_restart_requested")
+    await log_action("bot_restart_requested")
     
     return {
         "success": True,
@@ -775,7 +964,7 @@ async def restart_bot(current_user: str = Depends(verify_token)):
 @app.get("/api/config/cargos")
 async def get_cargo_config(current_user: str = Depends(verify_token)):
     """Obtém a configuração de cargos do Discord"""
-    config = read_json_file("./DataBaseJson/config.json")
+    config = await run_blocking(read_json_view, "./DataBaseJson/config.json")
     return {
         "cliente_id": config.get("cliente_id", ""),
         "membro_id": config.get("membro_id", "")
@@ -784,13 +973,14 @@ async def get_cargo_config(current_user: str = Depends(verify_token)):
 @app.post("/api/config/cargos")
 async def update_cargo_config(cargo_config: CargoConfig, current_user: str = Depends(verify_token)):
     """Atualiza a configuração de cargos do Discord"""
-    config = read_json_file("./DataBaseJson/config.json")
-    config["cliente_id"] = cargo_config.cliente_id
-    config["membro_id"] = cargo_config.membro_id
-    config["atualizado_em"] = datetime.now(timezone.utc).isoformat()
+    def apply(config: Dict) -> None:
+        config["cliente_id"] = cargo_config.cliente_id
+        config["membro_id"] = cargo_config.membro_id
+        config["atualizado_em"] = datetime.now(timezone.utc).isoformat()
     
-    write_json_file("./DataBaseJson/config.json", config)
-    log_action("cargo_config_updated", details={"cliente_id": cargo_config.cliente_id, "membro_id": cargo_config.membro_id})
+    async with resource_locks.acquire(("file", "config.json")):
+        await run_blocking(update_json_file, "./DataBaseJson/config.json", apply)
+    await log_action("cargo_config_updated", details={"cliente_id": cargo_config.cliente_id, "membro_id": cargo_config.membro_id})
     
     return {"message": "Configuração de cargos atualizada com sucesso"}
 
@@ -798,7 +988,7 @@ async def update_cargo_config(cargo_config: CargoConfig, current_user: str = Dep
 @app.get("/api/config/payments")
 async def get_payment_config(current_user: str = Depends(verify_token)):
     """Obtém a configuração de pagamentos"""
-    config = read_json_file("./DataBaseJson/config.json")
+    config = await run_blocking(read_json_view, "./DataBaseJson/config.json")
     return {
         "mp_token": config.get("mp_token", ""),
         "sms_api_key": config.get("sms_api_key", "")
@@ -807,15 +997,16 @@ async def get_payment_config(current_user: str = Depends(verify_token)):
 @app.post("/api/config/payments")
 async def update_payment_config(payment_config: PaymentConfig, current_user: str = Depends(verify_token)):
     """Atualiza a configuração de pagamentos"""
-    config = read_json_file("./DataBaseJson/config.json")
-    if payment_config.mp_token:
-        config["mp_token"] = payment_config.mp_token
-    if payment_config.sms_api_key:
-        config["sms_api_key"] = payment_config.sms_api_key
-    config["atualizado_em"] = datetime.now(timezone.utc).isoformat()
+    def apply(config: Dict) -> None:
+        if payment_config.mp_token:
+            config["mp_token"] = payment_config.mp_token
+        if payment_config.sms_api_key:
+            config["sms_api_key"] = payment_config.sms_api_key
+        config["atualizado_em"] = datetime.now(timezone.utc).isoformat()
     
-    write_json_file("./DataBaseJson/config.json", config)
-    log_action("payment_config_updated")
+    async with resource_locks.acquire(("file", "config.json")):
+        await run_blocking(update_json_file, "./DataBaseJson/config.json", apply)
+    await log_action("payment_config_updated")
     
     return {"message": "Configuração de pagamentos atualizada com sucesso"}
 
@@ -834,61 +1025,55 @@ async def update_ticket_config_alias(ticket_config: TicketConfig, current_user:
 @app.post("/api/saldo/add")
 async def add_saldo(saldo_data: SaldoAdd, current_user: str = Depends(verify_token)):
     """Adiciona saldo a um usuário"""
-    users = read_json_file("./DataBaseJson/users.json")
-    
-    user = next((u for u in users.get("users", []) if u["id"] == saldo_data.user_id), None)
-    if not user:
-        return {"success": False, "message": "Usuário não encontrado"}
-    
-    user["saldo"] = user.get("saldo", 0) + saldo_data.valor
-    write_json_file("./DataBaseJson/users.json", users)
+    async with resource_locks.acquire(("saldo", saldo_data.user_id)):
+        novo_saldo = await run_blocking(engine.adjust_saldo, saldo_data.user_id, saldo_data.valor,
+                                        reason=saldo_data.descricao)
     
-    log_action("saldo_added", details={
+    await log_action("saldo_added", details={
         "user_id": saldo_data.user_id,
         "valor": saldo_data.valor,
         "descricao": saldo_data.descricao,
-        "novo_saldo": user["saldo"]
+        "novo_saldo": novo_saldo
     })
     
     return {
         "success": True,
         "message": f"Saldo adicionado com sucesso",
-        "novo_saldo": user["saldo"]
+        "novo_saldo": novo_saldo
     }
 
 @app.post("/api/saldo/remove")
 async def remove_saldo(saldo_data: SaldoRemove, current_user: str = Depends(verify_token)):
     """Remove saldo de um usuário"""
-    users = read_json_file("./DataBaseJson/users.json")
-    
-    user = next((u for u in users.get("users", []) if u["id"] == saldo_data.user_id), None)
-    if not user:
-        return {"success": False, "message": "Usuário não encontrado"}
-    
-    if user.get("saldo", 0) < saldo_data.valor:
-        return {"success": False, "message": "Saldo insuficiente"}
-    
-    user["saldo"] = user.get("saldo", 0) - saldo_data.valor
-    write_json_file("./DataBaseJson/users.json", users)
+    async with resource_locks.acquire(("saldo", saldo_data.user_id)):
+        saldo_atual = await run_blocking(engine.get_saldo, saldo_data.user_id)
+        if saldo_atual is None:
+            return {"success": False, "message": "Usuário não encontrado"}
+        
+        if saldo_atual < saldo_data.valor:
+            return {"success": False, "message": "Saldo insuficiente"}
+        
+        novo_saldo = await run_blocking(engine.adjust_saldo, saldo_data.user_id, -saldo_data.valor,
+                                        reason=saldo_data.motivo)
     
-    log_action("saldo_removed", details={
+    await log_action("saldo_removed", details={
         "user_id": saldo_data.user_id,
         "valor": saldo_data.valor,
         "motivo": saldo_data.motivo,
-        "novo_saldo": user["saldo"]
+        "novo_saldo": novo_saldo
     })
     
     return {
         "success": True,
         "message": f"Saldo removido com sucesso",
-        "novo_saldo": user["saldo"]
+        "novo_saldo": novo_saldo
     }
 
 # 7.10. Gerenciamento Gratian.pro (Bot Discord Remoto)
 @app.get("/api/gratian/config")
 async def get_gratian_config(current_user: str = Depends(verify_token)):
     """Obtém configuração do Gratian.pro"""
-    config = read_json_file("./DataBaseJson/config.json")
+    config = await run_blocking(read_json_view, "./DataBaseJson/config.json")
     return {
         "api_key": config.get("gratian_api_key", ""),
         "bot_app_id": config.get("gratian_bot_app_id", ""),
@@ -902,17 +1087,18 @@ async def update_gratian_config(gratian_config: GratianConfig, current_user: str
     os.makedirs("./DataBaseJson", exist_ok=True)
     
     config_path = "./DataBaseJson/config.json"
-    config = read_json_file(config_path)
     
     # Atualizar campos
-    config["gratian_api_key"] = gratian_config.api_key
-    if gratian_config.bot_app_id:
-        config["gratian_bot_app_id"] = gratian_config.bot_app_id
-    config["atualizado_em"] = datetime.now(timezone.utc).isoformat()
+    def apply(config: Dict) -> None:
+        config["gratian_api_key"] = gratian_config.api_key
+        if gratian_config.bot_app_id:
+            config["gratian_bot_app_id"] = gratian_config.bot_app_id
+        config["atualizado_em"] = datetime.now(timezone.utc).isoformat()
     
     # Salvar
-    write_json_file(config_path, config)
-    log_action("gratian_config_updated")
+    async with resource_locks.acquire(("file", "config.json")):
+        await run_blocking(update_json_file, config_path, apply)
+    await log_action("gratian_config_updated")
     
     return {"message": "Configuração do Gratian.pro atualizada com sucesso"}
 
@@ -935,7 +1121,7 @@ async def get_gratian_bot_status(current_user: str = Depends(verify_token)):
             "message": "App ID do bot não configurado"
         }
     
-    status = manager.get_app_status(app_id)
+    status = await run_blocking(manager.get_app_status, app_id)
     return status
 
 @app.get("/api/gratian/bot/logs")
@@ -957,7 +1143,7 @@ async def get_gratian_bot_logs(current_user: str = Depends(verify_token)):
             "message": "App ID do bot não configurado"
         }
     
-    logs = manager.get_app_logs(app_id)
+    logs = await run_blocking(manager.get_app_logs, app_id)
     return logs
 
 @app.post("/api/gratian/bot/deploy")
@@ -988,11 +1174,12 @@ async def deploy_gratian_bot(deploy_data: GratianBotDeploy, current_user: str =
         with tempfile.NamedTemporaryFile(suffix='.zip', delete=False) as tmp:
             zip_path = tmp.name
             bot_dir = Path(__file__).parent.parent
-            manager.create_bot_zip(str(bot_dir), zip_path)
+        await run_blocking(manager.create_bot_zip, str(bot_dir), zip_path)
     
     # Executar ação
     if action == 'create':
-        result = manager.create_app(
+        result = await run_blocking(
+            manager.create_app,
             zip_path=zip_path,
             name="Gringolindo Bot Discord",
             memory=512,
@@ -1005,26 +1192,29 @@ async def deploy_gratian_bot(deploy_data: GratianBotDeploy, current_user: str =
         
         # Salvar App ID se criado com sucesso
         if result.get('success') and result.get('data', {}).get('appId'):
-            config = read_json_file("./DataBaseJson/config.json")
-            config["gratian_bot_app_id"] = result['data']['appId']
-            write_json_file("./DataBaseJson/config.json", config)
+            async with resource_locks.acquire(("file", "config.json")):
+                await run_blocking(
+                    update_json_file,
+                    "./DataBaseJson/config.json",
+                    lambda config: config.update(gratian_bot_app_id=result['data']['appId'])
+                )
         
-        os.unlink(zip_path)
+        await run_blocking(os.unlink, zip_path)
         return result
     
     elif action == 'deploy':
-        result = manager.deploy_app(app_id, zip_path)
-        os.unlink(zip_path)
+        result = await run_blocking(manager.deploy_app, app_id, zip_path)
+        await run_blocking(os.unlink, zip_path)
         return result
     
     elif action == 'start':
-        return manager.start_app(app_id)
+        return await run_blocking(manager.start_app, app_id)
     
     elif action == 'stop':
-        return manager.stop_app(app_id)
+        return await run_blocking(manager.stop_app, app_id)
     
     elif action == 'restart':
-        return manager.restart_app(app_id)
+        return await run_blocking(manager.restart_app, app_id)
     
     else:
         return {
@@ -1033,56 +1223,50 @@ async def deploy_gratian_bot(deploy_data: GratianBotDeploy, current_user: str =
         }
 
 # 8. Estatísticas Avançadas
-@app.get("/api/analytics/advanced")
-async def get_advanced_analytics(current_user: str = Depends(verify_token)):
-    # Dados dos últimos 30 dias
+def build_advanced_analytics(dias: int) -> Dict:
     end_date = datetime.now(timezone.utc)
-    start_date = end_date - timedelta(days=30)
+    start_date = end_date - timedelta(days=dias)
+    
+    # Os agregados cobrem o que já foi gravado: ficam no máximo ACTION_LOG_FLUSH_MS atrás
+    rollup = action_rollups.window(start_date, end_date)
     
-    logs = read_json_file("./DataBaseJson/action_logs.json")
-    entregas = read_json_file("./DataBaseJson/entrega.json")
+    # Receita: depósitos e vendas concluídos no histórico + cupons usados
+    days = [(start_date + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(dias + 1)]
+    receita_diaria = revenue_index.daily(days)
+    for day, valor in rollup["cupons_diarios"].items():
+        receita_diaria.setdefault(day, {"depositos": 0.0, "vendas": 0.0})["cupons"] = round(valor, 2)
+    for day in receita_diaria.values():
+        day.setdefault("cupons", 0.0)
     
     analytics = {
         "periodo": {
             "inicio": start_date.isoformat(),
             "fim": end_date.isoformat()
         },
-        "atividade_diaria": {},
-        "eventos_mais_comuns": {},
-        "receita_diaria": {},
-        "usuarios_mais_ativos": {}
+        "atividade_diaria": rollup["atividade_diaria"],
+        "eventos_mais_comuns": rollup["eventos_mais_comuns"],
+        "receita_diaria": dict(sorted(receita_diaria.items())),
+        "usuarios_mais_ativos": rollup["usuarios_mais_ativos"]
     }
     
-    # Processar logs
-    for log in logs.get("logs", []):
-        try:
-            log_date = datetime.fromisoformat(log["timestamp"])
-            if start_date <= log_date <= end_date:
-                day_key = log_date.strftime("%Y-%m-%d")
-                
-                # Atividade diária
-                analytics["atividade_diaria"][day_key] = analytics["atividade_diaria"].get(day_key, 0) + 1
-                
-                # Eventos mais comuns
-                action = log["action"]
-                analytics["eventos_mais_comuns"][action] = analytics["eventos_mais_comuns"].get(action, 0) + 1
-                
-                # Usuários mais ativos
-                if log.get("user_id"):
-                    user_id = log["user_id"]
-                    analytics["usuarios_mais_ativos"][user_id] = analytics["usuarios_mais_ativos"].get(user_id, 0) + 1
-        except:
-            continue
-    
     return analytics
 
+@app.get("/api/analytics/advanced")
+async def get_advanced_analytics(dias: int = 30, current_user: str = Depends(verify_token)):
+    """
+    Análises dos últimos `dias` dias (padrão 30), somadas a partir dos buckets
+    horários: o custo depende do tamanho da janela, não do número de eventos
+    """
+    dias = max(1, min(dias, 366))
+    return await single_flight.do(("analytics", dias), build_advanced_analytics, dias, thread=True)
+
 # ROTAS EXISTENTES CONTINUAM...
 # (mantendo todas as rotas originais)
 
 # 9. Configuração de Tickets
 @app.get("/api/tickets/config")
 async def get_ticket_config(current_user: str = Depends(verify_token)):
-    config = read_json_file("./DataBaseJson/config.json")
+    config = await run_blocking(read_json_view, "./DataBaseJson/config.json")
     return {
         "tickets": config.get("tickets", {}),
         "entrega": config.get("entrega", {})
@@ -1090,22 +1274,22 @@ async def get_ticket_config(current_user: str = Depends(verify_token)):
 
 @app.post("/api/tickets/config")
 async def update_ticket_config(ticket_config: TicketConfig, current_user: str = Depends(verify_token)):
-    config = read_json_file("./DataBaseJson/config.json")
-    
-    if "tickets" not in config:
-        config["tickets"] = {}
-    if "entrega" not in config:
-        config["entrega"] = {}
-    
-    config["tickets"]["categoria"] = ticket_config.categoria_id
-    config["tickets"]["logs"] = ticket_config.logs_id
-    config["tickets"]["max_tickets_per_user"] = ticket_config.max_tickets_per_user or 1
-    
-    if ticket_config.entrega_canal_id:
-        config["entrega"]["canal_id"] = ticket_config.entrega_canal_id
+    def apply(config: Dict) -> None:
+        if "tickets" not in config:
+            config["tickets"] = {}
+        if "entrega" not in config:
+            config["entrega"] = {}
+        
+        config["tickets"]["categoria"] = ticket_config.categoria_id
+        config["tickets"]["logs"] = ticket_config.logs_id
+        config["tickets"]["max_tickets_per_user"] = ticket_config.max_tickets_per_user or 1
+        
+        if ticket_config.entrega_canal_id:
+            config["entrega"]["canal_id"] = ticket_config.entrega_canal_id
     
-    write_json_file("./DataBaseJson/config.json", config)
-    log_action("ticket_config_updated", details={
+    async with resource_locks.acquire(("file", "config.json")):
+        await run_blocking(update_json_file, "./DataBaseJson/config.json", apply)
+    await log_action("ticket_config_updated", details={
         "categoria_id": ticket_config.categoria_id,
         "logs_id": ticket_config.logs_id,
         "max_tickets_per_user": ticket_config.max_tickets_per_user,
@@ -1115,12 +1299,8 @@ async def update_ticket_config(ticket_config: TicketConfig, current_user: str =
     return {"message": "Configuração de tickets atualizada com sucesso"}
 
 # Rota de download atualizada com novas funcionalidades
-@app.get("/api/download/project")
-async def download_project(current_user: str = Depends(verify_token)):
-    """Download completo do projeto em ZIP"""
-    
-    # Criar ZIP em memória
-    zip_buffer = io.BytesIO()
+def project_archive_inputs():
+    """Arquivos e textos gerados que compõem o ZIP do projeto"""
     
     # Lista de arquivos e pastas para incluir (EXPANDIDA)
     files_to_include = [
@@ -1183,7 +1363,6 @@ async def download_project(current_user: str = Depends(verify_token)):
         ("DataBaseJson/blacklist.json", "./DataBaseJson/blacklist.json"),
         ("DataBaseJson/coupons.json", "./DataBaseJson/coupons.json"),
         ("DataBaseJson/webhooks.json", "./DataBaseJson/webhooks.json"),
-        ("DataBaseJson/action_logs.json", "./DataBaseJson/action_logs.json"),
         ("DataBaseJson/system_config.json", "./DataBaseJson/system_config.json"),
         
         # Root files
@@ -1210,14 +1389,23 @@ async def download_project(current_user: str = Depends(verify_token)):
     for component in ui_components:
         files_to_include.append((f"frontend/src/components/ui/{component}", f"./frontend/src/components/ui/{component}"))
     
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        # Adicionar arquivos ao ZIP
-        for zip_path, file_path in files_to_include:
-            if os.path.exists(file_path):
-                zipf.write(file_path, zip_path)
-        
-        # Criar arquivo de instruções atualizado
-        instructions = """# GRADIANET - Sistema Discord Bot Admin Panel COMPLETO
+    # Logs de ações: os segmentos NDJSON são os dados vivos; o action_logs.json
+    # antigo só vai junto enquanto não foi migrado para eles
+    action_log_dir = "./DataBaseJson/action_logs"
+    if os.path.isdir(action_log_dir):
+        for root, dirs, names in os.walk(action_log_dir):
+            dirs.sort()
+            for name in sorted(names):
+                # Temporários de gravações atômicas em andamento
+                if name.startswith("."):
+                    continue
+                path = os.path.join(root, name)
+                files_to_include.append((os.path.relpath(path, ".").replace(os.sep, "/"), path))
+    else:
+        files_to_include.append(("DataBaseJson/action_logs.json", "./DataBaseJson/action_logs.json"))
+    
+    # Criar arquivo de instruções atualizado
+    instructions = """# GRADIANET - Sistema Discord Bot Admin Panel COMPLETO
 
 ## 🚀 Funcionalidades Implementadas
 
@@ -1317,45 +1505,55 @@ yarn start
 Sistema completo e funcional - Pronto para produção!
 
 Enjoy! 🎉"""
-        
-        zipf.writestr("INSTALL.md", instructions)
-        
-        # Package.json do root
-        root_package = {
-            "name": "gradianet-completo",
-            "version": "2.0.0",
-            "description": "Sistema Discord Bot Admin Panel - Versão Completa com 10+ Funcionalidades",
-            "scripts": {
-                "install-all": "cd backend && pip install -r requirements.txt && cd ../frontend && yarn install",
-                "start-backend": "cd backend && python server.py",
-                "start-frontend": "cd frontend && yarn start",
-                "backup": "python -c 'import shutil; shutil.make_archive(\"backup\", \"zip\", \"DataBaseJson\")'"  
-            },
-            "features": [
-                "Dashboard com estatísticas",
-                "Gerenciamento de saldo", 
-                "Sistema de blacklist",
-                "Cupons promocionais",
-                "Ranking de usuários",
-                "Webhooks",
-                "Backup automático",
-                "Logs detalhados",
-                "Analytics avançado",
-                "Configurações do sistema"
-            ],
-            "author": "E1 Agent - Emergent Labs",
-            "license": "MIT"
-        }
-        zipf.writestr("package.json", json.dumps(root_package, indent=2))
     
-    zip_buffer.seek(0)
-    log_action("project_downloaded")
+    # Package.json do root
+    root_package = {
+        "name": "gradianet-completo",
+        "version": "2.0.0",
+        "description": "Sistema Discord Bot Admin Panel - Versão Completa com 10+ Funcionalidades",
+        "scripts": {
+            "install-all": "cd backend && pip install -r requirements.txt && cd ../frontend && yarn install",
+            "start-backend": "cd backend && python server.py",
+            "start-frontend": "cd frontend && yarn start",
+            "backup": "python -c 'import shutil; shutil.make_archive(\"backup\", \"zip\", \"DataBaseJson\")'"  
+        },
+        "features": [
+            "Dashboard com estatísticas",
+            "Gerenciamento de saldo", 
+            "Sistema de blacklist",
+            "Cupons promocionais",
+            "Ranking de usuários",
+            "Webhooks",
+            "Backup automático",
+            "Logs detalhados",
+            "Analytics avançado",
+            "Configurações do sistema"
+        ],
+        "author": "E1 Agent - Emergent Labs",
+        "license": "MIT"
+    }
     
-    return StreamingResponse(
-        io.BytesIO(zip_buffer.getvalue()),
-        media_type="application/zip",
+    return files_to_include, [("INSTALL.md", instructions), ("package.json", json.dumps(root_package, indent=2))]
+
+# ZIP do projeto pré-montado em disco; remontado só quando alguma entrada muda
+project_archive = ArchiveCache(
+    os.getenv("ARCHIVE_CACHE_DIR", "./.archive_cache"),
+    "projeto",
+    project_archive_inputs,
+    check_interval=float(os.getenv("ARCHIVE_CACHE_CHECK_INTERVAL_S", "60"))
+)
+
+@app.get("/api/download/project")
+async def download_project(request: Request, current_user: str = Depends(verify_token)):
+    """Download completo do projeto em ZIP (com ETag e Range)"""
+    path, etag = await project_archive.get()
+    response = file_response(
+        request, path, etag, "application/zip",
         headers={"Content-Disposition": "attachment; filename=gradianet-sistema-completo.zip"}
     )
+    if response.status_code == 200:
+        await log_action("project_downloaded")
+    return response
 
 ## Outras rotas existentes continuam...
 # (todas as rotas originais do sistema)
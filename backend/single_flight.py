@@ -0,0 +1,98 @@
+"""
+Coalescência de requisições (single-flight)
+Chamadas simultâneas com a mesma chave compartilham uma única execução e
+recebem o mesmo resultado; opcionalmente o resultado fica em cache por alguns
+milissegundos. Os resultados são compartilhados: quem chama não deve alterá-los.
+"""
+
+import asyncio
+import inspect
+import os
+import time
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class SingleFlight:
+    """
+    Args:
+        default_ttl: Segundos que um resultado fica em cache (0 = só coalescer)
+    """
+
+    def __init__(self, default_ttl: float = 0.0):
+        self.default_ttl = default_ttl
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._results: Dict[Hashable, Tuple[float, Any]] = {}
+        # Contadores por nome (primeiro elemento da chave)
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, key: Hashable, field: str) -> None:
+        name = str(key[0] if isinstance(key, tuple) else key)
+        counters = self._stats.get(name)
+        if counters is None:
+            counters = self._stats[name] = {"chamadas": 0, "execucoes": 0, "coalescidas": 0, "cache": 0, "erros": 0}
+        counters[field] += 1
+
+    async def _execute(self, key: Hashable, fn: Callable, args: tuple, ttl: float, thread: bool) -> Any:
+        self._count(key, "execucoes")
+        try:
+            if thread:
+                result = await asyncio.to_thread(fn, *args)
+            else:
+                result = fn(*args)
+                if inspect.isawaitable(result):
+                    result = await result
+        except BaseException:
+            self._count(key, "erros")
+            raise
+        finally:
+            self._calls.pop(key, None)
+        if ttl > 0:
+            self._results[key] = (time.monotonic() + ttl, result)
+        return result
+
+    async def do(self, key: Hashable, fn: Callable, *args, ttl: float = None, thread: bool = False) -> Any:
+        """
+        Executa fn(*args) uma vez por chave entre chamadas simultâneas
+
+        Args:
+            key: Chave da computação, ex.: ("analytics", dias)
+            fn: Função síncrona ou corrotina
+            ttl: Segundos de cache do resultado (padrão: default_ttl)
+            thread: Executa fn (síncrona) em uma thread, liberando o event loop
+
+        Raises:
+            A exceção de fn, para todos que aguardavam a mesma execução
+        """
+        ttl = self.default_ttl if ttl is None else ttl
+        self._count(key, "chamadas")
+
+        cached = self._results.get(key)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                self._count(key, "cache")
+                return cached[1]
+            del self._results[key]
+
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._execute(key, fn, args, ttl, thread))
+            self._calls[key] = task
+        else:
+            self._count(key, "coalescidas")
+        # shield: quem desistir (ex.: cliente desconectou) não cancela os demais
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        # Remove entradas vencidas do cache
+        now = time.monotonic()
+        for key in [k for k, (expires, _) in self._results.items() if expires <= now]:
+            del self._results[key]
+        return {
+            "em_andamento": len(self._calls),
+            "em_cache": len(self._results),
+            "ttl_padrao_ms": int(self.default_ttl * 1000),
+            "por_chave": {name: dict(counters) for name, counters in self._stats.items()}
+        }
+
+
+single_flight = SingleFlight(default_ttl=int(os.getenv("SINGLE_FLIGHT_CACHE_MS", "0")) / 1000)
@@ -0,0 +1,524 @@
+"""
+Camada de armazenamento dos arquivos DataBaseJson
+Cache de documentos em memória compartilhado pelo painel e revalidado via stat,
+gravação atômica com agrupamento de escritas em rajada, locks por recurso e
+versões para compare-and-swap
+"""
+
+import asyncio
+import atexit
+import os
+import tempfile
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+import json_codec
+
+# Arquivos modificados há menos tempo que isso podem ter sido reescritos no mesmo
+# "tick" de mtime (o bot Node grava os mesmos arquivos via wio.db), então não
+# confiamos apenas na assinatura do stat até que a janela passe
+RACY_WINDOW_NS = 2_000_000_000
+
+Signature = Tuple[int, int, int]
+
+# (gerações gravadas por este processo, assinatura do arquivo no disco)
+DocumentVersion = Tuple[int, Optional[Signature]]
+
+
+class VersionConflict(Exception):
+    """O documento mudou desde que foi lido (outra requisição ou o bot Node)"""
+
+
+def _readonly(*args, **kwargs):
+    raise TypeError("Documento em cache é somente leitura; use read_json_file para obter uma cópia editável")
+
+
+class FrozenDict(dict):
+    """dict somente leitura usado nas views do cache"""
+    __slots__ = ()
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = __ior__ = _readonly
+
+
+class FrozenList(list):
+    """list somente leitura usada nas views do cache"""
+    __slots__ = ()
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = remove = pop = clear = sort = reverse = _readonly
+
+
+def freeze(value: Any) -> Any:
+    """Converte um documento JSON em uma estrutura somente leitura"""
+    if isinstance(value, dict):
+        return FrozenDict({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return FrozenList([freeze(v) for v in value])
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """Cria uma cópia editável (dict/list comuns) de um documento"""
+    if isinstance(value, dict):
+        return {k: thaw(v) if isinstance(v, (dict, list)) else v for k, v in value.items()}
+    if isinstance(value, list):
+        return [thaw(v) if isinstance(v, (dict, list)) else v for v in value]
+    return value
+
+
+def stat_signature(st: os.stat_result) -> Signature:
+    """Assinatura usada para detectar alterações de um arquivo"""
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class _CacheEntry:
+    __slots__ = ("signature", "document", "racy")
+
+    def __init__(self, signature: Signature, document: Any, racy: bool):
+        self.signature = signature
+        self.document = document
+        self.racy = racy
+
+
+class DocumentCache:
+    """
+    Mantém os documentos JSON já parseados em memória
+
+    Cada leitura faz apenas um os.stat; o arquivo só é parseado de novo quando
+    (mtime_ns, tamanho, inode) mudam. Os documentos ficam congelados e são
+    compartilhados entre os handlers sem cópia.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, _CacheEntry] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.errors = 0
+
+    @staticmethod
+    def _key(filepath: str) -> str:
+        return os.path.abspath(filepath)
+
+    @staticmethod
+    def _is_racy(st: os.stat_result) -> bool:
+        return time.time_ns() - st.st_mtime_ns < RACY_WINDOW_NS
+
+    def get(self, filepath: str) -> Optional[Any]:
+        """
+        Retorna a view somente leitura do documento
+
+        Args:
+            filepath: Caminho do arquivo JSON
+
+        Returns:
+            Documento congelado ou None se o arquivo não existe ou é inválido
+        """
+        key = self._key(filepath)
+        try:
+            st = os.stat(key)
+        except FileNotFoundError:
+            with self._lock:
+                self._entries.pop(key, None)
+                self.misses += 1
+            return None
+
+        signature = stat_signature(st)
+        entry = self._entries.get(key)
+        if entry is not None and entry.signature == signature and not entry.racy:
+            with self._lock:
+                self.hits += 1
+            return entry.document
+
+        try:
+            with open(key, 'rb') as f:
+                # fstat do mesmo descritor para a assinatura bater com o conteúdo lido
+                signature = stat_signature(os.fstat(f.fileno()))
+                document = freeze(json_codec.loads(f.read()))
+        except (FileNotFoundError, json_codec.DecodeError, UnicodeDecodeError):
+            with self._lock:
+                self._entries.pop(key, None)
+                self.misses += 1
+                self.errors += 1
+            return None
+
+        with self._lock:
+            self.misses += 1
+            if entry is not None:
+                self.reloads += 1
+            self._entries[key] = _CacheEntry(signature, document, self._is_racy(st))
+        return document
+
+    def store(self, filepath: str, document: Any, st: os.stat_result) -> None:
+        """Atualiza o cache com um documento (já congelado) que acabou de ser gravado"""
+        key = self._key(filepath)
+        with self._lock:
+            self._entries[key] = _CacheEntry(stat_signature(st), document, self._is_racy(st))
+
+    def invalidate(self, filepath: Optional[str] = None) -> None:
+        """Descarta um documento (ou todos) do cache"""
+        with self._lock:
+            if filepath is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(self._key(filepath), None)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "documentos": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "recarregamentos": self.reloads,
+            "erros": self.errors,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+document_cache = DocumentCache()
+
+
+class StorageWriter:
+    """
+    Grava documentos de forma atômica (arquivo temporário + fsync + rename)
+
+    Escritas no mesmo arquivo dentro da janela configurada são agrupadas: só a
+    última versão é gravada quando a janela fecha. Enquanto isso as leituras
+    do painel enxergam a versão pendente.
+    """
+
+    def __init__(self, window_ms: int = 0, compact_files: Iterable[str] = ()):
+        self.window = max(window_ms, 0) / 1000
+        self.compact_files = set(compact_files)
+        self._pending: Dict[str, Tuple[Any, float, bool]] = {}
+        self._generations: Dict[str, int] = {}
+        self._cond = threading.Condition()
+        # Serializa as gravações em disco para que uma versão antiga nunca
+        # substitua uma mais nova do mesmo arquivo
+        self._io_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.writes = 0
+        self.flushes = 0
+        self.coalesced = 0
+        self.bytes_written = 0
+        self.errors = 0
+        self.conflicts = 0
+
+    def version(self, filepath: str) -> DocumentVersion:
+        """Versão atual do documento, usada no compare-and-swap"""
+        key = os.path.abspath(filepath)
+        try:
+            signature = stat_signature(os.stat(key))
+        except FileNotFoundError:
+            signature = None
+        return self._generations.get(key, 0), signature
+
+    def pending_document(self, filepath: str) -> Optional[Any]:
+        """Retorna a versão ainda não gravada do documento, se houver"""
+        pending = self._pending.get(os.path.abspath(filepath))
+        return pending[0] if pending is not None else None
+
+    def write(self, filepath: str, data: Any, compact: Optional[bool] = None) -> None:
+        """
+        Agenda a gravação de um documento
+
+        Args:
+            filepath: Caminho do arquivo JSON
+            data: Documento a gravar (é copiado, o chamador pode continuar usando)
+            compact: Grava sem indentação; por padrão só para os arquivos quentes
+        """
+        if self.window <= 0:
+            self.write_now(filepath, data, compact)
+            return
+
+        key = os.path.abspath(filepath)
+        if compact is None:
+            compact = os.path.basename(key) in self.compact_files
+        document = freeze(data)
+
+        with self._cond:
+            self.writes += 1
+            self._generations[key] = self._generations.get(key, 0) + 1
+            previous = self._pending.get(key)
+            if previous is not None:
+                self.coalesced += 1
+                deadline = previous[1]
+            else:
+                deadline = time.monotonic() + self.window
+            self._pending[key] = (document, deadline, compact)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="storage-writer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def write_now(self, filepath: str, data: Any, compact: Optional[bool] = None,
+                  expected_version: Optional[DocumentVersion] = None) -> Optional[os.stat_result]:
+        """
+        Grava um documento imediatamente, descartando versões pendentes dele
+
+        Args:
+            expected_version: Se informado, só grava se o documento ainda estiver
+                nessa versão. A verificação é feita com o temporário já gravado,
+                logo antes do rename; resta só a janela entre o stat e o rename
+
+        Returns:
+            stat do arquivo gravado ou None em caso de erro
+
+        Raises:
+            VersionConflict: O documento mudou desde expected_version
+        """
+        key = os.path.abspath(filepath)
+        if compact is None:
+            compact = os.path.basename(key) in self.compact_files
+        document = freeze(data)
+
+        def claim() -> None:
+            with self._cond:
+                if expected_version is not None and self.version(key) != expected_version:
+                    self.conflicts += 1
+                    raise VersionConflict(key)
+                self.writes += 1
+                self._generations[key] = self._generations.get(key, 0) + 1
+                self._pending.pop(key, None)
+
+        with self._io_lock:
+            if expected_version is None:
+                claim()
+                return self._flush_one(key, document, compact)
+            return self._flush_one(key, document, compact, before_replace=claim)
+
+    def flush(self) -> None:
+        """Grava imediatamente tudo que está pendente"""
+        with self._io_lock:
+            with self._cond:
+                batch = list(self._pending.items())
+                self._pending.clear()
+            for key, (document, _, compact) in batch:
+                self._flush_one(key, document, compact)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                wait = min(deadline for _, deadline, _ in self._pending.values()) - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+
+            with self._io_lock:
+                with self._cond:
+                    now = time.monotonic()
+                    due = [key for key, (_, deadline, _) in self._pending.items() if deadline <= now]
+                    batch = [(key, self._pending.pop(key)) for key in due]
+                for key, (document, _, compact) in batch:
+                    self._flush_one(key, document, compact)
+
+    def _flush_one(self, key: str, document: Any, compact: bool,
+                   before_replace: Optional[Callable[[], None]] = None) -> Optional[os.stat_result]:
+        try:
+            st = atomic_write(key, json_codec.dumps(document, indent=not compact), before_replace)
+        except VersionConflict:
+            raise
+        except Exception as e:
+            self.errors += 1
+            print(f"[Storage] Erro ao gravar {key}: {e}")
+            return None
+
+        self.flushes += 1
+        self.bytes_written += st.st_size
+        document_cache.store(key, document, st)
+        return st
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "janela_ms": int(self.window * 1000),
+            "pendentes": len(self._pending),
+            "escritas": self.writes,
+            "gravacoes": self.flushes,
+            "agrupadas": self.coalesced,
+            "bytes_gravados": self.bytes_written,
+            "conflitos": self.conflicts,
+            "erros": self.errors
+        }
+
+
+def atomic_write(path: str, payload: bytes, before_replace: Optional[Callable[[], None]] = None) -> os.stat_result:
+    """
+    Grava em um temporário no mesmo diretório e renomeia por cima do destino
+
+    Args:
+        before_replace: Chamado com o temporário já gravado, logo antes do
+            rename; uma exceção dele descarta o temporário e é propagada
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+            st = os.fstat(f.fileno())
+        if before_replace is not None:
+            before_replace()
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    # Garante que o rename em si sobreviva a uma queda (não suportado no Windows)
+    if hasattr(os, "O_DIRECTORY"):
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        except OSError:
+            pass
+    return st
+
+
+storage_writer = StorageWriter(
+    window_ms=int(os.getenv("STORAGE_WRITE_WINDOW_MS", "50")),
+    compact_files=[f.strip() for f in os.getenv("STORAGE_COMPACT_FILES", "saldo.json,action_logs.json,coupons.json").split(",") if f.strip()]
+)
+atexit.register(storage_writer.flush)
+
+
+def read_json_view(filepath: str) -> Dict:
+    """Lê um documento sem copiar; o resultado é somente leitura"""
+    document = storage_writer.pending_document(filepath)
+    if document is None:
+        document = document_cache.get(filepath)
+    return document if document is not None else FrozenDict()
+
+
+def read_json_file(filepath: str) -> Dict:
+    """Lê um documento e retorna uma cópia editável"""
+    document = storage_writer.pending_document(filepath)
+    if document is None:
+        document = document_cache.get(filepath)
+    return thaw(document) if document is not None else {}
+
+
+def write_json_file(filepath: str, data: Dict, compact: Optional[bool] = None) -> None:
+    """Grava um documento de forma atômica, agrupando escritas em rajada"""
+    storage_writer.write(filepath, data, compact)
+
+
+def read_json_versioned(filepath: str) -> Tuple[Dict, DocumentVersion]:
+    """Lê uma cópia editável do documento junto com a versão em que foi lida"""
+    # A versão é obtida antes da leitura: se o arquivo mudar no meio, o CAS falha
+    version = storage_writer.version(filepath)
+    return read_json_file(filepath), version
+
+
+_update_locks: Dict[str, threading.Lock] = {}
+_update_locks_guard = threading.Lock()
+
+
+def _update_lock(filepath: str) -> threading.Lock:
+    key = os.path.abspath(filepath)
+    with _update_locks_guard:
+        lock = _update_locks.get(key)
+        if lock is None:
+            lock = _update_locks[key] = threading.Lock()
+        return lock
+
+
+def update_json_file(filepath: str, mutator: Callable[[Dict], Any], retries: int = 5) -> Any:
+    """
+    Read-modify-write com compare-and-swap
+
+    O mutator recebe uma cópia editável do documento e a altera no lugar. Se
+    outro escritor (o bot Node ou um write_now direto) gravar o arquivo nesse
+    meio tempo, o documento é relido e o mutator executado de novo. Exceções
+    do mutator cancelam a gravação e são propagadas.
+
+    Chamadas para o mesmo arquivo dentro do processo são serializadas: as
+    threads do run_blocking não disputam (e esgotam) as tentativas entre si.
+
+    Returns:
+        O valor retornado pelo mutator
+    """
+    with _update_lock(filepath):
+        for _ in range(retries):
+            data, version = read_json_versioned(filepath)
+            result = mutator(data)
+            try:
+                if storage_writer.write_now(filepath, data, expected_version=version) is None:
+                    raise OSError(f"Falha ao gravar {filepath}")
+                return result
+            except VersionConflict:
+                continue
+    raise VersionConflict(os.path.abspath(filepath))
+
+
+class ResourceLocks:
+    """
+    Locks asyncio por recurso, criados sob demanda
+
+    Recursos diferentes (ex.: cupons diferentes) seguem em paralelo; o mesmo
+    recurso é serializado dentro do processo. Os locks sem uso são descartados.
+    """
+
+    def __init__(self):
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._waiters: Dict[Hashable, int] = {}
+        self.acquisitions = 0
+        self.contended = 0
+
+    @asynccontextmanager
+    async def acquire(self, *keys: Hashable):
+        """
+        Adquire um ou mais recursos
+
+        Args:
+            *keys: Chaves dos recursos, ex.: ("coupon", codigo), ("saldo", user_id).
+                São adquiridas em ordem fixa para evitar deadlock.
+        """
+        ordered = sorted(set(keys), key=repr)
+        acquired = []
+        try:
+            for key in ordered:
+                lock = self._locks.get(key)
+                if lock is None:
+                    lock = self._locks[key] = asyncio.Lock()
+                self._waiters[key] = self._waiters.get(key, 0) + 1
+                if lock.locked():
+                    self.contended += 1
+                try:
+                    await lock.acquire()
+                except BaseException:
+                    self._release_ref(key)
+                    raise
+                acquired.append(key)
+                self.acquisitions += 1
+            yield
+        finally:
+            for key in reversed(acquired):
+                self._locks[key].release()
+                self._release_ref(key)
+
+    def _release_ref(self, key: Hashable) -> None:
+        self._waiters[key] -= 1
+        if not self._waiters[key]:
+            del self._waiters[key]
+            del self._locks[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ativos": len(self._locks),
+            "aquisicoes": self.acquisitions,
+            "contencoes": self.contended
+        }
+
+
+resource_locks = ResourceLocks()
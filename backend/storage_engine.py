@@ -0,0 +1,1027 @@
+"""
+Motores de armazenamento do painel
+Interface única para saldo, histórico, blacklist, cupons, webhooks e logs de
+ações, com implementação em arquivos JSON (padrão) ou SQLite em modo WAL
+"""
+
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+import json_codec
+from action_log import SegmentedActionLog, SortKey
+from saldo_journal import SaldoJournal
+from storage import VersionConflict, read_json_view, stat_signature, storage_writer, thaw, update_json_file
+
+DATA_DIR = "./DataBaseJson"
+
+# Arquivo JSON correspondente a cada tabela
+TABLE_FILES = {
+    "saldo": "saldo.json",
+    "historico": "historico.json",
+    "blacklist": "blacklist.json",
+    "coupons": "coupons.json",
+    "webhooks": "webhooks.json",
+    "action_logs": "action_logs.json",
+}
+
+# Tabelas espelhadas em JSON enquanto o bot Node ainda lê os arquivos
+MIRROR_TABLES = ("saldo", "historico", "blacklist", "coupons", "webhooks")
+
+# Pasta dos segmentos NDJSON do log de ações (motor json)
+ACTION_LOG_DIR = "action_logs"
+
+# Tentativas de exportar uma tabela quando o bot reescreve o arquivo no meio
+EXPORT_RETRIES = 5
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+class StorageEngine(ABC):
+    """
+    Interface comum dos motores de armazenamento
+
+    As listas e dicionários retornados são somente leitura; para alterar algo
+    use os métodos de escrita do próprio motor.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self._saldo_listeners: List[Callable[[Optional[Dict[str, float]]], None]] = []
+
+    # Saldo
+    def subscribe_saldo(self, callback: Callable[[Optional[Dict[str, float]]], None]) -> None:
+        """
+        Registra um callback chamado a cada alteração de saldo com
+        {user_id: novo saldo}, ou None quando todos os saldos foram recarregados
+        """
+        self._saldo_listeners.append(callback)
+
+    def _notify_saldo(self, changes: Optional[Dict[str, float]]) -> None:
+        for callback in self._saldo_listeners:
+            try:
+                callback(changes)
+            except Exception as e:
+                print(f"[Storage] Erro em listener de saldo: {e}")
+
+    def sync_saldo(self) -> None:
+        """Detecta alterações feitas pelo bot em saldo.json"""
+
+    def saldo_snapshot(self) -> Dict[str, float]:
+        """Cópia de todos os saldos como float"""
+        return {str(k): _to_float(v) for k, v in self.get_saldos().items()}
+
+    @abstractmethod
+    def get_saldos(self) -> Mapping[str, Any]:
+        raise NotImplementedError
+
+    def get_saldo(self, user_id: str) -> Optional[float]:
+        value = self.get_saldos().get(user_id)
+        return _to_float(value) if value is not None else None
+
+    @abstractmethod
+    def adjust_saldo(self, user_id: str, delta: float, reason: Optional[str] = None) -> float:
+        """Soma delta ao saldo do usuário (criando-o se necessário) e retorna o novo saldo"""
+        raise NotImplementedError
+
+    def saldo_summary(self) -> Tuple[int, int, float]:
+        """Retorna (usuários, usuários com saldo > 0, saldo total)"""
+        total_users = 0
+        users_with_balance = 0
+        total_balance = 0.0
+        for balance in self.get_saldos().values():
+            balance = _to_float(balance)
+            total_users += 1
+            if balance > 0:
+                users_with_balance += 1
+            total_balance += balance
+        return total_users, users_with_balance, total_balance
+
+    # Histórico
+    @abstractmethod
+    def get_historico(self) -> Dict[str, List[Dict]]:
+        raise NotImplementedError
+
+    # Blacklist
+    @abstractmethod
+    def list_blacklist(self) -> List[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_blacklist(self, entry: Dict) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def remove_blacklist(self, user_id: str) -> int:
+        """Remove todas as entradas do usuário e retorna quantas foram removidas"""
+        raise NotImplementedError
+
+    def count_blacklist(self) -> int:
+        return len(self.list_blacklist())
+
+    # Cupons
+    @abstractmethod
+    def list_coupons(self) -> List[Dict]:
+        raise NotImplementedError
+
+    def get_coupon(self, codigo: str) -> Optional[Dict]:
+        """Retorna uma cópia editável do cupom"""
+        for coupon in self.list_coupons():
+            if coupon.get("codigo") == codigo:
+                return thaw(coupon)
+        return None
+
+    @abstractmethod
+    def create_coupon(self, coupon: Dict) -> bool:
+        """Cria o cupom; retorna False se o código já existe"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def modify_coupon(self, codigo: str, mutator: Callable[[Dict], None]) -> Optional[Dict]:
+        """
+        Altera um cupom de forma atômica
+
+        O mutator recebe a versão mais recente do cupom e a altera no lugar;
+        exceções lançadas por ele cancelam a alteração.
+
+        Returns:
+            O cupom alterado ou None se o código não existe
+        """
+        raise NotImplementedError
+
+    def count_active_coupons(self) -> int:
+        return len([c for c in self.list_coupons() if c.get("ativo", True)])
+
+    # Webhooks
+    @abstractmethod
+    def list_webhooks(self) -> List[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_webhook(self, webhook: Dict) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def webhooks_version(self) -> Any:
+        """Valor que muda sempre que a lista de webhooks muda (cache da tabela de rotas)"""
+        raise NotImplementedError
+
+    # Logs de ações
+    @abstractmethod
+    def append_actions(self, entries: List[Dict]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def recent_actions(self, limit: int = 100) -> List[Dict]:
+        """Logs mais recentes primeiro"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_actions(self, since: Optional[str] = None) -> Iterable[Dict]:
+        """Logs em ordem cronológica, opcionalmente a partir de um timestamp ISO"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def query_actions(self, action: Optional[str] = None, user_id: Optional[str] = None,
+                      since: Optional[str] = None, until: Optional[str] = None,
+                      before: Optional[SortKey] = None, limit: int = 100) -> List[Dict]:
+        """
+        Página de logs em ordem decrescente de (timestamp, id)
+
+        Args:
+            before: Chave (timestamp, id) da última entrada da página anterior
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"engine": self.name}
+
+
+class JsonStorageEngine(StorageEngine):
+    """
+    Motor original: um documento JSON por tabela em DataBaseJson
+
+    O saldo fica em memória com journal append-only (ver saldo_journal) e é
+    exportado para saldo.json a cada compactação, no máximo compact_interval
+    depois da movimentação. Os logs de ações ficam em segmentos NDJSON (ver
+    action_log); action_logs.json só é lido na migração.
+    """
+
+    name = "json"
+
+    def __init__(self, data_dir: str = DATA_DIR, journal_options: Optional[Dict[str, Any]] = None,
+                 action_log_options: Optional[Dict[str, Any]] = None):
+        super().__init__()
+        self.data_dir = data_dir
+        self.saldo = SaldoJournal(
+            self._path("saldo"),
+            journal_path=os.path.join(data_dir, "saldo.journal.ndjson"),
+            snapshot_path=os.path.join(data_dir, "saldo.snapshot.json"),
+            on_change=self._notify_saldo,
+            **(journal_options or {})
+        )
+        self.actions = SegmentedActionLog(
+            os.path.join(data_dir, ACTION_LOG_DIR),
+            legacy_path=self._path("action_logs"),
+            **(action_log_options or {})
+        )
+
+    def _path(self, table: str) -> str:
+        return os.path.join(self.data_dir, TABLE_FILES[table])
+
+    def get_saldos(self) -> Mapping[str, float]:
+        return self.saldo.balances()
+
+    def get_saldo(self, user_id: str) -> Optional[float]:
+        return self.saldo.get(user_id)
+
+    def sync_saldo(self) -> None:
+        self.saldo.refresh()
+
+    def saldo_snapshot(self) -> Dict[str, float]:
+        return self.saldo.snapshot()
+
+    def adjust_saldo(self, user_id: str, delta: float, reason: Optional[str] = None) -> float:
+        return self.saldo.apply(user_id, delta, reason)
+
+    def saldo_summary(self) -> Tuple[int, int, float]:
+        return self.saldo.summary()
+
+    def get_historico(self) -> Dict[str, List[Dict]]:
+        return read_json_view(self._path("historico"))
+
+    def list_blacklist(self) -> List[Dict]:
+        return read_json_view(self._path("blacklist")).get("users", [])
+
+    def add_blacklist(self, entry: Dict) -> None:
+        def add(blacklist: Dict) -> None:
+            blacklist.setdefault("users", []).append(entry)
+
+        update_json_file(self._path("blacklist"), add)
+
+    def remove_blacklist(self, user_id: str) -> int:
+        def remove(blacklist: Dict) -> int:
+            users = blacklist.get("users", [])
+            blacklist["users"] = [u for u in users if u["user_id"] != user_id]
+            return len(users) - len(blacklist["users"])
+
+        return update_json_file(self._path("blacklist"), remove)
+
+    def list_coupons(self) -> List[Dict]:
+        return read_json_view(self._path("coupons")).get("coupons", [])
+
+    def create_coupon(self, coupon: Dict) -> bool:
+        def create(coupons: Dict) -> bool:
+            items = coupons.setdefault("coupons", [])
+            if any(c["codigo"] == coupon["codigo"] for c in items):
+                return False
+            items.append(coupon)
+            return True
+
+        return update_json_file(self._path("coupons"), create)
+
+    def modify_coupon(self, codigo: str, mutator: Callable[[Dict], None]) -> Optional[Dict]:
+        def modify(coupons: Dict) -> Optional[Dict]:
+            for coupon in coupons.get("coupons", []):
+                if coupon.get("codigo") == codigo:
+                    mutator(coupon)
+                    return coupon
+            return None
+
+        return update_json_file(self._path("coupons"), modify)
+
+    def list_webhooks(self) -> List[Dict]:
+        return read_json_view(self._path("webhooks")).get("webhooks", [])
+
+    def add_webhook(self, webhook: Dict) -> None:
+        def add(webhooks: Dict) -> None:
+            webhooks.setdefault("webhooks", []).append(webhook)
+
+        update_json_file(self._path("webhooks"), add)
+
+    def webhooks_version(self) -> Any:
+        return storage_writer.version(self._path("webhooks"))
+
+    def append_actions(self, entries: List[Dict]) -> None:
+        self.actions.append(entries)
+
+    def recent_actions(self, limit: int = 100) -> List[Dict]:
+        return self.actions.recent(limit)
+
+    def list_actions(self, since: Optional[str] = None) -> Iterable[Dict]:
+        return self.actions.scan(since=since)
+
+    def query_actions(self, action: Optional[str] = None, user_id: Optional[str] = None,
+                      since: Optional[str] = None, until: Optional[str] = None,
+                      before: Optional[SortKey] = None, limit: int = 100) -> List[Dict]:
+        return self.actions.query(action, user_id, since, until, before, limit)
+
+    def close(self) -> None:
+        self.saldo.close()
+        self.actions.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "engine": self.name,
+            "saldo_journal": self.saldo.stats(),
+            "action_log": self.actions.stats()
+        }
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    chave TEXT PRIMARY KEY,
+    valor TEXT
+);
+CREATE TABLE IF NOT EXISTS saldo (
+    user_id TEXT PRIMARY KEY,
+    valor REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_saldo_valor ON saldo(valor);
+CREATE TABLE IF NOT EXISTS saldo_journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    delta REAL NOT NULL,
+    reason TEXT,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_saldo_journal_user ON saldo_journal(user_id, seq);
+CREATE TABLE IF NOT EXISTS historico (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    registro_id TEXT,
+    valor REAL,
+    status TEXT,
+    timestamp INTEGER,
+    dados TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_historico_user ON historico(user_id);
+CREATE INDEX IF NOT EXISTS idx_historico_timestamp ON historico(timestamp);
+CREATE TABLE IF NOT EXISTS blacklist (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT UNIQUE,
+    user_id TEXT NOT NULL,
+    expira_em TEXT,
+    dados TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_blacklist_user ON blacklist(user_id);
+CREATE TABLE IF NOT EXISTS coupons (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT,
+    codigo TEXT NOT NULL UNIQUE,
+    ativo INTEGER NOT NULL DEFAULT 1,
+    dados TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS webhooks (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT UNIQUE,
+    ativo INTEGER NOT NULL DEFAULT 1,
+    dados TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_webhooks_ativo ON webhooks(ativo);
+CREATE TABLE IF NOT EXISTS action_logs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT UNIQUE,
+    timestamp TEXT NOT NULL,
+    action TEXT NOT NULL,
+    user_id TEXT,
+    dados TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_action_logs_timestamp ON action_logs(timestamp);
+CREATE INDEX IF NOT EXISTS idx_action_logs_action ON action_logs(action, timestamp);
+CREATE INDEX IF NOT EXISTS idx_action_logs_user ON action_logs(user_id, timestamp);
+CREATE TABLE IF NOT EXISTS espelho_pendente (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    tabela TEXT NOT NULL,
+    operacao TEXT NOT NULL,
+    dados TEXT NOT NULL
+);
+"""
+
+
+def _dumps(value: Any) -> str:
+    return json_codec.dumps_str(value)
+
+
+class SqliteStorageEngine(StorageEngine):
+    """
+    Motor SQLite (modo WAL) com tabelas indexadas
+
+    Durante a transição as tabelas usadas pelo bot Node são espelhadas de volta
+    nos arquivos JSON (com atraso de export_delay_ms, agrupando rajadas), e
+    alterações feitas pelo bot nesses arquivos são importadas de volta.
+    As alterações do painel ainda não exportadas ficam em espelho_pendente e
+    são reaplicadas sobre o arquivo quando o bot o reescreve nesse meio tempo.
+
+    Com auto_import (padrão) um banco vazio importa todas as tabelas ao abrir;
+    a CLI de migração desliga para importar/exportar só o que foi pedido.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, db_path: str, data_dir: str = DATA_DIR, mirror_json: bool = True, export_delay_ms: int = 1000,
+                 action_retention_days: int = 0, auto_import: bool = True):
+        super().__init__()
+        self.db_path = db_path
+        self.data_dir = data_dir
+        self.mirror_json = mirror_json
+        self.export_delay = max(export_delay_ms, 0) / 1000
+        self.action_retention_days = action_retention_days
+        self._retention_day: Optional[str] = None
+        self._lock = threading.RLock()
+        self._dirty = set()
+        self._export_timer: Optional[threading.Timer] = None
+        self._mirror_signatures: Dict[str, Any] = {}
+        self.imports = 0
+        self.exports = 0
+        self._webhooks_generation = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+        if self._get_meta("importado_em") is None:
+            if not auto_import:
+                return
+            print(f"[Storage] Banco SQLite vazio, importando {data_dir}")
+            self.import_json()
+        elif self.mirror_json:
+            # Alterações feitas pelo bot enquanto o painel estava parado
+            for table in MIRROR_TABLES:
+                signature = self._get_meta(f"espelho:{table}")
+                if signature is not None:
+                    self._mirror_signatures[table] = tuple(json_codec.loads(signature))
+                self._sync_from_mirror(table)
+            # Alterações do painel que não chegaram a ser exportadas antes de parar
+            for row in self._conn.execute("SELECT DISTINCT tabela FROM espelho_pendente").fetchall():
+                self._mark_dirty(row["tabela"])
+
+    # Infraestrutura
+    def _path(self, table: str) -> str:
+        return os.path.join(self.data_dir, TABLE_FILES[table])
+
+    def _get_meta(self, chave: str) -> Optional[str]:
+        row = self._conn.execute("SELECT valor FROM meta WHERE chave = ?", (chave,)).fetchone()
+        return row["valor"] if row else None
+
+    def _record_signature(self, table: str, signature: Any) -> None:
+        self._mirror_signatures[table] = signature
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (chave, valor) VALUES (?, ?)",
+            (f"espelho:{table}", json_codec.dumps_str(list(signature)))
+        )
+
+    def _transaction(self):
+        return _Transaction(self._conn, self._lock)
+
+    def _sync_from_mirror(self, table: str) -> None:
+        """Importa o arquivo JSON da tabela se ele foi alterado por outro processo"""
+        if not self.mirror_json:
+            return
+        path = self._path(table)
+        try:
+            signature = stat_signature(os.stat(path))
+        except FileNotFoundError:
+            return
+
+        with self._lock:
+            if signature == self._mirror_signatures.get(table):
+                return
+            with self._transaction():
+                self._import_table(table, read_json_view(path))
+                self._record_signature(table, signature)
+                replayed = self._replay_pending(table)
+            if replayed:
+                print(f"[Storage] {TABLE_FILES[table]} alterado externamente; "
+                      f"{replayed} alteração(ões) do painel reaplicada(s) sobre ele")
+                self._mark_dirty(table)
+            else:
+                self._dirty.discard(table)
+            self.imports += 1
+        if table == "saldo":
+            self._notify_saldo(None)
+
+    def _record_pending(self, table: str, operation: str, data: Dict) -> None:
+        """Guarda uma alteração do painel até a tabela ser exportada (dentro da transação)"""
+        if self.mirror_json and table in MIRROR_TABLES:
+            self._conn.execute(
+                "INSERT INTO espelho_pendente (tabela, operacao, dados) VALUES (?, ?, ?)",
+                (table, operation, _dumps(data))
+            )
+
+    def _replay_pending(self, table: str) -> int:
+        """Reaplica as alterações pendentes da tabela sobre o conteúdo recém-importado"""
+        rows = self._conn.execute(
+            "SELECT operacao, dados FROM espelho_pendente WHERE tabela = ? ORDER BY seq", (table,)
+        ).fetchall()
+        for row in rows:
+            data = json_codec.loads(row["dados"])
+            operation = row["operacao"]
+            if operation == "saldo":
+                self._add_saldo(data["user_id"], data["delta"])
+            elif operation == "blacklist_add":
+                self._put_blacklist(data)
+            elif operation == "blacklist_remove":
+                self._conn.execute("DELETE FROM blacklist WHERE user_id = ?", (data["user_id"],))
+            elif operation == "coupon_create":
+                # O bot criou o mesmo código nesse meio tempo: a versão dele prevalece
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO coupons (id, codigo, ativo, dados) VALUES (?, ?, ?, ?)",
+                    (data.get("id"), data["codigo"], int(bool(data.get("ativo", True))), _dumps(data))
+                )
+            elif operation == "coupon_patch":
+                found = self._conn.execute("SELECT dados FROM coupons WHERE codigo = ?", (data["codigo"],)).fetchone()
+                if found is None:
+                    continue
+                coupon = json_codec.loads(found["dados"])
+                coupon.update(data["campos"])
+                # Usos são somados aos do arquivo, não sobrescritos
+                coupon["usos_atual"] = coupon.get("usos_atual", 0) + data["usos"]
+                self._put_coupon(data["codigo"], coupon)
+            elif operation == "webhook_add":
+                self._put_webhook(data)
+        return len(rows)
+
+    def _clear_pending(self, table: str) -> None:
+        self._conn.execute("DELETE FROM espelho_pendente WHERE tabela = ?", (table,))
+
+    def _mark_dirty(self, table: str) -> None:
+        if not self.mirror_json or table not in MIRROR_TABLES:
+            return
+        with self._lock:
+            self._dirty.add(table)
+            if self._export_timer is None:
+                self._export_timer = threading.Timer(self.export_delay, self.export_dirty)
+                self._export_timer.daemon = True
+                self._export_timer.start()
+
+    def export_dirty(self) -> None:
+        """Regrava nos arquivos JSON as tabelas alteradas desde o último espelhamento"""
+        with self._lock:
+            if self._export_timer is not None:
+                self._export_timer.cancel()
+                self._export_timer = None
+            tables = list(self._dirty)
+            self._dirty.clear()
+            for table in tables:
+                self._export_mirror(table)
+
+    def _export_mirror(self, table: str) -> None:
+        """Grava a tabela no arquivo JSON sem sobrescrever uma alteração do bot"""
+        path = self._path(table)
+        for _ in range(EXPORT_RETRIES):
+            # Se o bot reescreveu o arquivo, importa e reaplica as pendências antes
+            self._sync_from_mirror(table)
+            version = storage_writer.version(path)
+            if version[1] is not None and version[1] != self._mirror_signatures.get(table):
+                continue
+            try:
+                st = storage_writer.write_now(path, self._export_table(table), expected_version=version)
+            except VersionConflict:
+                continue
+            if st is not None:
+                with self._transaction():
+                    self._record_signature(table, stat_signature(st))
+                    self._clear_pending(table)
+                self._dirty.discard(table)
+                self.exports += 1
+            return
+        print(f"[Storage] {TABLE_FILES[table]} mudou durante a exportação, tentando de novo depois")
+        self._mark_dirty(table)
+
+    # Importação / exportação
+    def _import_table(self, table: str, document: Any) -> None:
+        conn = self._conn
+        conn.execute(f"DELETE FROM {table}")
+
+        if table == "saldo":
+            conn.executemany(
+                "INSERT INTO saldo (user_id, valor) VALUES (?, ?)",
+                ((str(user_id), _to_float(valor)) for user_id, valor in document.items())
+            )
+        elif table == "historico":
+            rows = []
+            for user_id, registros in document.items():
+                if not isinstance(registros, list):
+                    continue
+                for registro in registros:
+                    rows.append((
+                        str(user_id), str(registro.get("id")) if registro.get("id") is not None else None,
+                        _to_float(registro.get("valor")), registro.get("status"),
+                        registro.get("timestamp"), _dumps(registro)
+                    ))
+            conn.executemany(
+                "INSERT INTO historico (user_id, registro_id, valor, status, timestamp, dados) VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        elif table == "blacklist":
+            conn.executemany(
+                "INSERT OR REPLACE INTO blacklist (id, user_id, expira_em, dados) VALUES (?, ?, ?, ?)",
+                ((e.get("id"), e.get("user_id", ""), e.get("expira_em"), _dumps(e)) for e in document.get("users", []))
+            )
+        elif table == "coupons":
+            conn.executemany(
+                "INSERT OR REPLACE INTO coupons (id, codigo, ativo, dados) VALUES (?, ?, ?, ?)",
+                ((c.get("id"), c.get("codigo", ""), int(bool(c.get("ativo", True))), _dumps(c)) for c in document.get("coupons", []))
+            )
+        elif table == "webhooks":
+            self._webhooks_generation += 1
+            conn.executemany(
+                "INSERT OR REPLACE INTO webhooks (id, ativo, dados) VALUES (?, ?, ?)",
+                ((w.get("id"), int(bool(w.get("ativo", False))), _dumps(w)) for w in document.get("webhooks", []))
+            )
+        elif table == "action_logs":
+            self._insert_actions(document.get("logs", []))
+
+    def _export_table(self, table: str) -> Any:
+        if table == "saldo":
+            return {row["user_id"]: row["valor"] for row in self._conn.execute("SELECT user_id, valor FROM saldo")}
+        if table == "historico":
+            historico: Dict[str, List[Dict]] = {}
+            for row in self._conn.execute("SELECT user_id, dados FROM historico ORDER BY seq"):
+                historico.setdefault(row["user_id"], []).append(json_codec.loads(row["dados"]))
+            return historico
+        if table == "blacklist":
+            return {"users": self._load_all("SELECT dados FROM blacklist ORDER BY seq")}
+        if table == "coupons":
+            return {"coupons": self._load_all("SELECT dados FROM coupons ORDER BY seq")}
+        if table == "webhooks":
+            return {"webhooks": self._load_all("SELECT dados FROM webhooks ORDER BY seq")}
+        if table == "action_logs":
+            return {"logs": self._load_all("SELECT dados FROM action_logs ORDER BY seq")}
+        raise KeyError(table)
+
+    def _read_source(self, table: str) -> Any:
+        segments = os.path.join(self.data_dir, ACTION_LOG_DIR)
+        if table == "action_logs" and os.path.isdir(segments):
+            # Logs gravados pelo motor json ficam nos segmentos NDJSON
+            actions = SegmentedActionLog(segments)
+            try:
+                return {"logs": list(actions.scan())}
+            finally:
+                actions.close()
+        return read_json_view(self._path(table))
+
+    def import_json(self, tables: Iterable[str] = TABLE_FILES) -> None:
+        """Importa (substituindo) as tabelas a partir dos arquivos JSON"""
+        with self._lock:
+            with self._transaction():
+                for table in tables:
+                    self._import_table(table, self._read_source(table))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta (chave, valor) VALUES ('importado_em', ?)",
+                    (datetime.now(timezone.utc).isoformat(),)
+                )
+                for table in tables:
+                    try:
+                        self._record_signature(table, stat_signature(os.stat(self._path(table))))
+                    except FileNotFoundError:
+                        pass
+                    self._dirty.discard(table)
+            self.imports += 1
+        if "saldo" in tables:
+            self._notify_saldo(None)
+
+    def export_json(self, tables: Iterable[str] = TABLE_FILES) -> None:
+        """Exporta as tabelas para os arquivos JSON no formato original"""
+        with self._lock:
+            for table in tables:
+                st = storage_writer.write_now(self._path(table), self._export_table(table))
+                if st is not None:
+                    with self._transaction():
+                        self._record_signature(table, stat_signature(st))
+                        self._clear_pending(table)
+                    self.exports += 1
+                self._dirty.discard(table)
+
+    def _load_all(self, query: str, params: Tuple = ()) -> List[Dict]:
+        return [json_codec.loads(row["dados"]) for row in self._conn.execute(query, params)]
+
+    # Saldo
+    def get_saldos(self) -> Dict[str, Any]:
+        self._sync_from_mirror("saldo")
+        with self._lock:
+            return self._export_table("saldo")
+
+    def get_saldo(self, user_id: str) -> Optional[float]:
+        self._sync_from_mirror("saldo")
+        with self._lock:
+            row = self._conn.execute("SELECT valor FROM saldo WHERE user_id = ?", (user_id,)).fetchone()
+        return row["valor"] if row else None
+
+    def adjust_saldo(self, user_id: str, delta: float, reason: Optional[str] = None) -> float:
+        self._sync_from_mirror("saldo")
+        with self._transaction():
+            self._add_saldo(user_id, delta)
+            self._record_pending("saldo", "saldo", {"user_id": user_id, "delta": delta})
+            self._conn.execute(
+                "INSERT INTO saldo_journal (user_id, delta, reason, timestamp) VALUES (?, ?, ?, ?)",
+                (user_id, delta, reason, datetime.now(timezone.utc).isoformat())
+            )
+            novo_saldo = self._conn.execute("SELECT valor FROM saldo WHERE user_id = ?", (user_id,)).fetchone()["valor"]
+        self._mark_dirty("saldo")
+        self._notify_saldo({user_id: novo_saldo})
+        return novo_saldo
+
+    def _add_saldo(self, user_id: str, delta: float) -> None:
+        self._conn.execute(
+            "INSERT INTO saldo (user_id, valor) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET valor = valor + excluded.valor",
+            (user_id, delta)
+        )
+
+    def sync_saldo(self) -> None:
+        self._sync_from_mirror("saldo")
+
+    def saldo_summary(self) -> Tuple[int, int, float]:
+        self._sync_from_mirror("saldo")
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) AS total, SUM(valor > 0) AS positivos, COALESCE(SUM(valor), 0) AS soma FROM saldo"
+            ).fetchone()
+        return row["total"], row["positivos"] or 0, row["soma"]
+
+    # Histórico
+    def get_historico(self) -> Dict[str, List[Dict]]:
+        self._sync_from_mirror("historico")
+        with self._lock:
+            return self._export_table("historico")
+
+    # Blacklist
+    def list_blacklist(self) -> List[Dict]:
+        self._sync_from_mirror("blacklist")
+        with self._lock:
+            return self._load_all("SELECT dados FROM blacklist ORDER BY seq")
+
+    def add_blacklist(self, entry: Dict) -> None:
+        self._sync_from_mirror("blacklist")
+        with self._transaction():
+            self._put_blacklist(entry)
+            self._record_pending("blacklist", "blacklist_add", entry)
+        self._mark_dirty("blacklist")
+
+    def _put_blacklist(self, entry: Dict) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO blacklist (id, user_id, expira_em, dados) VALUES (?, ?, ?, ?)",
+            (entry.get("id"), entry["user_id"], entry.get("expira_em"), _dumps(entry))
+        )
+
+    def remove_blacklist(self, user_id: str) -> int:
+        self._sync_from_mirror("blacklist")
+        with self._transaction():
+            removed = self._conn.execute("DELETE FROM blacklist WHERE user_id = ?", (user_id,)).rowcount
+            self._record_pending("blacklist", "blacklist_remove", {"user_id": user_id})
+        self._mark_dirty("blacklist")
+        return removed
+
+    def count_blacklist(self) -> int:
+        self._sync_from_mirror("blacklist")
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM blacklist").fetchone()[0]
+
+    # Cupons
+    def list_coupons(self) -> List[Dict]:
+        self._sync_from_mirror("coupons")
+        with self._lock:
+            return self._load_all("SELECT dados FROM coupons ORDER BY seq")
+
+    def get_coupon(self, codigo: str) -> Optional[Dict]:
+        self._sync_from_mirror("coupons")
+        with self._lock:
+            row = self._conn.execute("SELECT dados FROM coupons WHERE codigo = ?", (codigo,)).fetchone()
+        return json_codec.loads(row["dados"]) if row else None
+
+    def create_coupon(self, coupon: Dict) -> bool:
+        self._sync_from_mirror("coupons")
+        try:
+            with self._transaction():
+                self._conn.execute(
+                    "INSERT INTO coupons (id, codigo, ativo, dados) VALUES (?, ?, ?, ?)",
+                    (coupon.get("id"), coupon["codigo"], int(bool(coupon.get("ativo", True))), _dumps(coupon))
+                )
+                self._record_pending("coupons", "coupon_create", coupon)
+        except sqlite3.IntegrityError:
+            return False
+        self._mark_dirty("coupons")
+        return True
+
+    def modify_coupon(self, codigo: str, mutator: Callable[[Dict], None]) -> Optional[Dict]:
+        self._sync_from_mirror("coupons")
+        # BEGIN IMMEDIATE: leitura e escrita na mesma transação de escrita
+        with self._transaction():
+            row = self._conn.execute("SELECT dados FROM coupons WHERE codigo = ?", (codigo,)).fetchone()
+            if row is None:
+                return None
+            coupon = json_codec.loads(row["dados"])
+            before = json_codec.loads(row["dados"])
+            mutator(coupon)
+            self._put_coupon(codigo, coupon)
+            # Só o que o painel mudou: campos alterados e quantos usos somou
+            self._record_pending("coupons", "coupon_patch", {
+                "codigo": codigo,
+                "campos": {k: v for k, v in coupon.items() if k != "usos_atual" and before.get(k) != v},
+                "usos": coupon.get("usos_atual", 0) - before.get("usos_atual", 0)
+            })
+        self._mark_dirty("coupons")
+        return coupon
+
+    def _put_coupon(self, codigo: str, coupon: Dict) -> None:
+        self._conn.execute(
+            "UPDATE coupons SET id = ?, ativo = ?, dados = ? WHERE codigo = ?",
+            (coupon.get("id"), int(bool(coupon.get("ativo", True))), _dumps(coupon), codigo)
+        )
+
+    def count_active_coupons(self) -> int:
+        self._sync_from_mirror("coupons")
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM coupons WHERE ativo = 1").fetchone()[0]
+
+    # Webhooks
+    def list_webhooks(self) -> List[Dict]:
+        self._sync_from_mirror("webhooks")
+        with self._lock:
+            return self._load_all("SELECT dados FROM webhooks ORDER BY seq")
+
+    def add_webhook(self, webhook: Dict) -> None:
+        self._sync_from_mirror("webhooks")
+        with self._transaction():
+            self._put_webhook(webhook)
+            self._record_pending("webhooks", "webhook_add", webhook)
+        self._mark_dirty("webhooks")
+
+    def _put_webhook(self, webhook: Dict) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO webhooks (id, ativo, dados) VALUES (?, ?, ?)",
+            (webhook.get("id"), int(bool(webhook.get("ativo", False))), _dumps(webhook))
+        )
+        self._webhooks_generation += 1
+
+    def webhooks_version(self) -> Any:
+        self._sync_from_mirror("webhooks")
+        return self._webhooks_generation
+
+    # Logs de ações
+    def _insert_actions(self, entries: Iterable[Dict]) -> None:
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO action_logs (id, timestamp, action, user_id, dados) VALUES (?, ?, ?, ?, ?)",
+            ((e.get("id"), e.get("timestamp", ""), e.get("action", ""), e.get("user_id"), _dumps(e)) for e in entries)
+        )
+
+    def append_actions(self, entries: List[Dict]) -> None:
+        with self._transaction():
+            self._insert_actions(entries)
+            self._apply_action_retention()
+
+    def _apply_action_retention(self) -> None:
+        """Remove logs mais antigos que action_retention_days (no máximo uma vez por dia)"""
+        if self.action_retention_days <= 0:
+            return
+        now = datetime.now(timezone.utc)
+        if self._retention_day == now.date().isoformat():
+            return
+        cutoff = (now - timedelta(days=self.action_retention_days)).isoformat()
+        self._conn.execute("DELETE FROM action_logs WHERE timestamp < ?", (cutoff,))
+        self._retention_day = now.date().isoformat()
+
+    def recent_actions(self, limit: int = 100) -> List[Dict]:
+        with self._lock:
+            return self._load_all("SELECT dados FROM action_logs ORDER BY timestamp DESC LIMIT ?", (limit,))
+
+    def list_actions(self, since: Optional[str] = None) -> Iterable[Dict]:
+        with self._lock:
+            if since is None:
+                return self._load_all("SELECT dados FROM action_logs ORDER BY timestamp")
+            return self._load_all("SELECT dados FROM action_logs WHERE timestamp >= ? ORDER BY timestamp", (since,))
+
+    def query_actions(self, action: Optional[str] = None, user_id: Optional[str] = None,
+                      since: Optional[str] = None, until: Optional[str] = None,
+                      before: Optional[SortKey] = None, limit: int = 100) -> List[Dict]:
+        conditions, params = [], []
+        if action is not None:
+            conditions.append("action = ?")
+            params.append(action)
+        if user_id is not None:
+            conditions.append("user_id = ?")
+            params.append(user_id)
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("timestamp < ?")
+            params.append(until)
+        if before is not None:
+            conditions.append("(timestamp < ? OR (timestamp = ? AND COALESCE(id, '') < ?))")
+            params.extend([before[0], before[0], before[1]])
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        params.append(limit)
+        with self._lock:
+            return self._load_all(
+                f"SELECT dados FROM action_logs {where} ORDER BY timestamp DESC, COALESCE(id, '') DESC LIMIT ?",
+                tuple(params)
+            )
+
+    def close(self) -> None:
+        self.export_dirty()
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "engine": self.name,
+            "arquivo": self.db_path,
+            "espelho_json": self.mirror_json,
+            "pendentes_exportacao": sorted(self._dirty),
+            "importacoes": self.imports,
+            "exportacoes": self.exports
+        }
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE/COMMIT sob o lock do motor"""
+
+    def __init__(self, conn: sqlite3.Connection, lock: threading.RLock):
+        self._conn = conn
+        self._lock = lock
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._conn.in_transaction:
+            self._nested = True
+        else:
+            self._nested = False
+            self._conn.execute("BEGIN IMMEDIATE")
+        return self._conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if not self._nested:
+                self._conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        finally:
+            self._lock.release()
+        return False
+
+
+def create_engine() -> StorageEngine:
+    """Cria o motor configurado em STORAGE_ENGINE (json ou sqlite)"""
+    kind = os.getenv("STORAGE_ENGINE", "json").lower()
+    if kind == "sqlite":
+        return SqliteStorageEngine(
+            db_path=os.getenv("STORAGE_SQLITE_PATH", os.path.join(DATA_DIR, "gringolindo.db")),
+            mirror_json=os.getenv("STORAGE_SQLITE_MIRROR_JSON", "true").lower() == "true",
+            export_delay_ms=int(os.getenv("STORAGE_SQLITE_EXPORT_DELAY_MS", "1000")),
+            action_retention_days=int(os.getenv("ACTION_LOG_RETENTION_DAYS", "0"))
+        )
+    return JsonStorageEngine(
+        journal_options={
+            "compact_entries": int(os.getenv("SALDO_JOURNAL_COMPACT_ENTRIES", "1000")),
+            "compact_interval": float(os.getenv("SALDO_JOURNAL_COMPACT_INTERVAL_S", "1")),
+            "fsync": os.getenv("SALDO_JOURNAL_FSYNC", "false").lower() == "true"
+        },
+        action_log_options={
+            "segment_max_bytes": int(float(os.getenv("ACTION_LOG_SEGMENT_MB", "8")) * 1024 * 1024),
+            "index_every": int(os.getenv("ACTION_LOG_INDEX_EVERY", "256")),
+            "retention_days": int(os.getenv("ACTION_LOG_RETENTION_DAYS", "0")),
+            "retention_bytes": int(float(os.getenv("ACTION_LOG_RETENTION_MB", "0")) * 1024 * 1024)
+        }
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Migração entre DataBaseJson e SQLite")
+    parser.add_argument("action", choices=["import", "export"], help="import: JSON -> SQLite, export: SQLite -> JSON")
+    parser.add_argument("--db", default=os.getenv("STORAGE_SQLITE_PATH", os.path.join(DATA_DIR, "gringolindo.db")), help="Arquivo do banco SQLite")
+    parser.add_argument("--dir", default=DATA_DIR, help="Diretório dos arquivos JSON (padrão: ./DataBaseJson)")
+    parser.add_argument("--tables", default=",".join(TABLE_FILES), help="Tabelas separadas por vírgula")
+    args = parser.parse_args()
+
+    tables = [t.strip() for t in args.tables.split(",") if t.strip()]
+    invalid = [t for t in tables if t not in TABLE_FILES]
+    if invalid:
+        parser.error(f"Tabelas inválidas: {', '.join(invalid)}")
+
+    sqlite_engine = SqliteStorageEngine(args.db, data_dir=args.dir, mirror_json=False, auto_import=False)
+    if args.action == "import":
+        sqlite_engine.import_json(tables)
+        print(f"✅ {len(tables)} tabela(s) importada(s) para {args.db}")
+    else:
+        sqlite_engine.export_json(tables)
+        print(f"✅ {len(tables)} tabela(s) exportada(s) para {args.dir}")
+    sqlite_engine.close()
+    storage_writer.flush()
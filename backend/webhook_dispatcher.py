@@ -0,0 +1,544 @@
+"""
+Entrega de webhooks em segundo plano
+Eventos viram linhas de uma caixa de saída em SQLite (sobrevive a reinícios);
+um despachante entrega com conexões reaproveitadas, limite de envios
+simultâneos por endpoint, novas tentativas com backoff exponencial + jitter
+e, esgotadas as tentativas, move a entrega para a fila de mortos.
+Quem gera o evento só paga a inserção na caixa de saída.
+
+Opcionalmente, rajadas de eventos para o mesmo endpoint são agrupadas em uma
+única entrega cujo corpo é uma lista de eventos (janela configurável).
+"""
+
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import httpx
+
+import json_codec
+from async_io import run_blocking
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    webhook_id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    tentativas INTEGER NOT NULL DEFAULT 0,
+    proxima REAL NOT NULL,
+    criado_em REAL NOT NULL,
+    ultimo_erro TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_proxima ON outbox(proxima);
+CREATE TABLE IF NOT EXISTS dead_letter (
+    id INTEGER PRIMARY KEY,
+    webhook_id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    tentativas INTEGER NOT NULL,
+    criado_em REAL NOT NULL,
+    falhou_em REAL NOT NULL,
+    ultimo_erro TEXT
+);
+CREATE TABLE IF NOT EXISTS estatisticas (
+    webhook_id TEXT PRIMARY KEY,
+    dados TEXT NOT NULL
+);
+"""
+
+# Respostas 4xx que valem nova tentativa; as demais 4xx vão direto para os mortos
+RETRYABLE_STATUS = {408, 409, 425, 429}
+
+# Erros que nenhuma nova tentativa resolve (URL inválida ou sem http/https)
+PERMANENT_ERRORS = (httpx.InvalidURL, httpx.UnsupportedProtocol)
+
+
+class DeliveryError(Exception):
+    def __init__(self, message: str, permanent: bool = False, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.permanent = permanent
+        self.retry_after = retry_after
+
+
+class WebhookRouter:
+    """
+    Tabela evento -> webhooks ativos
+
+    Reconstruída só quando a versão da lista de webhooks muda, em vez de
+    percorrer todos os webhooks a cada evento.
+
+    Args:
+        list_webhooks: Retorna a lista completa de webhooks
+        version: Retorna um valor que muda quando a lista muda
+    """
+
+    def __init__(self, list_webhooks: Callable[[], List[Dict]], version: Callable[[], Any]):
+        self._list_webhooks = list_webhooks
+        self._version = version
+        self._built_version: Any = None
+        self._routes: Dict[str, Tuple[Dict, ...]] = {}
+        self._built = False
+        self.rebuilds = 0
+
+    def _rebuild(self, version: Any) -> None:
+        routes: Dict[str, List[Dict]] = {}
+        for webhook in self._list_webhooks():
+            if not webhook.get("ativo", False):
+                continue
+            for event in dict.fromkeys(webhook.get("eventos", [])):
+                routes.setdefault(event, []).append(webhook)
+        self._routes = {event: tuple(targets) for event, targets in routes.items()}
+        self._built_version = version
+        self._built = True
+        self.rebuilds += 1
+
+    def targets(self, event: str) -> Tuple[Dict, ...]:
+        """Webhooks ativos inscritos no evento"""
+        version = self._version()
+        if not self._built or version != self._built_version:
+            self._rebuild(version)
+        return self._routes.get(event, ())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "eventos": len(self._routes),
+            "rotas": sum(len(targets) for targets in self._routes.values()),
+            "reconstrucoes": self.rebuilds
+        }
+
+
+class WebhookDispatcher:
+    """
+    Args:
+        path: Arquivo SQLite da caixa de saída
+        client_factory: Retorna o httpx.AsyncClient compartilhado
+        max_concurrency: Entregas simultâneas no total
+        endpoint_concurrency: Entregas simultâneas por URL
+        max_attempts: Tentativas antes de ir para a fila de mortos
+        backoff_base: Espera (segundos) após a primeira falha; dobra a cada falha
+        backoff_max: Espera máxima entre tentativas
+        timeout: Timeout de cada entrega (segundos)
+        batch_window: Janela (segundos) de agrupamento por endpoint; 0 desliga.
+            Com agrupamento o corpo é sempre uma lista de eventos, e os eventos
+            ainda na janela só vão para a caixa de saída quando ela fecha.
+        batch_max: Eventos por lote; o lote cheio é enfileirado na hora
+    """
+
+    def __init__(self, path: str, client_factory, max_concurrency: int = 20, endpoint_concurrency: int = 2,
+                 max_attempts: int = 8, backoff_base: float = 2.0, backoff_max: float = 600.0,
+                 timeout: float = 10.0, batch_window: float = 0.0, batch_max: int = 100):
+        self.path = path
+        self.client_factory = client_factory
+        self.max_concurrency = max(max_concurrency, 1)
+        self.endpoint_concurrency = max(endpoint_concurrency, 1)
+        self.max_attempts = max(max_attempts, 1)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.batch_window = max(batch_window, 0.0)
+        self.batch_max = max(batch_max, 1)
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+        self._stats: Dict[str, Dict[str, Any]] = {
+            webhook_id: json_codec.loads(dados)
+            for webhook_id, dados in self._conn.execute("SELECT webhook_id, dados FROM estatisticas")
+        }
+        self._inflight: Set[int] = set()
+        self._endpoint_inflight: Dict[str, int] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        # Gravações de lotes fechados: o encerramento espera, não cancela
+        self._stores: Set[asyncio.Future] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._closing = False
+        # (webhook_id, url) -> (timer da janela, eventos do lote)
+        self._batches: Dict[Tuple[str, str], Tuple[asyncio.TimerHandle, List[Dict]]] = {}
+        self.enqueued = 0
+        self.batches_sent = 0
+        self.batched_events = 0
+
+    # Produção
+    def enqueue(self, webhooks: Iterable[Dict], payload: Dict) -> int:
+        """
+        Grava uma entrega por webhook na caixa de saída e acorda o despachante
+
+        Com agrupamento ligado (e chamado no event loop do despachante) o
+        evento entra no lote aberto de cada endpoint.
+
+        Returns:
+            Número de webhooks que receberão o evento
+        """
+        webhooks = list(webhooks)
+        if not webhooks:
+            return 0
+        if self.batch_window > 0 and self._on_loop():
+            for webhook in webhooks:
+                self._add_to_batch(str(webhook.get("id") or webhook["url"]), webhook["url"], payload)
+            return len(webhooks)
+        return self._insert(self._entries(webhooks, payload))
+
+    async def aenqueue(self, webhooks: Iterable[Dict], payload: Dict) -> int:
+        """Como enqueue, mas a inserção no SQLite roda fora do event loop"""
+        webhooks = list(webhooks)
+        if not webhooks:
+            return 0
+        if self.batch_window > 0 and self._on_loop():
+            return self.enqueue(webhooks, payload)
+        return await run_blocking(self._insert, self._entries(webhooks, payload))
+
+    @staticmethod
+    def _entries(webhooks: List[Dict], payload: Dict) -> List[Tuple[str, str, str]]:
+        body = json_codec.dumps_str(payload)
+        return [(str(w.get("id") or w["url"]), w["url"], body) for w in webhooks]
+
+    def _on_loop(self) -> bool:
+        if self._loop is None:
+            return False
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _add_to_batch(self, webhook_id: str, url: str, payload: Dict) -> None:
+        key = (webhook_id, url)
+        batch = self._batches.get(key)
+        if batch is None:
+            timer = self._loop.call_later(self.batch_window, self._close_batch, key)
+            batch = self._batches[key] = (timer, [])
+        batch[1].append(payload)
+        if len(batch[1]) >= self.batch_max:
+            self._close_batch(key)
+
+    def _close_batch(self, key: Tuple[str, str]) -> None:
+        """Fecha o lote no event loop; a gravação roda no pool de threads"""
+        batch = self._batches.pop(key, None)
+        if batch is None:
+            return
+        batch[0].cancel()
+        task = asyncio.ensure_future(run_blocking(self._store_batch, key, batch[1]))
+        self._stores.add(task)
+        task.add_done_callback(self._stores.discard)
+
+    def _flush_batch(self, key: Tuple[str, str]) -> None:
+        batch = self._batches.pop(key, None)
+        if batch is None:
+            return
+        batch[0].cancel()
+        self._store_batch(key, batch[1])
+
+    def _store_batch(self, key: Tuple[str, str], events: List[Dict]) -> None:
+        try:
+            self._insert([(key[0], key[1], json_codec.dumps_str(events))])
+        except Exception as e:
+            print(f"[Webhooks] Erro ao enfileirar lote de {len(events)} evento(s) para {key[1]}: {e}")
+            return
+        self.batches_sent += 1
+        self.batched_events += len(events)
+
+    def flush_batches(self) -> None:
+        """Enfileira agora todos os lotes abertos"""
+        for key in list(self._batches):
+            self._flush_batch(key)
+
+    def _insert(self, entries: List[Tuple[str, str, str]]) -> int:
+        now = time.time()
+        rows = [(webhook_id, url, body, now, now) for webhook_id, url, body in entries]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO outbox (webhook_id, url, payload, proxima, criado_em) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._conn.execute("COMMIT")
+        self.enqueued += len(rows)
+        self._wake()
+        return len(rows)
+
+    def _wake(self) -> None:
+        if self._wakeup is None or self._loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._wakeup.set()
+        else:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    # Despacho
+    def start(self) -> asyncio.Task:
+        if self._runner is None or self._runner.done():
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._runner = asyncio.ensure_future(self._run())
+        return self._runner
+
+    def _due_rows(self, exclude_ids: List[int], saturated: List[str], limit: int) -> List[tuple]:
+        """
+        Entregas vencidas, no máximo endpoint_concurrency por URL
+
+        Endpoints já no limite e linhas em andamento ficam de fora na própria
+        consulta: uma rajada para um endpoint lento não ocupa a janela e não
+        atrasa as entregas dos demais.
+        """
+        ids = ",".join("?" * len(exclude_ids))
+        urls = ",".join("?" * len(saturated))
+        query = (
+            "SELECT id, webhook_id, url, payload, tentativas FROM ("
+            "  SELECT id, webhook_id, url, payload, tentativas, proxima,"
+            "         ROW_NUMBER() OVER (PARTITION BY url ORDER BY proxima, id) AS posicao"
+            "  FROM outbox WHERE proxima <= ?"
+            + (f" AND id NOT IN ({ids})" if exclude_ids else "")
+            + (f" AND url NOT IN ({urls})" if saturated else "")
+            + ") WHERE posicao <= ? ORDER BY proxima, id LIMIT ?"
+        )
+        with self._lock:
+            return self._conn.execute(
+                query, (time.time(), *exclude_ids, *saturated, self.endpoint_concurrency, limit)
+            ).fetchall()
+
+    async def _claim_due(self) -> List[tuple]:
+        free = self.max_concurrency - len(self._inflight)
+        if free <= 0:
+            return []
+        saturated = [url for url, count in self._endpoint_inflight.items() if count >= self.endpoint_concurrency]
+        # Cada entrega em andamento tira no máximo uma linha da janela (endpoint
+        # com vaga parcial), então free + em andamento basta para preencher free
+        rows = await run_blocking(self._due_rows, list(self._inflight), saturated, free + len(self._inflight))
+        claimed = []
+        for row in rows:
+            if len(claimed) >= free:
+                break
+            row_id, url = row[0], row[2]
+            if row_id in self._inflight or self._endpoint_inflight.get(url, 0) >= self.endpoint_concurrency:
+                continue
+            self._inflight.add(row_id)
+            self._endpoint_inflight[url] = self._endpoint_inflight.get(url, 0) + 1
+            claimed.append(row)
+        return claimed
+
+    def _next_due_in(self) -> float:
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(proxima) FROM outbox").fetchone()
+        if row[0] is None:
+            return 60.0
+        delay = row[0] - time.time()
+        if delay <= 0:
+            # Vencidas mas esperando vaga: o fim de uma entrega acorda o despachante
+            return 1.0
+        return min(delay, 60.0)
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                for row in await self._claim_due():
+                    task = asyncio.ensure_future(self._deliver(*row))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+                timeout = await run_blocking(self._next_due_in)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Webhooks] Erro no despachante: {e}")
+                timeout = 1.0
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _post(self, url: str, payload: str) -> int:
+        try:
+            response = await self.client_factory().post(
+                url,
+                content=payload.encode(),
+                headers={"Content-Type": "application/json"},
+                timeout=self.timeout
+            )
+        except PERMANENT_ERRORS as e:
+            raise DeliveryError(f"{type(e).__name__}: {e}", permanent=True)
+        except httpx.HTTPError as e:
+            raise DeliveryError(f"{type(e).__name__}: {e}")
+        if 200 <= response.status_code < 300:
+            return response.status_code
+        retry_after = None
+        if response.status_code == 429:
+            try:
+                retry_after = float(response.headers.get("Retry-After", ""))
+            except ValueError:
+                pass
+        permanent = 400 <= response.status_code < 500 and response.status_code not in RETRYABLE_STATUS
+        raise DeliveryError(f"HTTP {response.status_code}", permanent=permanent, retry_after=retry_after)
+
+    def _backoff(self, attempts: int) -> float:
+        # Exponencial com "equal jitter": metade fixa, metade aleatória
+        delay = min(self.backoff_base * (2 ** (attempts - 1)), self.backoff_max)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def _deliver(self, row_id: int, webhook_id: str, url: str, payload: str, attempts: int) -> None:
+        started = time.monotonic()
+        attempts += 1
+        try:
+            try:
+                status = await self._post(url, payload)
+            except DeliveryError:
+                raise
+            except Exception as e:
+                # Qualquer outro erro também conta como tentativa (com backoff),
+                # senão a linha seria reclamada de novo na hora, sem parar
+                raise DeliveryError(f"{type(e).__name__}: {e}") from e
+            await run_blocking(self._record_success, row_id, webhook_id, url, status, time.monotonic() - started)
+        except DeliveryError as e:
+            dead = e.permanent or attempts >= self.max_attempts
+            await run_blocking(self._record_failure, row_id, webhook_id, url, attempts, e, dead,
+                               time.monotonic() - started)
+            if dead:
+                print(f"[Webhooks] Entrega {row_id} para {url} desistida após {attempts} tentativa(s): {e}")
+        finally:
+            self._inflight.discard(row_id)
+            remaining = self._endpoint_inflight.get(url, 1) - 1
+            if remaining > 0:
+                self._endpoint_inflight[url] = remaining
+            else:
+                self._endpoint_inflight.pop(url, None)
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    def _record_success(self, row_id: int, webhook_id: str, url: str, status: int, latency: float) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+            self._update_stats(webhook_id, url, ok=True, status=status, latency=latency)
+
+    def _record_failure(self, row_id: int, webhook_id: str, url: str, attempts: int, error: DeliveryError,
+                        dead: bool, latency: float) -> None:
+        now = time.time()
+        with self._lock:
+            if dead:
+                self._conn.execute("BEGIN")
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO dead_letter (id, webhook_id, url, payload, tentativas, criado_em, falhou_em, ultimo_erro) "
+                    "SELECT id, webhook_id, url, payload, ?, criado_em, ?, ? FROM outbox WHERE id = ?",
+                    (attempts, now, str(error), row_id)
+                )
+                self._conn.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+                self._conn.execute("COMMIT")
+            else:
+                delay = max(self._backoff(attempts), error.retry_after or 0)
+                self._conn.execute(
+                    "UPDATE outbox SET tentativas = ?, proxima = ?, ultimo_erro = ? WHERE id = ?",
+                    (attempts, now + delay, str(error), row_id)
+                )
+            self._update_stats(webhook_id, url, ok=False, error=str(error), dead=dead, latency=latency)
+
+    def _update_stats(self, webhook_id: str, url: str, ok: bool, latency: float, status: int = None,
+                      error: str = None, dead: bool = False) -> None:
+        """Chamado com self._lock já adquirido"""
+        stats = self._stats.get(webhook_id)
+        if stats is None:
+            stats = self._stats[webhook_id] = {
+                "url": url, "entregues": 0, "falhas": 0, "mortos": 0,
+                "latencia_media_ms": 0.0, "ultimo_status": None, "ultimo_erro": None,
+                "ultima_entrega": None
+            }
+        stats["url"] = url
+        if ok:
+            stats["entregues"] += 1
+            stats["ultimo_status"] = status
+            stats["ultima_entrega"] = datetime.now(timezone.utc).isoformat()
+            # Média móvel exponencial da latência das entregas bem-sucedidas
+            stats["latencia_media_ms"] = round(stats["latencia_media_ms"] * 0.8 + latency * 1000 * 0.2, 1) \
+                if stats["entregues"] > 1 else round(latency * 1000, 1)
+        else:
+            stats["falhas"] += 1
+            stats["ultimo_erro"] = error
+            if dead:
+                stats["mortos"] += 1
+        self._conn.execute(
+            "INSERT OR REPLACE INTO estatisticas (webhook_id, dados) VALUES (?, ?)",
+            (webhook_id, json_codec.dumps_str(stats))
+        )
+
+    # Fila de mortos
+    def dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, webhook_id, url, payload, tentativas, criado_em, falhou_em, ultimo_erro "
+                "FROM dead_letter ORDER BY falhou_em DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [
+            {"id": r[0], "webhook_id": r[1], "url": r[2], "payload": json_codec.loads(r[3]), "tentativas": r[4],
+             "criado_em": r[5], "falhou_em": r[6], "ultimo_erro": r[7]}
+            for r in rows
+        ]
+
+    def retry_dead(self, dead_id: int) -> bool:
+        """Devolve uma entrega da fila de mortos para a caixa de saída"""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            moved = self._conn.execute(
+                "INSERT INTO outbox (webhook_id, url, payload, proxima, criado_em) "
+                "SELECT webhook_id, url, payload, ?, criado_em FROM dead_letter WHERE id = ?",
+                (time.time(), dead_id)
+            ).rowcount
+            self._conn.execute("DELETE FROM dead_letter WHERE id = ?", (dead_id,))
+            self._conn.execute("COMMIT")
+        if moved:
+            self._wake()
+        return bool(moved)
+
+    # Encerramento e métricas
+    async def aclose(self) -> None:
+        """Para o despachante; lotes abertos e entregas pendentes ficam na caixa de saída"""
+        self.flush_batches()
+        if self._stores:
+            await asyncio.gather(*list(self._stores), return_exceptions=True)
+        # wait_for pode engolir o cancelamento se o evento já foi sinalizado
+        self._closing = True
+        tasks = list(self._tasks)
+        if self._runner is not None:
+            tasks.append(self._runner)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        with self._lock:
+            self._conn.close()
+
+    def webhook_stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            pending = dict(self._conn.execute("SELECT webhook_id, COUNT(*) FROM outbox GROUP BY webhook_id"))
+            result = {webhook_id: {**stats, "pendentes": 0} for webhook_id, stats in self._stats.items()}
+        for webhook_id, count in pending.items():
+            result.setdefault(webhook_id, {})["pendentes"] = count
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+            dead = self._conn.execute("SELECT COUNT(*) FROM dead_letter").fetchone()[0]
+            delivered = sum(s.get("entregues", 0) for s in self._stats.values())
+            failed = sum(s.get("falhas", 0) for s in self._stats.values())
+        return {
+            "enfileiradas": self.enqueued,
+            "pendentes": pending,
+            "em_andamento": len(self._inflight),
+            "mortas": dead,
+            "em_lote": sum(len(events) for _, events in self._batches.values()),
+            "lotes": self.batches_sent,
+            "eventos_agrupados": self.batched_events,
+            "entregues": delivered,
+            "falhas": failed
+        }
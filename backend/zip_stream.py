@@ -0,0 +1,362 @@
+"""
+Montagem de arquivos ZIP (compartilhada pelo download do projeto, backups e
+pacote do bot)
+Gera o arquivo em pedaços, sem montar o ZIP inteiro na memória nem precisar
+de um arquivo com seek, e o diretório central sai no fim.
+
+Membros pequenos são comprimidos inteiros em paralelo em um pool de threads
+(o zlib libera o GIL) e escritos na ordem original já com CRC e tamanhos no
+cabeçalho. Membros grandes saem em streaming no fluxo principal, com data
+descriptor (CRC e tamanhos depois dos dados). Os membros em compressão à
+frente do que já foi escrito somam no máximo ARCHIVE_INFLIGHT_MB; cada um
+existe cru e comprimido ao mesmo tempo, então a memória fica em torno do
+dobro desse orçamento, qualquer que seja o total.
+Arquivos já comprimidos (png, zip...) são só armazenados. Membros ou
+deslocamentos acima de 2 GiB usam as extensões ZIP64.
+
+Benchmark (sequencial x paralelo) em diretórios reais:
+    python backend/zip_stream.py Handler Eventos ComandosSlash DataBaseJson
+"""
+
+import os
+import stat
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, Iterable, Iterator, List, Optional, Tuple, Union
+
+CHUNK_SIZE = 64 * 1024
+ZIP64_LIMIT = (1 << 31) - 1
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+# Extensões que o deflate não reduz: vão sem compressão
+STORED_EXTENSIONS = frozenset({
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".ico", ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z",
+    ".rar", ".mp3", ".mp4", ".ogg", ".webm", ".woff", ".woff2"
+})
+# Membros até este tamanho são comprimidos inteiros no pool; maiores saem em streaming
+PARALLEL_MEMBER_LIMIT = 16 * 1024 * 1024
+COMPRESS_WORKERS = max(int(os.getenv("ARCHIVE_WORKERS") or os.cpu_count() or 1), 1)
+# Soma dos tamanhos dos membros em compressão à frente do que já foi escrito
+INFLIGHT_BYTES = max(int(float(os.getenv("ARCHIVE_INFLIGHT_MB", "32")) * 1024 * 1024), 1)
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def compression_pool() -> ThreadPoolExecutor:
+    """Pool de threads de compressão compartilhado (ZIPs e blobs de backup)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=max(COMPRESS_WORKERS, 1), thread_name_prefix="compress")
+        return _pool
+
+
+def _dos_datetime(timestamp: float) -> Tuple[int, int]:
+    t = time.localtime(timestamp)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), \
+        ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+class _Entry:
+    __slots__ = ("name", "method", "dos_time", "dos_date", "mode", "offset", "zip64", "descriptor",
+                 "crc", "csize", "usize")
+
+    def __init__(self, name: bytes, method: int, mtime: float, mode: int, offset: int, zip64: bool,
+                 descriptor: bool = True):
+        self.name = name
+        self.method = method
+        self.dos_time, self.dos_date = _dos_datetime(mtime)
+        self.mode = mode
+        self.offset = offset
+        self.zip64 = zip64
+        self.descriptor = descriptor
+        self.crc = self.csize = self.usize = 0
+
+    @property
+    def flags(self) -> int:
+        return (FLAG_DATA_DESCRIPTOR if self.descriptor else 0) | FLAG_UTF8
+
+    def local_header(self) -> bytes:
+        version = 45 if self.zip64 else 20
+        if self.descriptor:
+            crc = 0
+            csize = usize = 0xFFFFFFFF if self.zip64 else 0
+            extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0) if self.zip64 else b""
+        else:
+            crc, csize, usize = self.crc, self.csize, self.usize
+            extra = b""
+        return struct.pack(
+            "<IHHHHHIIIHH", 0x04034b50, version, self.flags, self.method,
+            self.dos_time, self.dos_date, crc, csize, usize, len(self.name), len(extra)
+        ) + self.name + extra
+
+    def data_descriptor(self) -> bytes:
+        if self.zip64:
+            return struct.pack("<IIQQ", 0x08074b50, self.crc, self.csize, self.usize)
+        return struct.pack("<IIII", 0x08074b50, self.crc, self.csize, self.usize)
+
+    def central_header(self) -> bytes:
+        values = []
+        usize, csize, offset = self.usize, self.csize, self.offset
+        if usize > ZIP64_LIMIT:
+            values.append(usize)
+            usize = 0xFFFFFFFF
+        if csize > ZIP64_LIMIT:
+            values.append(csize)
+            csize = 0xFFFFFFFF
+        if offset > ZIP64_LIMIT:
+            values.append(offset)
+            offset = 0xFFFFFFFF
+        extra = struct.pack(f"<HH{len(values)}Q", 0x0001, 8 * len(values), *values) if values else b""
+        version = 45 if self.zip64 or values else 20
+        return struct.pack(
+            "<IHHHHHHIIIHHHHHII", 0x02014b50, (3 << 8) | version, version, self.flags,
+            self.method, self.dos_time, self.dos_date, self.crc, csize, usize, len(self.name), len(extra),
+            0, 0, 0, (self.mode & 0xFFFF) << 16, offset
+        ) + self.name + extra
+
+
+def _end_records(entries: List[_Entry], cd_offset: int, cd_size: int) -> bytes:
+    count = len(entries)
+    if count < 0xFFFF and cd_offset <= ZIP64_LIMIT and cd_size <= ZIP64_LIMIT:
+        return struct.pack("<IHHHHIIH", 0x06054b50, 0, 0, count, count, cd_size, cd_offset, 0)
+    zip64_offset = cd_offset + cd_size
+    return (
+        struct.pack("<IQHHIIQQQQ", 0x06064b50, 44, (3 << 8) | 45, 45, 0, 0, count, count, cd_size, cd_offset)
+        + struct.pack("<IIQI", 0x07064b50, 0, zip64_offset, 1)
+        + struct.pack("<IHHHHIIH", 0x06054b50, 0, 0, 0xFFFF, 0xFFFF, 0xFFFFFFFF, 0xFFFFFFFF, 0)
+    )
+
+
+# Membro: (nome no ZIP, mtime, modo, tamanho, caminho no disco ou conteúdo)
+Member = Tuple[str, float, int, int, Union[str, bytes]]
+
+
+def _compress(source: Union[str, bytes], method: int, level: int) -> Optional[Tuple[int, int, bytes]]:
+    """Lê e comprime um membro inteiro (roda no pool); None se o arquivo sumiu"""
+    if isinstance(source, bytes):
+        data = source
+    else:
+        try:
+            with open(source, 'rb') as f:
+                data = f.read()
+        except (FileNotFoundError, IsADirectoryError):
+            return None
+    crc = zlib.crc32(data)
+    if method == ZIP_DEFLATED:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        return crc, len(data), compressor.compress(data) + compressor.flush()
+    return crc, len(data), data
+
+
+class _Writer:
+    def __init__(self, chunk_size: int):
+        self.chunk_size = chunk_size
+        self.buffer = bytearray()
+        self.offset = 0
+        self.entries: List[_Entry] = []
+
+    def _flush(self, force: bool = False) -> Iterator[bytes]:
+        if self.buffer and (force or len(self.buffer) >= self.chunk_size):
+            self.offset += len(self.buffer)
+            yield bytes(self.buffer)
+            self.buffer.clear()
+
+    def _position(self) -> int:
+        return self.offset + len(self.buffer)
+
+    def write_compressed(self, member: Member, method: int, result: Tuple[int, int, bytes]) -> Iterator[bytes]:
+        arcname, mtime, mode, _, _ = member
+        crc, usize, data = result
+        entry = _Entry(arcname.encode("utf-8"), method, mtime, mode, self._position(),
+                       usize > ZIP64_LIMIT or len(data) > ZIP64_LIMIT, descriptor=False)
+        entry.crc, entry.usize, entry.csize = crc, usize, len(data)
+        self.buffer += entry.local_header()
+        for start in range(0, len(data), self.chunk_size):
+            self.buffer += data[start:start + self.chunk_size]
+            yield from self._flush()
+        self.entries.append(entry)
+
+    def write_streamed(self, member: Member, method: int, level: int) -> Iterator[bytes]:
+        arcname, mtime, mode, size, path = member
+        try:
+            f = open(path, 'rb')
+        except (FileNotFoundError, IsADirectoryError):
+            return
+        with f:
+            entry = _Entry(arcname.encode("utf-8"), method, mtime, mode, self._position(), size > ZIP64_LIMIT)
+            self.buffer += entry.local_header()
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15) if method == ZIP_DEFLATED else None
+            crc = usize = csize = 0
+            for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                crc = zlib.crc32(chunk, crc)
+                usize += len(chunk)
+                data = compressor.compress(chunk) if compressor else chunk
+                csize += len(data)
+                self.buffer += data
+                yield from self._flush()
+            if compressor:
+                data = compressor.flush()
+                csize += len(data)
+                self.buffer += data
+        if not entry.zip64 and (usize > ZIP64_LIMIT or csize > ZIP64_LIMIT):
+            # O cabeçalho local já saiu sem ZIP64: o arquivo cresceu durante a leitura
+            raise ValueError(f"{arcname} passou de {ZIP64_LIMIT} bytes durante a compactação")
+        entry.crc, entry.usize, entry.csize = crc, usize, csize
+        self.buffer += entry.data_descriptor()
+        self.entries.append(entry)
+
+    def finish(self) -> Iterator[bytes]:
+        cd_offset = self._position()
+        cd_size = 0
+        for entry in self.entries:
+            header = entry.central_header()
+            cd_size += len(header)
+            self.buffer += header
+            yield from self._flush()
+        self.buffer += _end_records(self.entries, cd_offset, cd_size)
+        yield from self._flush(force=True)
+
+
+def _members(files: Iterable[Tuple[str, str]], texts: Iterable[Tuple[str, str]]) -> Iterator[Member]:
+    for arcname, path in files:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        if not stat.S_ISREG(st.st_mode):
+            continue
+        yield arcname, st.st_mtime, 0o100644 | (st.st_mode & 0o777), st.st_size, path
+    now = time.time()
+    for arcname, content in texts:
+        data = content.encode() if isinstance(content, str) else content
+        yield arcname, now, 0o100644, len(data), data
+
+
+def stream_zip(files: Iterable[Tuple[str, str]], texts: Iterable[Tuple[str, str]] = (),
+               compresslevel: Optional[int] = None, chunk_size: int = CHUNK_SIZE,
+               workers: Optional[int] = None, store_extensions=STORED_EXTENSIONS,
+               inflight_bytes: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Gera um ZIP em pedaços de ~chunk_size bytes
+
+    Args:
+        files: Pares (nome no ZIP, caminho no disco); arquivos ausentes são ignorados
+        texts: Pares (nome no ZIP, conteúdo) gerados na hora
+        compresslevel: Nível do deflate (None = padrão do zlib, 0 = tudo sem compressão)
+        chunk_size: Tamanho dos pedaços lidos do disco e entregues ao consumidor
+        workers: Membros comprimidos em paralelo (None = ARCHIVE_WORKERS, 1 = sequencial)
+        store_extensions: Extensões armazenadas sem compressão
+        inflight_bytes: Bytes de membros em compressão paralela à frente da escrita
+            (None = ARCHIVE_INFLIGHT_MB); membros maiores que isso saem em streaming
+
+    Yields:
+        Pedaços consecutivos do arquivo ZIP
+    """
+    level = zlib.Z_DEFAULT_COMPRESSION if compresslevel is None else compresslevel
+    workers = COMPRESS_WORKERS if workers is None else workers
+    pool = compression_pool() if workers > 1 else None
+    budget = INFLIGHT_BYTES if inflight_bytes is None else max(inflight_bytes, 1)
+    # No modo paralelo, membro que sozinho estoura o orçamento sai em streaming
+    member_limit = min(PARALLEL_MEMBER_LIMIT, budget) if pool else PARALLEL_MEMBER_LIMIT
+    writer = _Writer(chunk_size)
+    pending: Deque[Tuple[Member, int, Optional[Future]]] = deque()
+    pending_bytes = 0
+
+    def emit() -> Iterator[bytes]:
+        nonlocal pending_bytes
+        member, method, future = pending.popleft()
+        pending_bytes -= member[3]
+        result = future.result() if future is not None else _compress(member[4], method, level)
+        if result is not None:
+            yield from writer.write_compressed(member, method, result)
+
+    try:
+        for member in _members(files, texts):
+            arcname, _, _, size, source = member
+            stored = level == 0 or os.path.splitext(arcname)[1].lower() in store_extensions
+            method = ZIP_STORED if stored else ZIP_DEFLATED
+            if size > member_limit and isinstance(source, str):
+                while pending:
+                    yield from emit()
+                yield from writer.write_streamed(member, method, level)
+                continue
+            if pool is None:
+                pending.append((member, method, None))
+                yield from emit()
+                continue
+            # Abre espaço no orçamento antes de ler e comprimir mais um membro
+            while pending and pending_bytes + size > budget:
+                yield from emit()
+            pending.append((member, method, pool.submit(_compress, source, method, level)))
+            pending_bytes += size
+        while pending:
+            yield from emit()
+        yield from writer.finish()
+    finally:
+        # Consumidor desistiu (ex.: cliente desconectou): descarta o que não começou
+        for _, _, future in pending:
+            if future is not None:
+                future.cancel()
+
+
+def write_zip(path: str, files: Iterable[Tuple[str, str]], texts: Iterable[Tuple[str, str]] = (),
+              **options) -> str:
+    """
+    Grava o ZIP em path de forma atômica (temporário + rename)
+
+    Aceita as mesmas opções de stream_zip (compresslevel, workers, store_extensions).
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in stream_zip(files, texts, **options):
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return path
+
+
+def _benchmark(directories: List[str]) -> None:
+    files = []
+    for directory in directories:
+        for root, _, filenames in os.walk(directory):
+            for filename in sorted(filenames):
+                path = os.path.join(root, filename)
+                files.append((os.path.relpath(path), path))
+    total = sum(os.path.getsize(path) for _, path in files)
+    print(f"{len(files)} arquivos, {total / 1024 / 1024:.1f} MiB, {os.cpu_count()} CPU(s)")
+    baseline = None
+    for workers in sorted({1, max(COMPRESS_WORKERS, 1)}):
+        for level in (1, 6, 9):
+            started = time.perf_counter()
+            size = sum(len(chunk) for chunk in stream_zip(files, compresslevel=level, workers=workers))
+            elapsed = time.perf_counter() - started
+            if workers == 1 and level == 6:
+                baseline = elapsed
+            speedup = f"  {baseline / elapsed:.2f}x" if baseline and level == 6 else ""
+            print(f"workers={workers} nível={level}: {elapsed:.3f}s  {size / 1024 / 1024:.2f} MiB{speedup}")
+
+
+if __name__ == "__main__":
+    _benchmark(sys.argv[1:] or ["Handler", "Eventos", "ComandosSlash", "DataBaseJson"])
@@ -4,6 +4,9 @@ import { toast } from 'sonner';
 
 const BackupManager = () => {
   const [backups, setBackups] = useState([]);
+  const [totais, setTotais] = useState(null);
+  const [agendamento, setAgendamento] = useState(null);
+  const [restoring, setRestoring] = useState(null);
   const [loading, setLoading] = useState(true);
   const [creating, setCreating] = useState(false);
 
@@ -21,6 +24,8 @@ const BackupManager = () => {
       if (response.ok) {
         const data = await response.json();
         setBackups(data.backups || []);
+        setTotais(data.totais || null);
+        setAgendamento(data.agendamento || null);
       }
     } catch (error) {
       toast.error('Erro ao carregar backups');
@@ -52,6 +57,29 @@ const BackupManager = () => {
     }
   };
 
+  const restoreBackup = async (nome) => {
+    setRestoring(nome);
+
+    try {
+      const token = localStorage.getItem('admin_token');
+      const response = await fetch(`${process.env.REACT_APP_BACKEND_URL}/api/backup/restore/${encodeURIComponent(nome)}`, {
+        method: 'POST',
+        headers: { 'Authorization': `Bearer ${token}` }
+      });
+
+      if (response.ok) {
+        const data = await response.json();
+        toast.success(`Backup restaurado em ${data.destino}`);
+      } else {
+        toast.error('Erro ao restaurar backup');
+      }
+    } catch (error) {
+      toast.error('Erro de conexao');
+    } finally {
+      setRestoring(null);
+    }
+  };
+
   const formatFileSize = (bytes) => {
     if (bytes === 0) return '0 B';
     const k = 1024;
@@ -159,12 +187,27 @@ const BackupManager = () => {
                           {new Date(backup.criado_em).toLocaleString('pt-BR')}
                         </span>
                         <span>
-                          Tamanho: {formatFileSize(backup.tamanho)}
+                          Tamanho: {formatFileSize(backup.tamanho_logico ?? backup.tamanho)}
                         </span>
+                        {backup.tipo === 'incremental' && (
+                          <span>
+                            Ocupa: {formatFileSize(backup.tamanho_fisico)}
+                          </span>
+                        )}
                       </div>
                     </div>
                   </div>
                   <div className="flex items-center gap-2">
+                    {backup.tipo === 'incremental' && (
+                      <button
+                        onClick={() => restoreBackup(backup.nome)}
+                        disabled={restoring !== null}
+                        title="Restaurar em backups/restaurados"
+                        className="p-2 bg-void-highlight border border-cyber-green/30 text-cyber-green rounded-lg hover:border-cyber-green transition-colors disabled:opacity-50"
+                      >
+                        <Download className="w-4 h-4" />
+                      </button>
+                    )}
                     <span className={`px-2 py-1 text-xs font-mono rounded ${
                       index === 0 
                         ? 'bg-cyber-green/20 text-cyber-green'
@@ -189,11 +232,18 @@ const BackupManager = () => {
         <div className="grid grid-cols-1 md:grid-cols-3 gap-4">
           <div className="p-4 bg-void-highlight rounded-lg text-center">
             <div className="text-2xl font-unbounded font-bold text-cyber-green mb-2">
-              AUTOMATICO
+              {agendamento && !agendamento.ativo ? 'MANUAL' : 'AUTOMATICO'}
             </div>
             <div className="text-xs font-mono text-text-secondary">
-              Backup automatico a cada 24h
+              {agendamento && !agendamento.ativo
+                ? 'Backup automatico desligado'
+                : `Backup automatico a cada ${agendamento ? agendamento.intervalo_horas : 24}h`}
             </div>
+            {agendamento && agendamento.proximo_em && (
+              <div className="text-xs font-mono text-text-dim mt-1">
+                Proximo: {new Date(agendamento.proximo_em).toLocaleString('pt-BR')}
+              </div>
+            )}
           </div>
           
           <div className="p-4 bg-void-highlight rounded-lg text-center">
@@ -207,7 +257,7 @@ const BackupManager = () => {
           
           <div className="p-4 bg-void-highlight rounded-lg text-center">
             <div className="text-2xl font-unbounded font-bold text-cyber-yellow mb-2">
-              {backups.length > 0 ? formatFileSize(backups.reduce((sum, b) => sum + b.tamanho, 0)) : '0 B'}
+              {totais ? formatFileSize(totais.tamanho_fisico) : '0 B'}
             </div>
             <div className="text-xs font-mono text-text-secondary">
               Espaco total usado
@@ -223,9 +273,9 @@ const BackupManager = () => {
         </h4>
         <div className="space-y-2 text-sm font-mono text-text-secondary">
           <p>• Backups incluem todos os arquivos JSON do sistema</p>
-          <p>• Backup automatico roda a cada 24 horas</p>
-          <p>• Arquivos sao compactados em formato ZIP</p>
-          <p>• Backups antigos sao mantidos para recuperacao</p>
+          <p>• Backup automatico segue o intervalo das configuracoes do sistema</p>
+          <p>• Backups sao incrementais: arquivos sem mudanca nao ocupam espaco de novo</p>
+          <p>• Retencao: ultimos backups mais um por dia e por semana</p>
           <p>• Todas operacoes sao registradas nos logs</p>
         </div>
       </div>
@@ -1,11 +1,12 @@
 import React, { useState, useEffect } from 'react';
-import { TrendingUp, Users, Zap, DollarSign, Activity, AlertCircle, UserCheck, Server } from 'lucide-react';
+import { TrendingUp, Users, Zap, DollarSign, Activity, AlertCircle, UserCheck, Server, RefreshCw } from 'lucide-react';
 import { toast } from 'sonner';
 
 const Dashboard = () => {
   const [stats, setStats] = useState(null);
   const [usersWithBalance, setUsersWithBalance] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [refreshingStatus, setRefreshingStatus] = useState(false);
 
   useEffect(() => {
     fetchStats();
@@ -34,6 +35,37 @@ const Dashboard = () => {
     }
   };
 
+  const refreshBotStatus = async () => {
+    setRefreshingStatus(true);
+    try {
+      const token = localStorage.getItem('admin_token');
+      const response = await fetch(`${process.env.REACT_APP_BACKEND_URL}/api/dashboard/bot-status/refresh`, {
+        method: 'POST',
+        headers: {
+          'Authorization': `Bearer ${token}`
+        }
+      });
+
+      if (response.ok) {
+        const data = await response.json();
+        setStats((prev) => ({
+          ...prev,
+          bot_status: data.status,
+          bot_guilds: data.guilds || 0,
+          total_members: data.total_members || 0,
+          bot_status_verificado_em: data.verificado_em,
+          bot_status_idade_s: data.idade_s
+        }));
+      } else {
+        toast.error('Erro ao verificar status do bot');
+      }
+    } catch (error) {
+      toast.error('Erro de conexão');
+    } finally {
+      setRefreshingStatus(false);
+    }
+  };
+
   const fetchUsersWithBalance = async () => {
     try {
       const token = localStorage.getItem('admin_token');
@@ -208,6 +240,19 @@ const Dashboard = () => {
             }`}>
               {stats?.bot_status === 'online' ? 'OPERACIONAL' : 'OFFLINE'}
             </span>
+            {stats?.bot_status_idade_s != null && (
+              <span className="font-mono text-xs text-text-dim">
+                verificado há {Math.round(stats.bot_status_idade_s)}s
+              </span>
+            )}
+            <button
+              onClick={refreshBotStatus}
+              disabled={refreshingStatus}
+              className="text-text-secondary hover:text-cyber-red transition-colors"
+              title="Verificar agora"
+            >
+              <RefreshCw className={`w-4 h-4 ${refreshingStatus ? 'animate-spin' : ''}`} />
+            </button>
           </div>
         </div>
         
@@ -0,0 +1,30 @@
+"""
+Os módulos do backend são planos (server.py importa storage, json_codec...),
+então os testes rodam com backend/ no sys.path, como o uvicorn
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+
+@pytest.fixture(scope="session")
+def server(tmp_path_factory):
+    """
+    Importa o server.py dentro de um diretório temporário (ele usa caminhos
+    relativos como ./DataBaseJson), com a autenticação desligada
+    """
+    workdir = tmp_path_factory.mktemp("painel")
+    os.makedirs(workdir / "DataBaseJson")
+    previous = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import server
+        server.app.dependency_overrides[server.verify_token] = lambda: "admin"
+        yield server
+        server.action_log_pipeline.close()
+    finally:
+        os.chdir(previous)
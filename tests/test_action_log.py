@@ -0,0 +1,45 @@
+import os
+
+import pytest
+
+from action_log import SegmentedActionLog
+
+
+def entries(count):
+    return [
+        {"timestamp": f"2024-05-01T10:00:{i:02d}+00:00", "action": "teste", "user_id": str(i % 2), "id": f"e{i}"}
+        for i in range(count)
+    ]
+
+
+def corrupt_line(path, number):
+    """Troca o conteúdo de uma linha por lixo do mesmo tamanho (offsets continuam válidos)"""
+    with open(path, 'rb') as f:
+        lines = f.readlines()
+    lines[number] = b"{" + b"x" * (len(lines[number]) - 2) + b"\n"
+    with open(path, 'wb') as f:
+        f.writelines(lines)
+
+
+@pytest.mark.parametrize("rebuild", [False, True])
+def test_corrupt_line_is_skipped(tmp_path, rebuild):
+    directory = str(tmp_path / "action_logs")
+    log = SegmentedActionLog(directory, index_every=2)
+    log.append(entries(6))
+    log.close()
+
+    segment = next(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".ndjson"))
+    corrupt_line(segment, 3)
+    if rebuild:
+        for name in os.listdir(directory):
+            if not name.endswith(".ndjson"):
+                os.unlink(os.path.join(directory, name))
+
+    log = SegmentedActionLog(directory, index_every=2)
+    expected = ["e5", "e4", "e2", "e1", "e0"]
+
+    assert [e["id"] for e in log.query(limit=10)] == expected
+    assert [e["id"] for e in log.query(action="teste", limit=10)] == expected
+    assert [e["id"] for e in log.query(user_id="1", limit=10)] == ["e5", "e1"]
+    assert [e["id"] for e in log.scan()] == expected[::-1]
+    log.close()
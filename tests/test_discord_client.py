@@ -0,0 +1,106 @@
+import asyncio
+import time
+
+import httpx
+
+from discord_client import DiscordClient
+
+
+class StubDiscord:
+    """Responde com a função da rota e anota quando cada requisição chegou"""
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.calls = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls.append((request.url.path, time.monotonic()))
+        return self.routes[request.url.path](request)
+
+
+def ok(**headers):
+    return lambda request: httpx.Response(200, json={}, headers=headers)
+
+
+def run(stub, coro_factory, **options):
+    async def scenario():
+        client = DiscordClient(base_url="https://discord.test/api", transport=httpx.MockTransport(stub), **options)
+        try:
+            return await coro_factory(client), client
+        finally:
+            await client.aclose()
+
+    return asyncio.run(scenario())
+
+
+def test_routes_with_same_bucket_hash_share_a_bucket():
+    stub = StubDiscord({
+        "/api/users/1": ok(**{"X-RateLimit-Bucket": "abc", "X-RateLimit-Limit": "5", "X-RateLimit-Remaining": "4",
+                              "X-RateLimit-Reset-After": "1"}),
+        "/api/applications/2": ok(**{"X-RateLimit-Bucket": "abc", "X-RateLimit-Limit": "5",
+                                     "X-RateLimit-Remaining": "3", "X-RateLimit-Reset-After": "1"}),
+        "/api/channels/10/messages": ok(**{"X-RateLimit-Bucket": "msg"}),
+        "/api/channels/11/messages": ok(**{"X-RateLimit-Bucket": "msg"}),
+    })
+
+    async def scenario(client):
+        for path in ("/users/1", "/applications/2", "/channels/10/messages", "/channels/11/messages"):
+            await client.request("GET", path, "token")
+
+    _, client = run(stub, scenario)
+
+    users = client._bucket_for("GET /users/:id")
+    assert users is client._bucket_for("GET /applications/:id")
+    assert users.remaining == 3
+    # Mesmo hash com parâmetro maior diferente: buckets separados
+    assert client._bucket_for("GET /channels/10/messages") is not client._bucket_for("GET /channels/11/messages")
+    assert len(client._buckets) == 3
+
+
+def test_waits_for_reset_when_remaining_is_zero():
+    stub = StubDiscord({"/api/users/1": ok(**{"X-RateLimit-Bucket": "abc", "X-RateLimit-Limit": "1",
+                                               "X-RateLimit-Remaining": "0", "X-RateLimit-Reset-After": "0.3"})})
+
+    async def scenario(client):
+        await client.request("GET", "/users/1", "token")
+        await client.request("GET", "/users/1", "token")
+
+    _, client = run(stub, scenario)
+
+    (_, first), (_, second) = stub.calls
+    assert second - first >= 0.25
+    assert client.waits == 1
+
+
+def test_global_429_blocks_every_route():
+    stub = StubDiscord({
+        "/api/users/1": lambda request: httpx.Response(429, json={"retry_after": 0.3, "global": True}),
+        "/api/guilds/5": ok(),
+    })
+
+    async def scenario(client):
+        limited = await client.request("GET", "/users/1", "token")
+        other = await client.request("GET", "/guilds/5", "token")
+        return limited.status_code, other.status_code
+
+    (limited, other), client = run(stub, scenario, max_retries=0)
+
+    assert (limited, other) == (429, 200)
+    (_, first), (_, second) = stub.calls
+    assert second - first >= 0.25
+    assert client.global_limited == 1
+
+
+def test_long_retry_after_returns_the_429():
+    stub = StubDiscord({"/api/users/1": lambda request: httpx.Response(429, json={"retry_after": 60})})
+
+    async def scenario(client):
+        started = time.monotonic()
+        response = await client.request("GET", "/users/1", "token")
+        return response.status_code, time.monotonic() - started
+
+    (status, elapsed), client = run(stub, scenario, max_retry_wait=1)
+
+    assert status == 429
+    assert elapsed < 0.5
+    assert len(stub.calls) == 1 and client.retries == 0
@@ -0,0 +1,69 @@
+import asyncio
+import time
+
+from discord_profiles import ProfileCache, ProfileService
+
+
+class FakeClient:
+    def __init__(self, users):
+        self.users = users
+        self.calls = []
+
+    async def get_user(self, user_id, token):
+        self.calls.append(user_id)
+        return self.users.get(user_id)
+
+
+def test_not_found_users_are_negatively_cached(tmp_path):
+    cache = ProfileCache(str(tmp_path / "perfis.db"), miss_ttl=60)
+    client = FakeClient({"1": {"id": "1", "username": "ana", "avatar": None}})
+    service = ProfileService(cache, client)
+
+    async def scenario():
+        first = await service.get_profiles(["1", "404"], "token", budget=1)
+        second = await service.get_profiles(["1", "404"], "token", budget=1)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    cache.close()
+
+    assert first["1"][0]["username"] == "ana"
+    assert first["404"] == (first["404"][0], False) and first["404"][0]["username"] == "Usuário Desconhecido"
+    assert second["404"][0]["username"] == "Usuário Desconhecido"
+    # O segundo ranking não volta à API para o usuário apagado
+    assert client.calls == ["1", "404"]
+
+
+def test_not_found_expires_after_miss_ttl(tmp_path):
+    cache = ProfileCache(str(tmp_path / "perfis.db"), miss_ttl=0.05)
+    cache.put_not_found("404")
+    assert cache.is_not_found("404")
+    time.sleep(0.06)
+    assert not cache.is_not_found("404")
+    cache.close()
+
+
+def test_disk_lookups_run_off_the_event_loop(tmp_path):
+    cache = ProfileCache(str(tmp_path / "perfis.db"))
+    cache.put("1", {"id": "1", "username": "ana", "avatar_url": "x"})
+    cache._memory.clear()
+    service = ProfileService(cache, FakeClient({}))
+    loop_thread = []
+
+    real_get = cache.get
+
+    def recording_get(user_id):
+        loop_thread.append(asyncio._get_running_loop() is not None)
+        return real_get(user_id)
+
+    cache.get = recording_get
+
+    async def scenario():
+        return await service.get_profiles(["1"], "token", budget=1)
+
+    result = asyncio.run(scenario())
+    cache.close()
+
+    assert result["1"][0]["username"] == "ana"
+    # A consulta ao SQLite rodou numa thread sem event loop
+    assert loop_thread == [False]
@@ -0,0 +1,122 @@
+import asyncio
+import threading
+import time
+
+import log_pipeline
+from log_pipeline import ActionLogPipeline
+
+
+class FlakySink:
+    def __init__(self, failures=0, delay=0.0):
+        self.failures = failures
+        self.delay = delay
+        self.written = []
+        self.lock = threading.Lock()
+
+    def __call__(self, batch):
+        time.sleep(self.delay)
+        with self.lock:
+            if self.failures:
+                self.failures -= 1
+                raise OSError("disco cheio")
+            self.written.extend(batch)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_failed_batch_is_retried_in_order(monkeypatch):
+    monkeypatch.setattr(log_pipeline, "RETRY_BASE_S", 0.01)
+    sink = FlakySink(failures=2)
+    pipeline = ActionLogPipeline(sink, batch_size=5, flush_interval_ms=10)
+    entries = [{"id": i} for i in range(12)]
+    for entry in entries:
+        pipeline.submit(entry)
+
+    assert wait_until(lambda: len(sink.written) == len(entries))
+    assert sink.written == entries
+    assert pipeline.errors == 2 and pipeline.retried > 0
+    pipeline.close()
+
+
+def test_flush_keeps_entries_when_sink_fails():
+    sink = FlakySink(failures=1)
+    pipeline = ActionLogPipeline(sink, batch_size=100, flush_interval_ms=60_000)
+    pipeline.submit({"id": 1})
+    pipeline.flush()
+    assert pipeline.pending() == [{"id": 1}]
+    pipeline.close()
+    assert sink.written == [{"id": 1}]
+
+
+def test_full_queue_does_not_block_event_loop():
+    sink = FlakySink(delay=0.1)
+    pipeline = ActionLogPipeline(sink, batch_size=10, flush_interval_ms=10, max_queue=10)
+
+    async def scenario():
+        lags = []
+        done = asyncio.Event()
+
+        async def ticker():
+            while not done.is_set():
+                started = time.perf_counter()
+                await asyncio.sleep(0.005)
+                lags.append(time.perf_counter() - started - 0.005)
+
+        ticking = asyncio.ensure_future(ticker())
+        for i in range(50):
+            await pipeline.asubmit({"id": i})
+        done.set()
+        await ticking
+        return lags
+
+    lags = asyncio.run(scenario())
+    pipeline.close()
+
+    assert pipeline.backpressure > 0
+    assert [e["id"] for e in sink.written] == list(range(50))
+    # Com a gravação síncrona no loop cada lote o travaria por 100ms
+    assert max(lags) < 0.05
+
+
+def test_full_queue_with_failing_sink_does_not_park_threads(monkeypatch):
+    monkeypatch.setattr(log_pipeline, "RETRY_BASE_S", 0.01)
+    sink = FlakySink(failures=10**9)
+    pipeline = ActionLogPipeline(sink, batch_size=2, flush_interval_ms=10, max_queue=2, max_wait_ms=100)
+
+    async def scenario():
+        # Mais chamadas do que threads no pool compartilhado (BLOCKING_IO_THREADS)
+        await asyncio.wait_for(asyncio.gather(*(pipeline.asubmit({"id": i}) for i in range(40))), 5)
+        # O pool continua livre para as outras rotas
+        return await asyncio.wait_for(log_pipeline.run_blocking(lambda: "livre"), 1)
+
+    try:
+        assert asyncio.run(scenario()) == "livre"
+        assert pipeline.backpressure > 0 and pipeline.direct_writes > 0
+        # Nenhuma entrada se perde: as que falharam esperam na fila
+        assert {e["id"] for e in pipeline.pending()} >= set(range(40))
+    finally:
+        sink.failures = 0
+        pipeline.close()
+    assert sorted(e["id"] for e in sink.written) == list(range(40))
+
+
+def test_pending_includes_batch_being_written():
+    started = threading.Event()
+    release = threading.Event()
+
+    def sink(batch):
+        started.set()
+        release.wait(5)
+
+    pipeline = ActionLogPipeline(sink, batch_size=1, flush_interval_ms=10)
+    pipeline.submit({"id": 1})
+    assert started.wait(5)
+    assert pipeline.pending() == [{"id": 1}]
+    release.set()
+    assert wait_until(lambda: pipeline.pending() == [])
+    pipeline.close()
@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from loop_monitor import LoopMonitor, LoopMonitorMiddleware
+
+
+def blocking_app(monitor):
+    app = FastAPI()
+    app.add_middleware(LoopMonitorMiddleware, monitor=monitor)
+
+    @app.get("/api/ranking/{user_id}")
+    async def ranking(user_id: str):
+        time.sleep(0.15)
+        return {"user_id": user_id}
+
+    @app.get("/api/blacklist/{user_id}")
+    async def blacklist(user_id: str):
+        time.sleep(0.15)
+        return {"user_id": user_id}
+
+    return app
+
+
+def run_requests(monitor, paths):
+    async def scenario():
+        monitor.start()
+        await asyncio.sleep(0.03)
+        transport = httpx.ASGITransport(app=blocking_app(monitor))
+        async with httpx.AsyncClient(transport=transport, base_url="http://painel") as client:
+            for path in paths:
+                assert (await client.get(path)).status_code == 200
+                # Deixa o monitor registrar o bloqueio
+                await asyncio.sleep(0.03)
+        monitor.stop()
+
+    asyncio.run(scenario())
+
+
+def test_blocks_are_keyed_by_route_template():
+    monitor = LoopMonitor(interval=0.01, threshold=0.05)
+    run_requests(monitor, [f"/api/ranking/{i}" for i in range(4)])
+
+    assert set(monitor.by_route) == {"GET /api/ranking/{user_id}"}
+    assert monitor.by_route["GET /api/ranking/{user_id}"]["bloqueios"] == 4
+
+
+def test_origin_table_is_capped():
+    monitor = LoopMonitor(interval=0.01, threshold=0.05, max_origins=1)
+    run_requests(monitor, ["/api/ranking/1", "/api/blacklist/2", "/api/blacklist/3"])
+
+    assert set(monitor.by_route) == {"GET /api/ranking/{user_id}", "outras"}
+    assert monitor.by_route["outras"]["bloqueios"] == 2
@@ -0,0 +1,17 @@
+import json
+import os
+
+
+def test_archive_ships_action_log_segments(server):
+    server.action_log_pipeline.submit(server.action_entry("teste_arquivo"))
+    server.action_log_pipeline.flush()
+    with open("./DataBaseJson/action_logs.json", "w") as f:
+        json.dump({"logs": []}, f)
+
+    files, _ = server.project_archive_inputs()
+    names = {arcname for arcname, _ in files}
+
+    segments = [name for name in os.listdir("./DataBaseJson/action_logs") if name.endswith(".ndjson")]
+    assert segments
+    assert {f"DataBaseJson/action_logs/{name}" for name in segments} <= names
+    assert "DataBaseJson/action_logs.json" not in names
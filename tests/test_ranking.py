@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+from ranking import RankingIndex
+
+SLOW_SYNC_S = 0.15
+
+
+class SlowEngine:
+    """Motor cujo sync_saldo demora (disco lento / compactação do journal)"""
+
+    def __init__(self, balances):
+        self.balances = balances
+        self.listener = None
+
+    def subscribe_saldo(self, callback):
+        self.listener = callback
+
+    def sync_saldo(self):
+        time.sleep(SLOW_SYNC_S)
+
+    def saldo_snapshot(self):
+        return dict(self.balances)
+
+
+def test_refresh_runs_off_the_event_loop():
+    engine = SlowEngine({"a": 5.0, "b": 10.0, "c": 0.0})
+    index = RankingIndex(engine)
+
+    async def scenario():
+        lags = []
+        done = asyncio.Event()
+
+        async def ticker():
+            while not done.is_set():
+                started = time.perf_counter()
+                await asyncio.sleep(0.005)
+                lags.append(time.perf_counter() - started - 0.005)
+
+        ticking = asyncio.ensure_future(ticker())
+        results = await asyncio.gather(index.page(10, 0), index.rank_of("a"), index.rank_of("c"), index.page(1, 1))
+        done.set()
+        await ticking
+        return results, max(lags)
+
+    (page, rank_a, rank_c, second), lag = asyncio.run(scenario())
+
+    assert page == ([{"user_id": "b", "saldo": 10.0, "posicao": 1}, {"user_id": "a", "saldo": 5.0, "posicao": 2}], 2)
+    assert rank_a == {"user_id": "a", "saldo": 5.0, "posicao": 2, "total": 2}
+    assert rank_c is None
+    assert second == ([{"user_id": "a", "saldo": 5.0, "posicao": 2}], 2)
+    # No event loop cada consulta o travaria por SLOW_SYNC_S
+    assert lag < SLOW_SYNC_S
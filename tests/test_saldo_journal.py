@@ -0,0 +1,87 @@
+import json
+import time
+
+import pytest
+
+import storage
+from saldo_journal import SaldoJournal
+
+
+@pytest.fixture
+def journal(tmp_path):
+    saldo_path = tmp_path / "saldo.json"
+    saldo_path.write_text(json.dumps({"a": 10, "b": 5}))
+    journal = SaldoJournal(str(saldo_path), str(tmp_path / "saldo.journal"), str(tmp_path / "saldo.snapshot.json"),
+                           compact_interval=3600)
+    yield journal
+    journal.close()
+
+
+def read(journal):
+    with open(journal.saldo_path) as f:
+        return json.load(f)
+
+
+def test_compact_rebases_on_bot_rewrite(journal):
+    journal.apply("a", 1)
+    # O bot debita b depois da última conferência do painel
+    with open(journal.saldo_path, "w") as f:
+        json.dump({"a": 10, "b": 0}, f)
+
+    journal.compact()
+
+    assert read(journal) == {"a": 11.0, "b": 0.0}
+    assert journal.rebases == 1
+
+
+def test_compact_retries_when_bot_writes_during_export(journal, monkeypatch):
+    journal.apply("a", 1)
+    original_dumps = storage.json_codec.dumps
+    raced = []
+
+    def dumps_and_race(document, **kwargs):
+        payload = original_dumps(document, **kwargs)
+        if not raced:
+            raced.append(True)
+            with open(journal.saldo_path, "w") as f:
+                json.dump({"a": 10, "b": 0, "c": 3}, f)
+        return payload
+
+    monkeypatch.setattr(storage.json_codec, "dumps", dumps_and_race)
+    journal.compact()
+
+    assert read(journal) == {"a": 11.0, "b": 0.0, "c": 3.0}
+    assert journal.snapshot() == {"a": 11.0, "b": 0.0, "c": 3.0}
+
+
+def test_balances_is_a_detached_copy(journal):
+    balances = journal.balances()
+    journal.apply("c", 3)
+    journal.apply("a", 1)
+
+    assert balances == {"a": 10.0, "b": 5.0}
+    assert journal.balances()["c"] == 3.0
+
+
+def test_saldo_json_is_exported_within_compact_interval(tmp_path):
+    saldo_path = tmp_path / "saldo.json"
+    saldo_path.write_text(json.dumps({"a": 10}))
+    journal = SaldoJournal(str(saldo_path), str(tmp_path / "saldo.journal"), str(tmp_path / "saldo.snapshot.json"),
+                           compact_interval=0.2)
+    compactions = journal.compactions
+    try:
+        started = time.monotonic()
+        for _ in range(20):
+            journal.apply("a", 1)
+        while journal.compactions == compactions and time.monotonic() - started < 5:
+            time.sleep(0.01)
+        elapsed = time.monotonic() - started
+        time.sleep(0.3)
+
+        assert read(journal) == {"a": 30.0}
+        # O prazo conta da primeira movimentação pendente; a margem cobre a gravação
+        assert elapsed < 0.2 + 0.5
+        # A rajada sai em uma exportação só
+        assert journal.compactions - compactions == 1
+    finally:
+        journal.close()
@@ -0,0 +1,138 @@
+import asyncio
+import os
+import time
+
+import httpx
+import pytest
+
+# Cada fsync (e cada stat de DataBaseJson) demora isso durante o teste (disco lento)
+SLOW_FSYNC_S = 0.15
+SLOW_STAT_S = 0.15
+
+READ_ROUTES = [
+    "/api/blacklist",
+    "/api/coupons",
+    "/api/webhooks",
+    "/api/webhooks/stats",
+    "/api/webhooks/dead-letter",
+    "/api/ranking",
+    "/api/ranking/leitor",
+    "/api/logs/actions",
+    "/api/system/config",
+    "/api/system/metrics",
+    "/api/config/bot",
+    "/api/config/cargos",
+    "/api/config/payments",
+    "/api/config/ticket",
+    "/api/bot/status",
+    "/api/gratian/config",
+]
+
+
+class LagProbe:
+    """Mede quanto o event loop atrasa um sleep curto enquanto roda"""
+
+    def __init__(self):
+        self.lags = []
+        self._done = asyncio.Event()
+        self._task = None
+
+    async def _tick(self):
+        while not self._done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            self.lags.append(time.perf_counter() - started - 0.005)
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._tick())
+
+    async def stop(self):
+        self._done.set()
+        await self._task
+        return max(self.lags)
+
+
+@pytest.mark.parametrize("path", READ_ROUTES)
+def test_reads_do_not_block_event_loop(server, monkeypatch, path):
+    real_stat = os.stat
+
+    def slow_stat(target, *args, **kwargs):
+        if "DataBaseJson" in os.fspath(target):
+            time.sleep(SLOW_STAT_S)
+        return real_stat(target, *args, **kwargs)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://painel") as client:
+            await client.post("/api/saldo/add", json={"user_id": "leitor", "valor": 1})
+            await client.get(path)
+            monkeypatch.setattr(os, "stat", slow_stat)
+            probe = LagProbe()
+            probe.start()
+            responses = await asyncio.gather(*(client.get(path) for _ in range(4)))
+            lag = await probe.stop()
+            monkeypatch.setattr(os, "stat", real_stat)
+        return responses, lag
+
+    responses, lag = asyncio.run(scenario())
+
+    assert all(r.status_code == 200 for r in responses), [r.text for r in responses]
+    # No event loop, cada leitura travaria o loop por SLOW_STAT_S (e em sequência)
+    assert lag < SLOW_STAT_S, f"{path}: lag máximo {lag * 1000:.1f}ms"
+
+
+def test_writes_do_not_block_event_loop(server, monkeypatch):
+    real_fsync = os.fsync
+
+    def slow_fsync(fd):
+        time.sleep(SLOW_FSYNC_S)
+        real_fsync(fd)
+
+    monkeypatch.setattr(os, "fsync", slow_fsync)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://painel") as client:
+            # Primeira requisição de cada rota (validação, serialização) fora da medição
+            await client.post("/api/config/payments", json={"mp_token": "aquecimento"})
+            await client.post("/api/blacklist", json={"user_id": "aquecimento", "motivo": "teste"})
+            await client.post("/api/saldo/add", json={"user_id": "aquecimento", "valor": 1})
+            probe = LagProbe()
+            probe.start()
+            requests = []
+            for i in range(5):
+                requests.append(client.post("/api/config/payments", json={"mp_token": f"token-{i}"}))
+                requests.append(client.post("/api/blacklist", json={"user_id": f"u{i}", "motivo": "teste"}))
+                requests.append(client.post("/api/saldo/add", json={"user_id": f"u{i}", "valor": 5}))
+            responses = await asyncio.gather(*requests)
+            lag = await probe.stop()
+        return responses, lag
+
+    responses, lag = asyncio.run(scenario())
+
+    assert all(r.status_code == 200 for r in responses)
+    # Com as gravações no event loop cada fsync o travaria por SLOW_FSYNC_S (e em
+    # sequência); a margem cobre o agendamento das threads com uma CPU só
+    assert lag < SLOW_FSYNC_S, f"lag máximo {lag * 1000:.1f}ms"
+    assert server.read_json_view("./DataBaseJson/config.json")["mp_token"].startswith("token-")
+
+
+def test_action_logs_include_queued_entries_without_flushing(server, monkeypatch):
+    server.action_log_pipeline.flush()
+    monkeypatch.setattr(server.action_log_pipeline, "flush_interval", 60.0)
+    batches = server.action_log_pipeline.batches
+    server.log_action_sync("teste_fila", "fila", {"n": 1})
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://painel") as client:
+            return await client.get("/api/logs/actions", params={"user_id": "fila"})
+
+    response = asyncio.run(scenario())
+
+    assert response.status_code == 200
+    assert [log["action"] for log in response.json()["logs"]] == ["teste_fila"]
+    # A consulta não forçou a gravação do lote
+    assert server.action_log_pipeline.batches == batches
+    assert len(server.action_log_pipeline.pending()) == 1
+    server.action_log_pipeline.flush()
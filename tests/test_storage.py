@@ -0,0 +1,32 @@
+import json
+import os
+
+import pytest
+
+from storage import StorageWriter, VersionConflict
+
+
+def test_write_now_checks_version_right_before_rename(tmp_path, monkeypatch):
+    path = str(tmp_path / "doc.json")
+    writer = StorageWriter()
+    writer.write_now(path, {"v": 1})
+    version = writer.version(path)
+
+    # O bot reescreve o arquivo enquanto o temporário está sendo gravado
+    import storage
+    original_dumps = storage.json_codec.dumps
+
+    def dumps_and_race(document, **kwargs):
+        payload = original_dumps(document, **kwargs)
+        with open(path, "w") as f:
+            json.dump({"v": "bot"}, f)
+        return payload
+
+    monkeypatch.setattr(storage.json_codec, "dumps", dumps_and_race)
+    with pytest.raises(VersionConflict):
+        writer.write_now(path, {"v": 2}, expected_version=version)
+
+    with open(path) as f:
+        assert json.load(f) == {"v": "bot"}
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".tmp")] == []
+    assert writer.conflicts == 1
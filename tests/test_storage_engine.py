@@ -0,0 +1,114 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from storage_engine import SqliteStorageEngine, StorageEngine
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+
+
+def write(path, document):
+    with open(path, "w") as f:
+        json.dump(document, f)
+
+
+def read(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    data = tmp_path / "DataBaseJson"
+    data.mkdir()
+    write(data / "saldo.json", {"a": 10, "b": 5})
+    write(data / "coupons.json", {"coupons": [
+        {"codigo": "X", "valor": 1, "usos_atual": 0, "usos_maximos": 10, "ativo": True}
+    ]})
+    return data
+
+
+def open_engine(data_dir):
+    # Exportação só quando o teste pede
+    return SqliteStorageEngine(str(data_dir / "painel.db"), data_dir=str(data_dir), export_delay_ms=600_000)
+
+
+def use_coupon(coupon):
+    coupon["usos_atual"] += 1
+
+
+def test_bot_edit_keeps_dirty_panel_changes(data_dir):
+    engine = open_engine(data_dir)
+    engine.adjust_saldo("a", 1)
+    engine.modify_coupon("X", use_coupon)
+
+    # O bot reescreve os arquivos antes da exportação do painel
+    write(data_dir / "saldo.json", {"a": 10, "b": 0, "c": 2})
+    write(data_dir / "coupons.json", {"coupons": [
+        {"codigo": "X", "valor": 1, "usos_atual": 3, "usos_maximos": 10, "ativo": True},
+        {"codigo": "Y", "valor": 2, "usos_atual": 0, "usos_maximos": 1, "ativo": True}
+    ]})
+
+    assert engine.get_saldos() == {"a": 11.0, "b": 0.0, "c": 2.0}
+    assert engine.get_coupon("X")["usos_atual"] == 4
+    assert engine.get_coupon("Y") is not None
+
+    engine.export_dirty()
+    assert read(data_dir / "saldo.json") == {"a": 11.0, "b": 0.0, "c": 2.0}
+    assert [c["usos_atual"] for c in read(data_dir / "coupons.json")["coupons"]] == [4, 0]
+
+    # Exportado: uma nova edição do bot não reaplica nada de novo
+    write(data_dir / "saldo.json", {"a": 7})
+    assert engine.get_saldos() == {"a": 7.0}
+    engine.close()
+
+
+def test_pending_changes_survive_restart(data_dir):
+    engine = open_engine(data_dir)
+    engine.adjust_saldo("b", -5)
+    # Painel cai antes de exportar
+    engine._export_timer.cancel()
+    engine._conn.close()
+
+    write(data_dir / "saldo.json", {"a": 20, "b": 5})
+    engine = open_engine(data_dir)
+    assert engine.get_saldos() == {"a": 20.0, "b": 0.0}
+    engine.close()
+    assert read(data_dir / "saldo.json") == {"a": 20.0, "b": 0.0}
+
+
+def test_incomplete_engine_fails_on_instantiation():
+    class PartialEngine(StorageEngine):
+        def get_saldos(self):
+            return {}
+
+    with pytest.raises(TypeError):
+        PartialEngine()
+
+
+def run_cli(data_dir, *args):
+    subprocess.run(
+        [sys.executable, os.path.join(BACKEND_DIR, "storage_engine.py"), *args,
+         "--db", str(data_dir / "cli.db"), "--dir", str(data_dir)],
+        check=True, capture_output=True, cwd=str(data_dir.parent)
+    )
+
+
+def test_cli_import_only_requested_tables(data_dir):
+    run_cli(data_dir, "import", "--tables", "coupons")
+
+    with sqlite3.connect(str(data_dir / "cli.db")) as conn:
+        assert conn.execute("SELECT codigo FROM coupons").fetchall() == [("X",)]
+        assert conn.execute("SELECT COUNT(*) FROM saldo").fetchone() == (0,)
+
+
+def test_cli_export_on_empty_db_does_not_import_first(data_dir):
+    run_cli(data_dir, "export", "--tables", "coupons")
+
+    # Banco vazio: exporta a tabela vazia, sem antes importar os arquivos
+    assert read(data_dir / "coupons.json") == {"coupons": []}
+    assert read(data_dir / "saldo.json") == {"a": 10, "b": 5}
@@ -0,0 +1,94 @@
+import asyncio
+
+import httpx
+
+from webhook_dispatcher import WebhookDispatcher
+
+
+def run_dispatcher(tmp_path, client, url, seconds=0.3):
+    async def scenario():
+        dispatcher = WebhookDispatcher(str(tmp_path / "outbox.db"), lambda: client, backoff_base=60)
+        dispatcher.start()
+        dispatcher.enqueue([{"id": "w1", "url": url}], {"evento": "teste"})
+        await asyncio.sleep(seconds)
+        with dispatcher._lock:
+            outbox = dispatcher._conn.execute("SELECT tentativas, proxima, ultimo_erro FROM outbox").fetchall()
+        dead = dispatcher.dead_letters()
+        stats = dispatcher.webhook_stats()
+        await dispatcher.aclose()
+        return outbox, dead, stats
+
+    return asyncio.run(scenario())
+
+
+def test_invalid_url_goes_to_dead_letter(tmp_path):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200)))
+    outbox, dead, stats = run_dispatcher(tmp_path, client, "http://[::1")
+
+    assert outbox == []
+    assert len(dead) == 1 and dead[0]["tentativas"] == 1
+    assert "InvalidURL" in dead[0]["ultimo_erro"]
+    assert stats["w1"]["falhas"] == 1
+
+
+def test_unexpected_error_counts_as_attempt(tmp_path):
+    class BrokenClient:
+        calls = 0
+
+        async def post(self, *args, **kwargs):
+            BrokenClient.calls += 1
+            raise RuntimeError("boom")
+
+    outbox, dead, _ = run_dispatcher(tmp_path, BrokenClient(), "http://example.invalid/hook")
+
+    assert dead == []
+    assert len(outbox) == 1
+    attempts, _, error = outbox[0]
+    assert attempts == 1 and "RuntimeError" in error
+    # Com backoff, a linha não é reclamada de novo em loop
+    assert BrokenClient.calls == 1
+
+
+def test_saturated_endpoint_does_not_block_others(tmp_path):
+    class Client:
+        delivered = []
+
+        def __init__(self):
+            self.release = asyncio.Event()
+
+        async def post(self, url, **kwargs):
+            if "lento" in url:
+                await self.release.wait()
+            Client.delivered.append(url)
+            return httpx.Response(200)
+
+    async def scenario():
+        client = Client()
+        dispatcher = WebhookDispatcher(str(tmp_path / "outbox.db"), lambda: client,
+                                       max_concurrency=4, endpoint_concurrency=1)
+        # Rajada antiga para o endpoint lento, maior que qualquer janela fixa
+        dispatcher.enqueue([{"id": "lento", "url": "http://lento.invalid/hook"}] * 500, {"evento": "rajada"})
+        dispatcher.enqueue([{"id": "ok", "url": "http://ok.invalid/hook"}], {"evento": "teste"})
+        dispatcher.start()
+        await asyncio.sleep(0.3)
+        stats = dispatcher.webhook_stats()
+        inflight = len(dispatcher._inflight)
+        client.release.set()
+        await dispatcher.aclose()
+        return stats, inflight
+
+    stats, inflight = asyncio.run(scenario())
+
+    assert Client.delivered == ["http://ok.invalid/hook"]
+    assert stats["ok"]["entregues"] == 1 and stats["ok"]["pendentes"] == 0
+    assert stats["lento"]["pendentes"] == 500
+    # O endpoint lento segue limitado a endpoint_concurrency
+    assert inflight == 1
+
+
+def test_delivery_stats_use_utc_timestamps(tmp_path):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(204)))
+    outbox, dead, stats = run_dispatcher(tmp_path, client, "http://example.invalid/hook")
+
+    assert outbox == [] and dead == []
+    assert stats["w1"]["ultima_entrega"].endswith("+00:00")
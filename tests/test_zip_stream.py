@@ -0,0 +1,110 @@
+import os
+import time
+import tracemalloc
+import zipfile
+
+import pytest
+
+from zip_stream import PARALLEL_MEMBER_LIMIT, stream_zip, write_zip
+
+MIB = 1024 * 1024
+# Pico de memória aceito, independente do tamanho do projeto
+PEAK_LIMIT = 4 * MIB
+
+
+@pytest.fixture(scope="module")
+def project(tmp_path_factory):
+    root = tmp_path_factory.mktemp("projeto")
+    big = root / "DataBaseJson" / "historico.json"
+    big.parent.mkdir()
+    block = os.urandom(MIB)
+    with open(big, "wb") as f:
+        # Maior que o limite dos membros comprimidos em memória: vai em streaming
+        for _ in range(PARALLEL_MEMBER_LIMIT // MIB + 8):
+            f.write(block)
+    for i in range(20):
+        (root / f"arquivo{i}.js").write_text("console.log('ok');\n" * 500)
+    files = [(str(path.relative_to(root)), str(path)) for path in sorted(root.rglob("*")) if path.is_file()]
+    return files, big.stat().st_size
+
+
+def measure_peak(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def check_zip(path, files, big_size):
+    with zipfile.ZipFile(path) as archive:
+        assert archive.testzip() is None
+        assert sorted(archive.namelist()) == sorted([name for name, _ in files] + ["INSTALL.md"])
+        assert archive.getinfo("DataBaseJson/historico.json").file_size == big_size
+
+
+def test_stream_zip_peak_memory_is_flat(project, tmp_path):
+    files, big_size = project
+    output = tmp_path / "stream.zip"
+
+    def consume():
+        with open(output, "wb") as f:
+            for chunk in stream_zip(files, [("INSTALL.md", "leia-me")]):
+                f.write(chunk)
+
+    peak = measure_peak(consume)
+    assert peak < PEAK_LIMIT, f"pico de {peak / MIB:.1f} MiB"
+    check_zip(output, files, big_size)
+
+
+def test_write_zip_peak_memory_is_flat(project, tmp_path):
+    files, big_size = project
+    output = tmp_path / "write.zip"
+
+    peak = measure_peak(lambda: write_zip(str(output), files, [("INSTALL.md", "leia-me")]))
+    assert peak < PEAK_LIMIT, f"pico de {peak / MIB:.1f} MiB"
+    check_zip(output, files, big_size)
+
+
+def test_parallel_window_is_bounded_by_bytes(tmp_path):
+    # Membros de 1 MiB abaixo do limite paralelo: sem orçamento em bytes, workers * 2
+    # deles ficariam em memória (crus e comprimidos) ao mesmo tempo
+    root = tmp_path / "medios"
+    root.mkdir()
+    for i in range(24):
+        (root / f"medio{i}.bin").write_bytes(os.urandom(MIB))
+    files = [(path.name, str(path)) for path in sorted(root.iterdir())]
+    budget = 3 * MIB
+    output = tmp_path / "medios.zip"
+
+    def consume():
+        with open(output, "wb") as f:
+            for index, chunk in enumerate(stream_zip(files, workers=8, inflight_bytes=budget)):
+                if index == 0:
+                    # Consumidor lento: o pool termina tudo o que a janela deixar à frente
+                    time.sleep(0.5)
+                f.write(chunk)
+
+    peak = measure_peak(consume)
+    # Orçamento cru + o mesmo tanto comprimido, com folga para o buffer do writer
+    assert peak < 2 * budget + MIB, f"pico de {peak / MIB:.1f} MiB"
+    with zipfile.ZipFile(output) as archive:
+        assert archive.testzip() is None
+        assert sorted(archive.namelist()) == sorted(name for name, _ in files)
+
+
+def test_member_larger_than_budget_is_streamed(tmp_path):
+    path = tmp_path / "grande.bin"
+    path.write_bytes(os.urandom(2 * MIB))
+    output = tmp_path / "grande.zip"
+
+    def consume():
+        with open(output, "wb") as f:
+            for chunk in stream_zip([("grande.bin", str(path))], workers=4, inflight_bytes=MIB):
+                f.write(chunk)
+
+    peak = measure_peak(consume)
+    assert peak < MIB, f"pico de {peak / MIB:.1f} MiB"
+    with zipfile.ZipFile(output) as archive:
+        assert archive.read("grande.bin") == path.read_bytes()